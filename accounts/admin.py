@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .models import UserAddress, UserBankAccount
+from .models import ApiToken, UserAddress, UserBankAccount
 
 # Register your models here.
 admin.site.register(UserBankAccount)
 admin.site.register(UserAddress)
+admin.site.register(ApiToken)
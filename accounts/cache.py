@@ -0,0 +1,105 @@
+"""Cross-request cache of each user's ``UserBankAccount`` and ``UserAddress``.
+
+Rows are cached in the default Django cache under the user's id and
+attached to ``request.user`` by ``AccountCacheMiddleware``. After that,
+``request.user.account`` and ``request.user.address`` are served without a
+query for the rest of the request. Entries are dropped when the rows are
+saved or deleted (see ``accounts.signals``) and when the ledger posts to an
+account.
+
+Each entry is stored with the version its row was read under, and
+``invalidate`` gives the key a new version besides deleting it. A request
+that read the row before a change committed, and writes it back after the
+invalidation ran, therefore leaves an entry that later lookups treat as a
+miss instead of serving the old balance until it expires.
+"""
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+ACCOUNT_CACHE_TIMEOUT = 300
+# Versions outlive every entry written under the one before them.
+VERSION_TIMEOUT = 2 * ACCOUNT_CACHE_TIMEOUT
+# Cached for users without the row (e.g. staff) so they do not query every time.
+_MISSING = 'missing'
+
+_RELATIONS = {
+    'account': User.account,
+    'address': User.address,
+}
+
+
+def cache_key(kind, user_id):
+    return f'accounts:{kind}:{user_id}'
+
+
+def _version_key(key):
+    return f'{key}:version'
+
+
+def _lookup_keys(keys):
+    return [*keys, *map(_version_key, keys)]
+
+
+def _cached(found, key):
+    """Return ``(version, obj)`` for ``key`` from a ``get_many`` result; ``obj`` is ``None`` on a miss."""
+    version = found.get(_version_key(key))
+    entry = found.get(key)
+    if isinstance(entry, tuple) and entry[0] == version:
+        return version, entry[1]
+    return version, None
+
+
+def _uncached_keys(user, kinds):
+    return {cache_key(kind, user.pk): kind for kind in kinds if not _RELATIONS[kind].related.is_cached(user)}
+
+
+def _attach(user, kind, obj):
+    # Link both directions so that obj.user does not query either.
+    related = _RELATIONS[kind].related
+    related.field.set_cached_value(obj, user)
+    related.set_cached_value(user, obj)
+
+
+def prime(user, kinds=('account', 'address')):
+    """Attach the cached rows of ``kinds`` to ``user``, loading and caching misses."""
+    keys = _uncached_keys(user, kinds)
+    if not keys:
+        return
+    found = cache.get_many(_lookup_keys(keys))
+    for key, kind in keys.items():
+        version, obj = _cached(found, key)
+        if obj == _MISSING:
+            continue
+        if obj is None:
+            obj = _RELATIONS[kind].related.related_model.objects.filter(user_id=user.pk).first()
+            cache.set(key, (version, _MISSING if obj is None else obj), ACCOUNT_CACHE_TIMEOUT)
+            if obj is None:
+                continue
+        _attach(user, kind, obj)
+
+
+async def aprime(user, kinds=('account', 'address')):
+    """Async version of :func:`prime`."""
+    keys = _uncached_keys(user, kinds)
+    if not keys:
+        return
+    found = await cache.aget_many(_lookup_keys(keys))
+    for key, kind in keys.items():
+        version, obj = _cached(found, key)
+        if obj == _MISSING:
+            continue
+        if obj is None:
+            obj = await _RELATIONS[kind].related.related_model.objects.filter(user_id=user.pk).afirst()
+            await cache.aset(key, (version, _MISSING if obj is None else obj), ACCOUNT_CACHE_TIMEOUT)
+            if obj is None:
+                continue
+        _attach(user, kind, obj)
+
+
+def invalidate(user_ids, kinds=('account', 'address')):
+    keys = [cache_key(kind, user_id) for user_id in user_ids for kind in kinds]
+    version = uuid.uuid4().hex
+    cache.set_many({_version_key(key): version for key in keys}, VERSION_TIMEOUT)
+    cache.delete_many(keys)
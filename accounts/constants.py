@@ -1,2 +1,4 @@
+SAVINGS = 'Savings'
+
 ACCOUNT_TYPE = (('Savings', 'Savings'), ('Current', 'Current')  )
 GENDER_TYPE = (('Male','Male'),('Female','Female'))
\ No newline at end of file
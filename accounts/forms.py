@@ -4,6 +4,7 @@ from django.contrib.auth.models import User
 
 from .constants import ACCOUNT_TYPE, GENDER_TYPE
 from .models import UserAddress, UserBankAccount
+from .numbers import allocate_account_number
 
 
 class RegistrationForm(UserCreationForm):
@@ -51,7 +52,7 @@ class RegistrationForm(UserCreationForm):
             country = self.cleaned_data.get('country')
             zip_code = self.cleaned_data.get('zip_code')
             address = self.cleaned_data.get('address')
-            account_number = 10000+user.id
+            account_number = allocate_account_number()
             
             UserAddress.objects.create(user=user,address=address,city=city,state=state,country=country,zip_code=zip_code)
             UserBankAccount.objects.create(user=user,account_type=account_type,birthday=birthday,account_number=account_number,gender = gender)
@@ -0,0 +1,59 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from accounts.bulk_import import import_accounts, read_records, setup_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Import customers from a CSV (with a header row) or JSON Lines file, '
+        'creating the same user, address and account rows as registration '
+        'and queueing a welcome email for each.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Customers per transaction.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Password hashing processes.')
+        parser.add_argument('--skip-existing', action='store_true', help='Skip usernames that already exist.')
+        parser.add_argument('--no-email', action='store_true', help='Do not queue welcome emails.')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'] or 1)
+        hash_batch_size = max(1, options['chunk_size'] // (4 * workers))
+        created = skipped = 0
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fileobj, \
+                    ProcessPoolExecutor(workers, initializer=setup_worker) as pool:
+                chunks = import_accounts(
+                    read_records(fileobj, options['path']), pool,
+                    chunk_size=options['chunk_size'], hash_batch_size=hash_batch_size,
+                    skip_existing=options['skip_existing'], send_email=not options['no_email'],
+                )
+                for number, stats in enumerate(chunks, start=1):
+                    created += stats['created']
+                    skipped += stats['skipped']
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"chunk {number}: {stats['created']} created, {stats['skipped']} skipped, "
+                        f"waited {stats['hash_wait_seconds']:.2f}s for hashes, "
+                        f"inserted in {stats['insert_seconds']:.2f}s; "
+                        f"{created + skipped} done, {(created + skipped) / elapsed:.0f} customers/s"
+                    )
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Stopped after {created + skipped} customers: {exc}')
+        except IntegrityError as exc:
+            # E.g. a customer registered with one of the usernames meanwhile;
+            # the chunk was rolled back.
+            raise CommandError(f'Stopped after {created + skipped} customers, a chunk conflicted: {exc}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} customers ({skipped} skipped) in {elapsed:.1f}s '
+            f'({created / elapsed if elapsed else 0:.0f} customers/s)'
+        ))
@@ -0,0 +1,31 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .cache import aprime, prime
+
+
+class AccountCacheMiddleware:
+    """Serve ``request.user.account`` and ``request.user.address`` from the cache."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.user.is_authenticated:
+            prime(request.user)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        # Replace the lazy object, which would load the user a second time
+        # (synchronously) on first access.
+        request.user = user
+        if user.is_authenticated:
+            await aprime(user)
+        return await self.get_response(request)
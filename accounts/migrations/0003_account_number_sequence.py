@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    # Mirrors accounts.numbers.SEQUENCE_NAME and FIRST_BODY.
+    AccountNumberSequence = apps.get_model('accounts', 'AccountNumberSequence')
+    AccountNumberSequence.objects.using(schema_editor.connection.alias).get_or_create(name='account_number', defaults={'next_body': 10 ** 8})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_userbankaccount_is_bankrupt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_body', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='userbankaccount',
+            name='account_number',
+            field=models.CharField(max_length=16, unique=True),
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
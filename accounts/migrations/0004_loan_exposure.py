@@ -0,0 +1,28 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_account_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='active_loan_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='loans_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='outstanding_loan_principal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+    ]
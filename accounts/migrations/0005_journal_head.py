@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_loan_exposure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='journal_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='userbankaccount',
+            name='journal_sequence',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -8,12 +8,20 @@ from .constants import ACCOUNT_TYPE, GENDER_TYPE
 class UserBankAccount(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE,related_name='account')
     account_type = models.CharField(max_length=100,choices=ACCOUNT_TYPE,)
-    account_number = models.CharField(max_length=100,unique=True)
+    account_number = models.CharField(max_length=16,unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     birthday = models.DateField(null=True,blank=True)
     gender = models.CharField(max_length=100,choices=GENDER_TYPE)
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     is_bankrupt = models.BooleanField(default=False,blank=True,null=True)
+    # Approved, unpaid loans. Maintained by transactions.ledger and rebuilt
+    # by `manage.py reconcile_loan_exposure`.
+    active_loan_count = models.PositiveIntegerField(default=0)
+    outstanding_loan_principal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    loans_updated_at = models.DateTimeField(null=True,blank=True)
+    # Number and hash of the latest transactions.JournalEntry of the account.
+    journal_sequence = models.PositiveBigIntegerField(default=0)
+    journal_hash = models.CharField(max_length=64,blank=True,default='')
     
     def __str__(self):
         return self.user.username+"-"+self.account_number
@@ -28,4 +36,23 @@ class UserAddress(models.Model):
     
     def __str__(self):
         return self.user.username
-    
\ No newline at end of file
+    
+
+class AccountNumberSequence(models.Model):
+    """Next unissued account number body, advanced in blocks by ``accounts.numbers``."""
+    name = models.CharField(max_length=50,unique=True)
+    next_body = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.name}: {self.next_body}'
+
+
+class ApiToken(models.Model):
+    """A JSON API credential. Only the SHA-256 of the key is stored, see ``accounts.tokens``."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,related_name='api_tokens')
+    name = models.CharField(max_length=100,blank=True)
+    key_hash = models.CharField(max_length=64,unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user.username}: {self.name}'
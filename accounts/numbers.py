@@ -0,0 +1,103 @@
+"""Account number allocation.
+
+New account numbers are ten digits: a nine digit body followed by a Luhn
+check digit, so typos are caught before any lookup. Bodies come from the
+``AccountNumberSequence`` row, which each process advances by a whole
+block at a time and then hands out from memory. Registrations and
+imports therefore do not contend on the sequence row, at the price of
+gaps when a process exits with part of a block unused.
+
+Numbers issued before this scheme (``10000 + user.id``) are shorter and
+carry no check digit; they stay valid.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import AccountNumberSequence
+
+SEQUENCE_NAME = 'account_number'
+BODY_DIGITS = 9
+NUMBER_LENGTH = BODY_DIGITS + 1
+# Nine digit bodies, so new numbers never collide with the legacy ones.
+FIRST_BODY = 10 ** (BODY_DIGITS - 1)
+
+
+def luhn_digit(body):
+    total = 0
+    for position, digit in enumerate(reversed(body)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str(-total % 10)
+
+
+def format_account_number(body):
+    body = str(body).zfill(BODY_DIGITS)
+    return body + luhn_digit(body)
+
+
+def is_valid_account_number(value):
+    """Whether ``value`` can be an account number, without touching the database."""
+    if not value.isdigit():
+        return False
+    if len(value) < NUMBER_LENGTH:
+        return True
+    return len(value) == NUMBER_LENGTH and luhn_digit(value[:-1]) == value[-1]
+
+
+def reserve_block(size):
+    """Advance the sequence by ``size`` and return the reserved ``range`` of bodies.
+
+    Call this outside of any transaction that may roll back: a rolled back
+    reservation would be handed out again to the next process.
+    """
+    with transaction.atomic():
+        # Update before reading, so the row is write-locked before we see it.
+        updated = AccountNumberSequence.objects.filter(name=SEQUENCE_NAME).update(next_body=F('next_body') + size)
+        if not updated:
+            AccountNumberSequence.objects.get_or_create(name=SEQUENCE_NAME, defaults={'next_body': FIRST_BODY})
+            AccountNumberSequence.objects.filter(name=SEQUENCE_NAME).update(next_body=F('next_body') + size)
+        end = AccountNumberSequence.objects.values_list('next_body', flat=True).get(name=SEQUENCE_NAME)
+    return range(end - size, end)
+
+
+class AccountNumberAllocator:
+    """Hands out account numbers from blocks reserved for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._bodies = iter(())
+
+    def allocate(self, count=1):
+        block_size = settings.ACCOUNT_NUMBER_BLOCK_SIZE
+        numbers = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse its parent's block.
+                self._pid, self._bodies = os.getpid(), iter(())
+            while len(numbers) < count:
+                body = next(self._bodies, None)
+                if body is None:
+                    self._bodies = iter(reserve_block(max(block_size, count - len(numbers))))
+                    continue
+                numbers.append(format_account_number(body))
+        return numbers
+
+
+allocator = AccountNumberAllocator()
+
+
+def allocate_account_number():
+    return allocator.allocate()[0]
+
+
+def allocate_account_numbers(count):
+    return allocator.allocate(count)
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import UserAddress, UserBankAccount
+
+
+@receiver([post_save, post_delete], sender=UserBankAccount)
+def invalidate_account(sender, instance, **kwargs):
+    invalidate([instance.user_id], kinds=('account',))
+
+
+@receiver([post_save, post_delete], sender=UserAddress)
+def invalidate_address(sender, instance, **kwargs):
+    invalidate([instance.user_id], kinds=('address',))
@@ -1,3 +1,139 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import F
 from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+
+from . import cache as account_cache
+from .cache import invalidate, prime
+from .models import UserAddress, UserBankAccount
+
+PROFILE = {
+    'first_name': 'Alice', 'last_name': 'Rahman', 'email': 'alice@example.com',
+    'account_type': 'Savings', 'birthday': '2000-01-01', 'gender': 'Female', 'city': 'Dhaka',
+    'state': 'Dhaka', 'country': 'Bangladesh', 'zip_code': '1000', 'address': 'Road 1',
+}
+
+
+class AccountQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        UserAddress.objects.create(user=cls.user, address='Road 1', city='Dhaka', state='Dhaka',
+                                   country='Bangladesh', zip_code='1000')
+        UserBankAccount.objects.create(user=cls.user, account_type='Savings', account_number='90001',
+                                       gender='Female')
+
+    def test_anonymous_pages(self):
+        for name in ['login', 'register', 'home']:
+            with self.subTest(name=name):
+                self.assertQueryBudget(0, 'get', reverse(name))
+
+    def test_login(self):
+        self.assertQueryBudget(10, 'post', reverse('login'), {'username': 'alice', 'password': 'password'})
+
+    def test_register(self):
+        password = 'Xk2!pqzzLm'
+        data = dict(PROFILE, username='carol', email='carol@example.com', password1=password, password2=password)
+        # 4 of these reserve a block of account numbers, which most
+        # registrations skip.
+        self.assertQueryBudget(19, 'post', reverse('register'), data)
+
+    def test_profile(self):
+        self.client.force_login(self.user)
+        prime(User.objects.get(pk=self.user.pk))
+        self.assertQueryBudget(2, 'get', reverse('profile'))
+        self.assertQueryBudget(9, 'post', reverse('profile'), dict(PROFILE, username='alice'))
+
+    def test_change_password_page(self):
+        self.client.force_login(self.user)
+        prime(User.objects.get(pk=self.user.pk))
+        self.assertQueryBudget(2, 'get', reverse('change_password'))
+
+    def test_logout(self):
+        self.client.force_login(self.user)
+        prime(User.objects.get(pk=self.user.pk))
+        self.assertQueryBudget(4, 'get', reverse('logout'))
+
+
+class AccountCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.account = UserBankAccount.objects.create(user=cls.user, account_type='Savings',
+                                                     account_number='90001', gender='Female', balance=1000)
+
+    def setUp(self):
+        cache.clear()
+
+    def primed_account(self):
+        user = User.objects.get(pk=self.user.pk)
+        prime(user, kinds=('account',))
+        return user.account
+
+    def test_entries_are_reused_until_invalidated(self):
+        self.primed_account()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.primed_account().balance, 1000)
+        UserBankAccount.objects.filter(pk=self.account.pk).update(balance=1100)
+        invalidate([self.user.pk], kinds=('account',))
+        self.assertEqual(self.primed_account().balance, 1100)
+
+    def test_posting_between_the_read_and_the_write_does_not_stick(self):
+        real_set = cache.set
+
+        def post_then_set(*args, **kwargs):
+            # The row was read at 1000; a posting commits and invalidates
+            # before this request writes its copy back.
+            patcher.stop()
+            UserBankAccount.objects.filter(pk=self.account.pk).update(balance=F('balance') + 100)
+            invalidate([self.user.pk], kinds=('account',))
+            real_set(*args, **kwargs)
+
+        patcher = mock.patch.object(account_cache.cache, 'set', post_then_set)
+        patcher.start()
+        self.assertEqual(self.primed_account().balance, 1000)
+        self.assertEqual(self.primed_account().balance, 1100)
+
+
+class ImportAccountsTests(TestCase):
+    HEADER = 'username,email,account_type,gender,address,city,state,country,zip_code\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('taken', 'taken@example.com', 'password')
+
+    def import_file(self, usernames, **options):
+        rows = ''.join(
+            f'{username},{username}@example.com,Savings,Female,Road 1,Dhaka,Dhaka,Bangladesh,1000\n'
+            for username in usernames
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fileobj:
+            fileobj.write(self.HEADER + rows)
+        self.addCleanup(os.remove, fileobj.name)
+        call_command('import_accounts', fileobj.name, workers=1, chunk_size=2, no_email=True,
+                     stdout=StringIO(), **options)
+
+    def test_imports_every_customer(self):
+        self.import_file(['amin', 'bina', 'chad'])
+        self.assertEqual(UserBankAccount.objects.filter(user__username__in=['amin', 'bina', 'chad']).count(), 3)
+        self.assertEqual(UserAddress.objects.filter(user__username='chad').count(), 1)
+
+    def test_skip_existing_skips_repeated_and_taken_usernames(self):
+        # 'amin' repeats within a chunk and again in a later one.
+        self.import_file(['amin', 'amin', 'taken', 'bina', 'amin'], skip_existing=True)
+        self.assertEqual(sorted(UserBankAccount.objects.values_list('user__username', flat=True)), ['amin', 'bina'])
 
-# Create your tests here.
+    def test_repeated_username_stops_the_import(self):
+        with self.assertRaisesMessage(CommandError, 'amin appears more than once'):
+            self.import_file(['amin', 'bina', 'amin'])
+        with self.assertRaisesMessage(CommandError, 'Users already exist: taken'):
+            self.import_file(['carl', 'taken'])
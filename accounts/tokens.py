@@ -0,0 +1,34 @@
+"""Tokens for the JSON API.
+
+A client sends ``Authorization: Token <key>`` (``Bearer`` works too). The
+key is shown once, when it is created; the database keeps its SHA-256,
+so looking a token up is one query on a unique index.
+"""
+import hashlib
+import secrets
+
+from .models import ApiToken
+
+SCHEMES = ('token', 'bearer')
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_token(user, name=''):
+    """Create a token for ``user`` and return its key."""
+    key = secrets.token_urlsafe(32)
+    ApiToken.objects.create(user=user, name=name, key_hash=hash_key(key))
+    return key
+
+
+def user_for_header(header):
+    """Return the active user an ``Authorization`` header names, or ``None``."""
+    scheme, _, key = header.partition(' ')
+    if scheme.lower() not in SCHEMES or not key.strip():
+        return None
+    token = ApiToken.objects.select_related('user').filter(key_hash=hash_key(key.strip())).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
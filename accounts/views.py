@@ -2,28 +2,20 @@ from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView, PasswordChangeView
-from django.core.mail import EmailMessage
 from django.shortcuts import redirect, render
-from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import FormView
 
+from core.mail import queue_email
+
 from .forms import RegistrationForm, UserUpdateForm
 
 
 def send_confirm_email(user,subject,template_name):
-    mail_subject = subject
-    message = render_to_string(template_name, {
+    queue_email(user.email, subject, template_name, {
         'user': user,
     })
-    send_email = EmailMessage(
-        mail_subject,
-        message,
-        to=[user.email]
-    )
-    send_email.content_subtype = 'html'
-    send_email.send()
 
 
 class UserRegistrationView(FormView):
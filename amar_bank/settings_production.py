@@ -0,0 +1,22 @@
+"""
+Production settings for amar_bank.
+
+Use with DJANGO_SETTINGS_MODULE=amar_bank.settings_production. Everything
+not overridden here comes from amar_bank.settings.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import TEMPLATES, env
+
+DEBUG = False
+
+# Compile every template once per process instead of on every render.
+# APP_DIRS must be off when loaders are listed explicitly.
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+FRAGMENT_CACHE_TIMEOUT = env.int('FRAGMENT_CACHE_TIMEOUT', default=3600)
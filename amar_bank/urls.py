@@ -2,11 +2,12 @@
 from django.contrib import admin
 from django.urls import include, path
 
-from core.views import HomeView
+from core.views import HomeView, metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('',HomeView.as_view(),name='home'),
+    path('metrics/',metrics,name='metrics'),
     path('accounts/', include('accounts.urls')),
     path('transaction/',include('transactions.urls')),
 ]
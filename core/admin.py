@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import OutboundEmail
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['to', 'subject', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status']
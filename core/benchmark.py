@@ -0,0 +1,301 @@
+"""Seed data, request scenarios and runners for the benchmark commands.
+
+``seed_benchmark_data`` creates users the way ``RegistrationForm`` does,
+each with a history of transactions. ``run_benchmarks`` then replays the
+scenarios below against those users, either in process through the
+Django test client or over HTTP against a running server that uses the
+same database. ``loadtest`` uses :class:`HttpSession` too.
+"""
+import http.cookiejar
+import json
+import random
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserAddress, UserBankAccount
+from accounts.numbers import allocate_account_numbers
+from transactions.constants import DEPOSIT, LOAN, TRANSFER, WITHDRAWAL
+from transactions.journal import chain
+from transactions.models import DailyBalance, JournalEntry, Transaction
+
+
+def seed_users(count, transactions_per_user, prefix, password, seed=0, batch_size=1000):
+    """Create ``count`` users named ``<prefix><n>`` with their history.
+
+    Every user gets an address and a savings account with an allocated
+    number like in ``RegistrationForm.save``, then
+    ``transactions_per_user`` deposits and withdrawals, journalled like
+    ledger postings. The password is hashed once and shared, since hashing
+    dominates otherwise.
+    """
+    rng = random.Random(seed)
+    password_hash = make_password(password)
+    today = timezone.localdate()
+    numbers = allocate_account_numbers(count)
+    accounts = []
+    with transaction.atomic():
+        for n, number in enumerate(numbers):
+            username = f'{prefix}{n}'
+            user = User.objects.create(username=username, email=f'{username}@example.com',
+                                       first_name='Bench', last_name=str(n), password=password_hash)
+            UserAddress.objects.create(user=user, address='Road 1', city='Dhaka', state='Dhaka',
+                                       country='Bangladesh', zip_code='1000')
+            accounts.append(UserBankAccount.objects.create(
+                user=user, account_type='Savings', account_number=number, gender='Male',
+            ))
+
+        rows, summaries = [], []
+        for account in accounts:
+            balance = credits = debits = Decimal('0')
+            for i in range(transactions_per_user):
+                amount = Decimal(rng.randrange(100, 5000))
+                if i % 3 == 2 and amount <= balance:
+                    transaction_type, balance, debits = WITHDRAWAL, balance - amount, debits + amount
+                else:
+                    transaction_type, balance, credits = DEPOSIT, balance + amount, credits + amount
+                rows.append(Transaction(account=account, transaction_type=transaction_type, amount=amount,
+                                        balance_after_transaction=balance))
+            account.balance = balance
+            if transactions_per_user:
+                summaries.append(DailyBalance(account=account, date=today, opening_balance=Decimal('0'),
+                                              credits=credits, debits=debits,
+                                              transaction_count=transactions_per_user))
+        Transaction.objects.bulk_create(rows, batch_size=batch_size)
+        DailyBalance.objects.bulk_create(summaries, batch_size=batch_size)
+
+        postings = defaultdict(list)
+        for row in rows:
+            amount = -row.amount if row.transaction_type == WITHDRAWAL else row.amount
+            postings[row.account_id].append((row.pk, amount))
+        entries = []
+        for account in accounts:
+            journal = chain(account.pk, postings[account.pk], Decimal('0'))
+            if journal:
+                account.journal_sequence, account.journal_hash = journal[-1].sequence, journal[-1].hash
+            entries += journal
+        JournalEntry.objects.bulk_create(entries, batch_size=batch_size)
+        UserBankAccount.objects.bulk_update(accounts, ['balance', 'journal_sequence', 'journal_hash'],
+                                            batch_size=batch_size)
+    return accounts
+
+
+class Scenario:
+    """One kind of request and the status code that means it worked."""
+
+    def __init__(self, name, method, url_name, expected_status, data=None, authenticated=True):
+        self.name = name
+        self.method = method
+        self.url_name = url_name
+        self.expected_status = expected_status
+        self.data = data
+        self.authenticated = authenticated
+
+    @property
+    def path(self):
+        return reverse(self.url_name)
+
+    def payload(self, user, peer, password):
+        return self.data(user, peer, password) if self.data else None
+
+
+SCENARIOS = {scenario.name: scenario for scenario in [
+    Scenario('login', 'POST', 'login', 302, authenticated=False,
+             data=lambda user, peer, password: {'username': user.username, 'password': password}),
+    Scenario('deposit', 'POST', 'deposit_money', 302,
+             data=lambda user, peer, password: {'amount': '100', 'transaction_type': DEPOSIT}),
+    Scenario('withdraw', 'POST', 'withdraw_money', 302,
+             data=lambda user, peer, password: {'amount': '100', 'transaction_type': WITHDRAWAL}),
+    Scenario('transfer', 'POST', 'transfer_money', 302,
+             data=lambda user, peer, password: {'amount': '100', 'transaction_type': TRANSFER,
+                                                 'to_account_number': peer.account.account_number}),
+    Scenario('loan', 'POST', 'loan_request', 302,
+             data=lambda user, peer, password: {'amount': '100', 'transaction_type': LOAN}),
+    Scenario('report', 'GET', 'transaction_report', 200),
+]}
+
+
+class ClientSession:
+    """In-process session; query counts come from ``RequestMetricsMiddleware``."""
+
+    def __init__(self):
+        self.client = Client()
+
+    def login(self, user, password):
+        self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            response = self.client.post(path, data or {})
+        else:
+            response = self.client.get(path, data or {})
+        return response.status_code, response.wsgi_request._request_metrics['queries']
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """A cookie-keeping HTTP session against a running server.
+
+    Redirects are not followed so callers see the status the view returned.
+    Query counts are not known per request, see :func:`scrape_query_totals`.
+    """
+
+    def __init__(self, base_url, timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.jar), _NoRedirect)
+
+    def cookie(self, name):
+        return next((cookie.value for cookie in self.jar if cookie.name == name), None)
+
+    def csrf_token(self):
+        # Django rotates the token on login, so it is read from the jar each time.
+        if self.cookie('csrftoken') is None:
+            self.request('GET', reverse('login'))
+        return self.cookie('csrftoken') or ''
+
+    def login(self, user, password):
+        self.login_as(user.username, password)
+
+    def login_as(self, username, password):
+        status, _ = self.request('POST', reverse('login'), {'username': username, 'password': password})
+        if status != 302 or self.cookie('sessionid') is None:
+            raise ValueError(f'Could not log in to {self.base_url} as {username}')
+
+    def request(self, method, path, data=None):
+        url = self.base_url + path
+        headers = {'Referer': url}
+        body = None
+        if method == 'POST':
+            body = urllib.parse.urlencode({**(data or {}), 'csrfmiddlewaretoken': self.csrf_token()}).encode()
+        elif data:
+            url += '?' + urllib.parse.urlencode(data)
+        try:
+            with self.opener.open(urllib.request.Request(url, data=body, headers=headers), timeout=self.timeout) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code, None
+        except (urllib.error.URLError, OSError):
+            return None, None
+
+
+def scrape_query_totals(session, view):
+    """Return ``(requests, queries)`` for ``view`` from the ``/metrics/`` endpoint.
+
+    With several server processes this is whichever process answered. The
+    server has to accept this process's ``METRICS_TOKEN``.
+    """
+    request = urllib.request.Request(session.base_url + reverse('metrics'),
+                                     headers={'Authorization': f'Bearer {settings.METRICS_TOKEN}'})
+    with session.opener.open(request, timeout=session.timeout) as response:
+        text = response.read().decode()
+    totals = {}
+    for line in text.splitlines():
+        for name in ('amar_bank_requests_total', 'amar_bank_request_queries_total'):
+            if line.startswith(f'{name}{{view="{view}"}} '):
+                totals[name] = int(line.rsplit(' ', 1)[1])
+    return totals.get('amar_bank_requests_total', 0), totals.get('amar_bank_request_queries_total', 0)
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarise(outcomes, elapsed, queries=None):
+    """Throughput and latency figures for ``(milliseconds, ok)`` outcomes."""
+    timings = [ms for ms, ok in outcomes if ok]
+    return {
+        'requests': len(outcomes),
+        'errors': len(outcomes) - len(timings),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(timings) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(statistics.median(timings), 2) if timings else None,
+        'p90_ms': round(percentile(timings, 0.90), 2) if timings else None,
+        'p99_ms': round(percentile(timings, 0.99), 2) if timings else None,
+        'max_ms': round(max(timings), 2) if timings else None,
+        'queries_per_request': round(queries, 2) if queries is not None else None,
+    }
+
+
+def run_scenario(scenario, users, password, make_session, requests, concurrency=1, warmup=0):
+    """Send ``requests`` requests of ``scenario`` spread over ``users``.
+
+    Each worker gets its own session, logged in as one of ``users`` unless
+    the scenario itself logs in; transfers go to the next user.
+    """
+    workers = []
+    for n in range(concurrency):
+        user, peer = users[n % len(users)], users[(n + 1) % len(users)]
+        session = make_session()
+        if scenario.authenticated:
+            session.login(user, password)
+        workers.append((session, user, peer))
+
+    def send(i):
+        session, user, peer = workers[i % concurrency]
+        started = time.perf_counter()
+        status, queries = session.request(scenario.method, scenario.path, scenario.payload(user, peer, password))
+        return (time.perf_counter() - started) * 1000, status == scenario.expected_status, queries
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(send, range(warmup)))
+        started = time.perf_counter()
+        results = list(pool.map(send, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    counted = [queries for _, _, queries in results if queries is not None]
+    queries = sum(counted) / len(counted) if counted else None
+    return summarise([(ms, ok) for ms, ok, _ in results], elapsed, queries)
+
+
+def compare(results, baseline, threshold):
+    """Yield ``(scenario, message, regressed)`` for scenarios in both runs.
+
+    Throughput or p99 worse by more than ``threshold`` percent, or more
+    than half an extra query per request, counts as a regression. Counts
+    scraped over HTTP include the warm-up, hence the slack.
+    """
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or previous['p99_ms'] is None:
+            continue
+        regressed = []
+        if previous['rps'] and current['rps'] < previous['rps'] * (1 - threshold / 100):
+            regressed.append('rps')
+        if previous['p99_ms'] and current['p99_ms'] and current['p99_ms'] > previous['p99_ms'] * (1 + threshold / 100):
+            regressed.append('p99')
+        if (previous['queries_per_request'] is not None and current['queries_per_request'] is not None
+                and current['queries_per_request'] > previous['queries_per_request'] + 0.5):
+            regressed.append('queries')
+        message = (
+            f'rps {previous["rps"]} -> {current["rps"]}, '
+            f'p99 {previous["p99_ms"]} -> {current["p99_ms"]}ms, '
+            f'queries {previous["queries_per_request"]} -> {current["queries_per_request"]}'
+        )
+        yield name, message, regressed
+
+
+def load_results(path):
+    with open(path) as fileobj:
+        return json.load(fileobj)['scenarios']
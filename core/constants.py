@@ -0,0 +1,11 @@
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+EMAIL_STATUS = (
+    (PENDING, 'Pending'),
+    (SENDING, 'Sending'),
+    (SENT, 'Sent'),
+    (FAILED, 'Failed'),
+)
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def fragment_cache(request):
+    """Expose the ``{% cache %}`` timeout used by the core templates."""
+    return {'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT}
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """Let SQLite readers and a writer work concurrently.
+
+    busy_timeout matches the connection's ``timeout`` option. With
+    ``SQLITE_WAL``, file databases switch to WAL, which lets reads proceed
+    while a write is in progress, and synchronous=NORMAL, which is safe
+    with WAL and skips an fsync per commit. In-memory databases (the test
+    run's) have no journal file to switch.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    timeout = connection.settings_dict.get('OPTIONS', {}).get('timeout', 5)
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA busy_timeout={int(timeout * 1000)}')
+        if settings.SQLITE_WAL and not connection.is_in_memory_db():
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
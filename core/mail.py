@@ -0,0 +1,167 @@
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .constants import FAILED, PENDING, SENDING, SENT
+from .models import OutboundEmail
+
+
+def queue_email(to, subject, template_name, context):
+    """Render an email now and store it in the outbox for the mail worker."""
+    return OutboundEmail.objects.create(
+        to=to,
+        subject=subject,
+        body=render_to_string(template_name, context),
+    )
+
+
+async def aqueue_email(to, subject, template_name, context):
+    """Async version of :func:`queue_email`."""
+    return await OutboundEmail.objects.acreate(
+        to=to,
+        subject=subject,
+        body=render_to_string(template_name, context),
+    )
+
+
+def queue_emails(items, batch_size=500):
+    """Bulk version of :func:`queue_email` for ``(to, subject, template_name, context)`` items."""
+    return OutboundEmail.objects.bulk_create(
+        [
+            OutboundEmail(to=to, subject=subject, body=render_to_string(template_name, context))
+            for to, subject, template_name, context in items
+        ],
+        batch_size=batch_size,
+    )
+
+
+def claim_batch(limit, stale_after=timedelta(minutes=10)):
+    """Mark up to ``limit`` queued emails as ours and return them.
+
+    Rows left in ``SENDING`` by a worker that died are picked up again once
+    they are older than ``stale_after``.
+    """
+    now = timezone.now()
+    claimable = Q(status=PENDING) | Q(status=SENDING, claimed_at__lt=now - stale_after)
+    ids = list(
+        OutboundEmail.objects.filter(claimable)
+        .order_by('id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    OutboundEmail.objects.filter(claimable, id__in=ids).update(
+        status=SENDING, claim_token=token, claimed_at=now
+    )
+    return list(OutboundEmail.objects.filter(claim_token=token, status=SENDING).order_by('id'))
+
+
+def build_message(email):
+    message = EmailMessage(email.subject, email.body, to=[email.to])
+    message.content_subtype = email.content_subtype
+    return message
+
+
+def _error_text(exc):
+    return str(exc) or exc.__class__.__name__
+
+
+class MailDeliverer:
+    """Sends outbox rows over one open connection per worker thread.
+
+    The connection is opened on first use and kept across batches, so the
+    TLS handshake and login are paid once per thread instead of per email.
+    A batch that fails part way is retried message by message on a fresh
+    connection, which means messages sent before the failure may go out
+    twice; that is preferred over dropping receipts.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = get_connection(self.backend)
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _reset(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            with self._lock:
+                self._connections.remove(connection)
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _send_one(self, message):
+        try:
+            self._connection().send_messages([message])
+        except Exception as exc:
+            self._reset()
+            return _error_text(exc)
+        return None
+
+    def send_batch(self, emails):
+        """Send ``emails`` and return ``(errors, stats)``.
+
+        ``errors`` lines up with ``emails`` and holds ``None`` for every
+        message that was sent.
+        """
+        started = time.perf_counter()
+        messages = [build_message(email) for email in emails]
+        reconnects = 0
+        try:
+            self._connection().send_messages(messages)
+            errors = [None] * len(messages)
+        except Exception:
+            self._reset()
+            reconnects = 1
+            errors = [self._send_one(message) for message in messages]
+        failed = sum(error is not None for error in errors)
+        stats = {
+            'size': len(messages),
+            'sent': len(messages) - failed,
+            'failed': failed,
+            'reconnects': reconnects,
+            'seconds': time.perf_counter() - started,
+        }
+        return errors, stats
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def mark_sent(ids):
+    OutboundEmail.objects.filter(id__in=ids).update(
+        status=SENT, sent_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+    )
+
+
+def mark_failed(email, error, max_attempts):
+    status = FAILED if email.attempts + 1 >= max_attempts else PENDING
+    OutboundEmail.objects.filter(id=email.id).update(
+        status=status, attempts=F('attempts') + 1, last_error=error
+    )
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import HttpSession, summarise
+
+DEFAULT_PATHS = [
+    '/transaction/report/',
+    '/transaction/async/report/',
+    '/transaction/loans/',
+    '/transaction/async/loans/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Log in to one or more running servers and hit each path with '
+        'concurrent GETs, reporting requests per second and latency '
+        'percentiles. Run it against the same database served by e.g. '
+        '"gunicorn amar_bank.wsgi" and "uvicorn amar_bank.asgi:application" '
+        'to compare WSGI and ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_urls', nargs='+', metavar='base_url')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--path', dest='paths', action='append', help='Repeatable; defaults to the report and loan list pages.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=500, help='Requests per path and server.')
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        base_urls = [base_url.rstrip('/') for base_url in options['base_urls']]
+        results = {}
+        for base_url in base_urls:
+            session = HttpSession(base_url, options['timeout'])
+            try:
+                session.login_as(options['username'], options['password'])
+            except ValueError as exc:
+                raise CommandError(exc)
+            for path in paths:
+                results[base_url, path] = stats = self.run(session, path, options)
+                self.stdout.write(
+                    f'{base_url}{path}: {stats["rps"]:.1f} req/s, p50 {stats["p50_ms"]}ms, '
+                    f'p99 {stats["p99_ms"]}ms, max {stats["max_ms"]}ms, errors {stats["errors"]}'
+                )
+
+        reference = base_urls[0]
+        for base_url in base_urls[1:]:
+            for path in paths:
+                ours, theirs = results[base_url, path], results[reference, path]
+                if not (ours['rps'] and theirs['rps']):
+                    continue
+                self.stdout.write(
+                    f'{path}: {base_url} vs {reference}: '
+                    f'{ours["rps"] / theirs["rps"]:.2f}x req/s, '
+                    f'p99 {ours["p99_ms"] - theirs["p99_ms"]:+.1f}ms'
+                )
+
+    def run(self, session, path, options):
+        def fetch(_):
+            started = time.perf_counter()
+            status, _ = session.request('GET', path)
+            return (time.perf_counter() - started) * 1000, status == 200
+
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            list(pool.map(fetch, range(options['warmup'])))
+            started = time.perf_counter()
+            outcomes = list(pool.map(fetch, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+        return summarise(outcomes, elapsed)
@@ -0,0 +1,93 @@
+import json
+import platform
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.benchmark import (SCENARIOS, ClientSession, HttpSession, compare,
+                            load_results, run_scenario, scrape_query_totals)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the benchmark scenarios against users created by '
+        'seed_benchmark_data and report throughput, latency percentiles and '
+        'queries per request. Runs in process through the test client unless '
+        '--base-url points at a server that uses the same database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', dest='scenarios', action='append', choices=sorted(SCENARIOS),
+                            help='Repeatable; defaults to all scenarios.')
+        parser.add_argument('--base-url', help='Run over HTTP against this server instead of in process.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='Compare against the results in this JSON file.')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Percent change in req/s or p99 that counts as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(username__startswith=options['prefix'], account__isnull=False)
+            .select_related('account').order_by('pk')[:max(options['concurrency'], 2)]
+        )
+        if len(users) < 2:
+            raise CommandError('Run seed_benchmark_data first; at least two benchmark users are needed')
+
+        base_url = options['base_url']
+        if base_url and not settings.METRICS_TOKEN:
+            raise CommandError("Set METRICS_TOKEN to the server's, query counts are read from /metrics/")
+        if base_url:
+            def make_session():
+                return HttpSession(base_url)
+        else:
+            make_session = ClientSession
+
+        results = {}
+        for name in options['scenarios'] or SCENARIOS:
+            scenario = SCENARIOS[name]
+            if base_url:
+                probe = make_session()
+                before = scrape_query_totals(probe, scenario.url_name)
+            result = run_scenario(scenario, users, options['password'], make_session, options['requests'],
+                                  concurrency=options['concurrency'], warmup=options['warmup'])
+            if base_url:
+                requests, queries = (after - start for after, start in
+                                     zip(scrape_query_totals(probe, scenario.url_name), before))
+                result['queries_per_request'] = round(queries / requests, 2) if requests else None
+            results[name] = result
+            self.stdout.write(
+                f'{name}: {result["rps"]} req/s, p50 {result["p50_ms"]}ms, p90 {result["p90_ms"]}ms, '
+                f'p99 {result["p99_ms"]}ms, {result["queries_per_request"]} queries/request, '
+                f'errors {result["errors"]}/{result["requests"]}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump({
+                    'created_at': timezone.now().isoformat(),
+                    'target': base_url or 'test-client',
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'options': {key: options[key] for key in ('requests', 'concurrency', 'warmup')},
+                    'scenarios': results,
+                }, fileobj, indent=2)
+            self.stdout.write(f'Wrote {options["output"]}')
+
+        if options['baseline']:
+            regressions = []
+            for name, message, regressed in compare(results, load_results(options['baseline']), options['threshold']):
+                style = self.style.ERROR if regressed else self.style.SUCCESS
+                self.stdout.write(style(f'{name}: {message}' + (f' (regressed: {", ".join(regressed)})' if regressed else '')))
+                if regressed:
+                    regressions.append(name)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Regressions in: {", ".join(regressions)}')
@@ -0,0 +1,37 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import seed_users
+
+
+class Command(BaseCommand):
+    help = (
+        'Create benchmark users, each with an address, a savings account and '
+        'a history of transactions. Point DATABASE_URL at a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--transactions', type=int, default=100, help='Transactions per user.')
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the transaction amounts.')
+        parser.add_argument('--reset', action='store_true', help='Delete existing users with the prefix first.')
+
+    def handle(self, *args, **options):
+        existing = User.objects.filter(username__startswith=options['prefix'])
+        if options['reset']:
+            deleted, _ = existing.delete()
+            self.stdout.write(f'Deleted {deleted} rows of earlier benchmark data')
+        elif existing.exists():
+            raise CommandError(f'Users starting with "{options["prefix"]}" already exist; pass --reset')
+
+        started = time.perf_counter()
+        accounts = seed_users(options['users'], options['transactions'], options['prefix'],
+                              options['password'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(accounts)} users with {len(accounts) * options["transactions"]} transactions '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.mail import MailDeliverer, claim_batch, mark_failed, mark_sent
+
+
+class Command(BaseCommand):
+    help = (
+        'Drain the outbound email queue. Each worker thread keeps one open '
+        'email connection and sends its share of the queue in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Messages sent per connection round.')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        batch_size = options['batch_size']
+        deliverer = MailDeliverer()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while True:
+                    claimed = claim_batch(workers * batch_size)
+                    if not claimed:
+                        if options['once']:
+                            break
+                        time.sleep(options['interval'])
+                        continue
+
+                    # Only the mail connections live in the pool; the
+                    # database is touched from this thread alone.
+                    batches = [claimed[i:i + batch_size] for i in range(0, len(claimed), batch_size)]
+                    for batch, (errors, stats) in zip(batches, pool.map(deliverer.send_batch, batches)):
+                        self.record(batch, errors, options['max_attempts'])
+                        self.report(stats)
+        finally:
+            deliverer.close()
+
+    def record(self, batch, errors, max_attempts):
+        mark_sent([email.id for email, error in zip(batch, errors) if error is None])
+        for email, error in zip(batch, errors):
+            if error is not None:
+                mark_failed(email, error, max_attempts)
+
+    def report(self, stats):
+        rate = stats['size'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(
+            f"batch of {stats['size']}: sent {stats['sent']}, failed {stats['failed']}, "
+            f"reconnects {stats['reconnects']}, {stats['seconds']:.3f}s ({rate:.1f} msg/s)"
+        )
@@ -0,0 +1,69 @@
+import threading
+
+# Upper bounds, in seconds, of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class MetricsRegistry:
+    """Per-view request totals, kept in process memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, queries, db_seconds, render_seconds, wall_seconds):
+        with self._lock:
+            stats = self._views.setdefault(view, ViewStats())
+            stats.requests += 1
+            stats.queries += queries
+            stats.db_seconds += db_seconds
+            stats.render_seconds += render_seconds
+            stats.wall_seconds += wall_seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if wall_seconds <= bound:
+                    stats.buckets[i] += 1
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def render_prometheus(self):
+        """Return the totals in the Prometheus text exposition format."""
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+            counters = [
+                ('amar_bank_requests_total', 'Requests handled.', 'requests'),
+                ('amar_bank_request_queries_total', 'SQL queries run.', 'queries'),
+                ('amar_bank_request_db_seconds_total', 'Time spent in SQL queries.', 'db_seconds'),
+                ('amar_bank_request_render_seconds_total', 'Time spent rendering templates.', 'render_seconds'),
+            ]
+            for name, description, attribute in counters:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} counter')
+                for view, stats in views:
+                    lines.append(f'{name}{{view="{view}"}} {getattr(stats, attribute)}')
+
+            name = 'amar_bank_request_duration_seconds'
+            lines.append(f'# HELP {name} Wall time per request.')
+            lines.append(f'# TYPE {name} histogram')
+            for view, stats in views:
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {stats.requests}')
+                lines.append(f'{name}_sum{{view="{view}"}} {stats.wall_seconds}')
+                lines.append(f'{name}_count{{view="{view}"}} {stats.requests}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,110 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+
+from .metrics import registry
+
+logger = logging.getLogger('amar_bank.requests')
+
+
+class RequestMetricsMiddleware:
+    """Record SQL query count, DB time, template render time and wall time per view.
+
+    Totals are exported by ``core.views.metrics``. Requests that go over one
+    of the ``REQUEST_BUDGETS`` limits, or of their ``REQUEST_VIEW_BUDGETS``
+    overrides for the view's URL name, are logged as warnings. Queries run by
+    a streaming response after the view returns are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = self.start(request)
+        with self.wrap_connections(stats):
+            response = self.get_response(request)
+        self.finish(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = self.start(request)
+        # Connections are thread-local and the ORM runs in the request's
+        # sync thread, so the wrappers have to be installed from there.
+        wrappers = await sync_to_async(self.wrap_connections)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+        self.finish(request, stats)
+        return response
+
+    def start(self, request):
+        stats = {'queries': 0, 'db_seconds': 0.0, 'render_seconds': 0.0, 'started': time.perf_counter()}
+        request._request_metrics = stats
+        return stats
+
+    def wrap_connections(self, stats):
+        def record_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['db_seconds'] += time.perf_counter() - started
+
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(record_query))
+        return stack
+
+    def finish(self, request, stats):
+        wall_seconds = time.perf_counter() - stats['started']
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        registry.observe(view, stats['queries'], stats['db_seconds'], stats['render_seconds'], wall_seconds)
+        self.check_budgets(request, view, stats, wall_seconds)
+
+    def process_template_response(self, request, response):
+        stats = request._request_metrics
+        render = response.render
+
+        def timed_render():
+            started = time.perf_counter()
+            try:
+                return render()
+            finally:
+                stats['render_seconds'] += time.perf_counter() - started
+
+        response.render = timed_render
+        return response
+
+    def check_budgets(self, request, view, stats, wall_seconds):
+        budgets = {
+            **getattr(settings, 'REQUEST_BUDGETS', {}),
+            **getattr(settings, 'REQUEST_VIEW_BUDGETS', {}).get(view, {}),
+        }
+        measured = {
+            'queries': stats['queries'],
+            'db_ms': stats['db_seconds'] * 1000,
+            'render_ms': stats['render_seconds'] * 1000,
+            'wall_ms': wall_seconds * 1000,
+        }
+        over = [
+            f'{name}={measured[name]:.0f} (budget {limit})'
+            for name, limit in budgets.items()
+            if limit and name in measured and measured[name] > limit
+        ]
+        if over:
+            logger.warning('%s %s [%s] over budget: %s', request.method, request.path, view, ', '.join(over))
@@ -1,3 +1,25 @@
 from django.db import models
 
-# Create your models here.
+from .constants import EMAIL_STATUS, PENDING
+
+
+class OutboundEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    to = models.EmailField()
+    content_subtype = models.CharField(max_length=20, default='html')
+    status = models.CharField(max_length=10, choices=EMAIL_STATUS, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.to} - {self.subject}'
@@ -0,0 +1,23 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """TestCase mixin that fails when a request runs more queries than allowed.
+
+    The cache is cleared before every test so budgets do not depend on
+    test order.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def assertQueryBudget(self, budget, method, url, data=None, **extra):
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(url, data, **extra)
+        if len(captured) > budget:
+            queries = '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(captured, start=1))
+            self.fail(f'{method.upper()} {url} ran {len(captured)} queries, budget is {budget}:\n{queries}')
+        return response
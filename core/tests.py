@@ -1,3 +1,127 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .constants import FAILED, PENDING, SENDING, SENT
+from .mail import MailDeliverer, claim_batch, mark_failed, queue_email
+from .models import OutboundEmail
+
+
+def queue(count):
+    return [queue_email(f'user{i}@example.com', 'Deposit Confirmation', 'deposit_email.html',
+                        {'user': None, 'amount': 100}) for i in range(count)]
+
+
+
+class FlakyBackend(EmailBackend):
+    """locmem backend whose connections drop after one message and refuse bounce@ addresses."""
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+        self.sent = 0
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.sent or message.to == ['bounce@example.com']:
+                raise ConnectionError('Connection unexpectedly closed')
+            self.sent += 1
+            super().send_messages([message])
+        return len(messages)
+
+
+class OutboxTests(TestCase):
+    def test_claim_batch_takes_each_email_once(self):
+        emails = queue(3)
+        first = claim_batch(2)
+        self.assertEqual([email.pk for email in first], [email.pk for email in emails[:2]])
+        self.assertEqual({email.status for email in first}, {SENDING})
+        self.assertEqual([email.pk for email in claim_batch(2)], [emails[2].pk])
+        self.assertEqual(claim_batch(2), [])
+
+    def test_stale_claims_are_taken_again(self):
+        email, = queue(1)
+        claim_batch(1)
+        OutboundEmail.objects.update(claimed_at=timezone.now() - timedelta(minutes=11))
+        self.assertEqual([claimed.pk for claimed in claim_batch(1)], [email.pk])
+
+    def test_mark_failed_retries_until_max_attempts(self):
+        email, = queue(1)
+        for status in (PENDING, PENDING, FAILED):
+            mark_failed(OutboundEmail.objects.get(pk=email.pk), 'Connection refused', max_attempts=3)
+            email.refresh_from_db()
+            self.assertEqual(email.status, status)
+        self.assertEqual((email.attempts, email.last_error), (3, 'Connection refused'))
+
+    def test_send_queued_email_drains_the_outbox(self):
+        queue(5)
+        call_command('send_queued_email', once=True, workers=2, batch_size=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', flat=True)), {SENT})
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'user{i}@example.com' for i in range(5)])
+
+
+
+class MailDelivererTests(TestCase):
+    def setUp(self):
+        FlakyBackend.opened = 0
+        self.deliverer = MailDeliverer('core.tests.FlakyBackend')
+        self.addCleanup(self.deliverer.close)
+
+    def test_connection_is_kept_across_batches(self):
+        deliverer = MailDeliverer()
+        self.addCleanup(deliverer.close)
+        deliverer.send_batch(queue(2))
+        errors, stats = deliverer.send_batch(queue(2))
+        self.assertEqual(errors, [None, None])
+        self.assertEqual(len(deliverer._connections), 1)
+        self.assertEqual((stats['sent'], stats['reconnects']), (2, 0))
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_failed_batch_is_resent_one_by_one(self):
+        emails = queue(3)
+        emails[1].to = 'bounce@example.com'
+        errors, stats = self.deliverer.send_batch(emails)
+        self.assertEqual(errors, [None, 'Connection unexpectedly closed', None])
+        self.assertEqual((stats['sent'], stats['failed'], stats['reconnects']), (2, 1, 1))
+        # The batch's connection, one for the retries and a new one after the bounce.
+        self.assertEqual(FlakyBackend.opened, 3)
+        # The first message went out with the batch and again on its retry.
+        self.assertEqual([message.to[0] for message in mail.outbox],
+                         ['user0@example.com', 'user0@example.com', 'user2@example.com'])
+
+
+class MetricsTests(TestCase):
+    def test_anonymous_and_customers_are_refused(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(User.objects.create_user('alice', 'alice@example.com', 'password'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_bearer_token(self):
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+            self.assertContains(response, 'amar_bank_requests_total')
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 403)
+        # No token configured: an empty bearer must not match.
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_staff(self):
+        self.client.force_login(User.objects.create_user('ops', 'ops@example.com', 'password', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
 
-# Create your tests here.
+    def test_view_budget_overrides_the_default(self):
+        self.client.force_login(User.objects.create_user('ops', 'ops@example.com', 'password', is_staff=True))
+        with self.settings(REQUEST_BUDGETS={'queries': 0}, REQUEST_VIEW_BUDGETS={'metrics': {'queries': 1}}):
+            with self.assertLogs('amar_bank.requests', 'WARNING') as logs:
+                self.client.get(reverse('metrics'))
+        self.assertIn('metrics', logs.output[0])
@@ -1,6 +1,19 @@
-
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
 from django.views.generic import TemplateView
 
+from .metrics import registry
+
 
 class HomeView(TemplateView):
-    template_name = 'index.html'
\ No newline at end of file
+    template_name = 'index.html'
+
+
+def metrics(request):
+    """Prometheus metrics, for staff sessions or ``Authorization: Bearer <METRICS_TOKEN>``."""
+    token = settings.METRICS_TOKEN
+    bearer = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (bearer or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4')
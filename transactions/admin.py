@@ -1,6 +1,11 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
+from core.mail import queue_emails
+
+from . import ledger
+from .constants import LOAN
 from .models import Transaction
+from .pagination import CappedCountPaginator
 from .views import send_transaction_email
 
 
@@ -8,10 +13,68 @@ from .views import send_transaction_email
 
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['account', 'amount', 'balance_after_transaction', 'transaction_type', 'loan_approved']
-    
+    # The account's __str__ reads its user.
+    list_select_related = ['account__user']
+    list_filter = ['transaction_type', 'loan_approved']
+    # Exact, so the lookup can use the unique index on account_number.
+    search_fields = ['account__account_number__exact']
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    actions = ['approve_loans', 'reject_loans']
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return []
+        # Saving a row again moves no money, so only a pending loan's
+        # approval stays editable.
+        fields = ['account', 'to_account', 'amount', 'transaction_type', 'balance_after_transaction']
+        if not (obj.transaction_type == LOAN and not obj.loan_approved):
+            fields.append('loan_approved')
+        return fields
+
     def save_model(self, request, obj, form, change):
-        obj.account.balance += obj.amount
-        obj.balance_after_transaction = obj.account.balance
-        obj.account.save()
+        if obj.transaction_type == LOAN and obj.loan_approved and 'loan_approved' in form.changed_data:
+            if not change:
+                # Store it pending first; the admin view wraps both in one transaction.
+                obj.loan_approved = False
+                obj.save()
+            try:
+                ledger.approve_loan(obj)
+            except ledger.LoanNotPending:
+                self.message_user(request, f'Loan {obj.pk} was already approved', messages.WARNING)
+                return
+        elif change:
+            obj.save()
+            return
+        else:
+            ledger.credit(obj)
+            if obj.transaction_type == LOAN:
+                # Pending; the approval email goes out when it is approved.
+                return
         send_transaction_email(obj.account.user, obj.amount, 'Transaction Alert', 'admin_email.html')
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+
+    @admin.action(description='Approve selected loan requests')
+    def approve_loans(self, request, queryset):
+        loans = ledger.approve_loans(queryset.values('pk'))
+        if not loans:
+            self.message_user(request, 'None of the selected transactions is a pending loan', messages.WARNING)
+            return
+        queue_emails([
+            (loan.account.user.email, 'Transaction Alert', 'admin_email.html',
+             {'user': loan.account.user, 'amount': loan.amount})
+            for loan in loans
+        ])
+        self.message_user(request, f'Approved {len(loans)} loan requests')
+
+    @admin.action(description='Reject selected loan requests')
+    def reject_loans(self, request, queryset):
+        loans = ledger.reject_loans(queryset.values('pk'))
+        if not loans:
+            self.message_user(request, 'None of the selected transactions is a pending loan', messages.WARNING)
+            return
+        queue_emails([
+            (loan.account.user.email, 'Loan Request Rejected', 'loan_rejected_email.html',
+             {'user': loan.account.user, 'amount': loan.amount})
+            for loan in loans
+        ])
+        self.message_user(request, f'Rejected {len(loans)} loan requests')
@@ -0,0 +1,238 @@
+"""JSON API for balances, history and postings.
+
+Requests authenticate with an API token (see ``accounts.tokens``) instead
+of the session, so there is no CSRF round trip and no session write.
+Input is validated with the same forms as the HTML views and postings go
+through the same ledger functions, with the same emails. Responses are
+built from ``.values()`` rows or the cached account.
+
+The balance and loan list carry an ETag derived from the account's
+journal and loan counters, so polling with ``If-None-Match`` costs the
+token lookup and a cache read until something changes. Postings honour
+the ``Idempotency-Key`` header like the form views do.
+"""
+import json
+
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from accounts.cache import prime
+from accounts.tokens import user_for_header
+
+from . import ledger
+from .constants import DEPOSIT, LOAN, TRANSFER, WITHDRAWAL
+from .forms import DepositForm, LoanForm, TransferForm, WithdrawForm
+from .idempotency import IdempotentPostMixin, replay_response
+from .loans import loan_list
+from .models import Transaction
+from .pagination import KeysetPaginator
+from .statements import TYPE_NAMES
+from .views import send_transaction_email, transfer_send_email
+
+HISTORY_FIELDS = ['id', 'timestamp', 'transaction_type', 'amount', 'balance_after_transaction',
+                  'to_account__account_number']
+
+
+def error(status, code, **extra):
+    return JsonResponse({'error': code, **extra}, status=status)
+
+
+def money(value):
+    # Amounts straight from a form are not quantized yet.
+    return f'{value:.2f}'
+
+
+def history_row(row):
+    return {
+        'id': row['id'],
+        'timestamp': row['timestamp'],
+        'type': TYPE_NAMES.get(row['transaction_type'], ''),
+        'amount': money(row['amount']),
+        'balance_after': money(row['balance_after_transaction']),
+        'counterparty': row['to_account__account_number'],
+    }
+
+
+def transaction_row(txn):
+    return history_row({
+        'id': txn.pk,
+        'timestamp': txn.timestamp,
+        'transaction_type': txn.transaction_type,
+        'amount': txn.amount,
+        'balance_after_transaction': txn.balance_after_transaction,
+        'to_account__account_number': txn.to_account.account_number if txn.to_account_id else None,
+    })
+
+
+def conditional(request, etag, build):
+    """Answer 304 if the client has ``etag``, else ``build()`` the response."""
+    response = get_conditional_response(request, etag=etag) or build()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ApiView(View):
+    """Token-authenticated view; ``request.user.account`` comes from the cache."""
+
+    def dispatch(self, request, *args, **kwargs):
+        user = user_for_header(request.headers.get('Authorization', ''))
+        if user is None:
+            response = error(401, 'invalid_token')
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.user = user
+        prime(user, kinds=('account',))
+        if not hasattr(user, 'account'):
+            return error(403, 'no_account')
+        return super().dispatch(request, *args, **kwargs)
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        response = error(405, 'method_not_allowed')
+        response['Allow'] = ', '.join(self._allowed_methods())
+        return response
+
+    def payload(self):
+        if self.request.content_type == 'application/json':
+            data = json.loads(self.request.body or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError('Expected a JSON object')
+            return data
+        return self.request.POST
+
+
+class ApiFormView(ApiView):
+    form_class = None
+    transaction_type = None
+
+    def get_form_kwargs(self):
+        return {'account': self.request.user.account}
+
+    def post(self, request):
+        try:
+            data = self.payload()
+        except ValueError:
+            return error(400, 'invalid_json')
+        form = self.form_class(data, initial={'transaction_type': self.transaction_type}, **self.get_form_kwargs())
+        if not form.is_valid():
+            return error(400, 'invalid', errors=form.errors)
+        return self.form_valid(form)
+
+    def posted(self, txn, status=201):
+        return JsonResponse({
+            'transaction': transaction_row(txn),
+            'balance': money(self.request.user.account.balance),
+        }, status=status)
+
+
+class ApiPostingView(IdempotentPostMixin, ApiFormView):
+    def is_completed(self, response):
+        return 200 <= response.status_code < 300
+
+    def replay(self, result):
+        return replay_response(result)
+
+    def key_in_use(self):
+        return error(409, 'idempotency_key_in_use')
+
+
+class BalanceApiView(ApiView):
+    def get(self, request):
+        account = request.user.account
+        return conditional(request, f'"{account.pk}-{account.journal_sequence}"', lambda: JsonResponse({
+            'account_number': account.account_number,
+            'balance': money(account.balance),
+        }))
+
+
+class HistoryApiView(ApiView):
+    """The account's transactions, oldest first, 50 at a time by cursor."""
+    paginate_by = 50
+
+    def get(self, request):
+        queryset = Transaction.objects.filter(account=request.user.account).values(*HISTORY_FIELDS)
+        page = KeysetPaginator(queryset, self.paginate_by).page(request.GET.get('cursor'))
+        return JsonResponse({
+            'results': [history_row(row) for row in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+
+class DepositApiView(ApiPostingView):
+    form_class = DepositForm
+    transaction_type = DEPOSIT
+
+    def form_valid(self, form):
+        amount = form.cleaned_data['amount']
+        txn = ledger.deposit(self.request.user.account, amount)
+        send_transaction_email(self.request.user, amount, 'Deposit Confirmation', 'deposit_email.html')
+        return self.posted(txn)
+
+
+class WithdrawApiView(ApiPostingView):
+    form_class = WithdrawForm
+    transaction_type = WITHDRAWAL
+
+    def form_valid(self, form):
+        amount = form.cleaned_data['amount']
+        try:
+            txn = ledger.withdraw(self.request.user.account, amount)
+        except ledger.InsufficientFunds:
+            return error(409, 'insufficient_funds')
+        send_transaction_email(self.request.user, amount, 'Withdraw Confirmation', 'withdrawal_email.html')
+        return self.posted(txn)
+
+
+class TransferApiView(ApiPostingView):
+    form_class = TransferForm
+    transaction_type = TRANSFER
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs.update({'from_account': self.request.user.account})
+        return kwargs
+
+    def form_valid(self, form):
+        transfer = form.transfer
+        from_account, to_account = transfer.from_account, transfer.to_account
+        try:
+            if from_account.balance < transfer.amount:
+                raise ledger.InsufficientFunds
+            sent, _ = ledger.transfer(from_account, to_account, transfer.amount)
+        except ledger.InsufficientFunds:
+            return error(409, 'insufficient_funds')
+        transfer_send_email(self.request.user, transfer.amount, 'Transfer Confirmation', 'transfer_email.html',
+                            to_account.account_number)
+        transfer_send_email(to_account.user, transfer.amount, 'Transfer Confirmation', 'receive_email.html',
+                            from_account.account_number)
+        return self.posted(sent)
+
+
+class LoansApiView(ApiPostingView):
+    """GET lists the unpaid loans, POST requests a new one."""
+    form_class = LoanForm
+    transaction_type = LOAN
+
+    def get(self, request):
+        account = request.user.account
+        updated = account.loans_updated_at.timestamp() if account.loans_updated_at else 0
+        return conditional(request, f'"{account.pk}-{updated}"', lambda: JsonResponse({
+            'results': [
+                {'id': loan.pk, 'timestamp': loan.timestamp, 'amount': money(loan.amount),
+                 'approved': loan.loan_approved}
+                for loan in loan_list(account)
+            ],
+        }))
+
+    def form_valid(self, form):
+        if self.request.user.account.active_loan_count > 3:
+            return error(409, 'loan_limit')
+        amount = form.cleaned_data['amount']
+        txn = ledger.request_loan(self.request.user.account, amount)
+        send_transaction_email(self.request.user, amount, 'Loan Request Confirmation', 'loan_email.html')
+        return self.posted(txn, status=202)
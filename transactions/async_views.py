@@ -0,0 +1,211 @@
+"""Native async versions of the report, loan list and posting views.
+
+They are served under ``/transaction/async/`` next to the sync views and
+read through the async ORM (``async for``, ``aaggregate``, ``acreate``).
+Form validation and the ledger postings have no async API (clean methods
+may query and postings need ``transaction.atomic``), so those two steps
+run in the request's sync thread via ``sync_to_async``.
+The posting views take idempotency keys like the sync ones (see
+``transactions.idempotency``).
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect, resolve_url
+from django.template.response import TemplateResponse
+from django.urls import reverse_lazy
+from django.views import View
+from django.views.generic.base import ContextMixin
+
+from accounts.cache import aprime
+from core.mail import aqueue_email
+
+from . import ledger
+from .constants import DEPOSIT, TRANSFER, WITHDRAWAL
+from .forms import DepositForm, TransferForm, WithdrawForm
+from .idempotency import AsyncIdempotentPostMixin
+from .loans import aloan_list
+from .models import Transaction
+from .pagination import KeysetPaginator
+from .reports import aperiod_summary, period_from_request
+from .views import TransactionReportView
+
+
+class AsyncLoginRequiredMixin:
+    """``LoginRequiredMixin`` for views whose handlers are coroutines."""
+    login_url = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), resolve_url(self.login_url or settings.LOGIN_URL))
+        request.user = user
+        await aprime(user, kinds=('account',))
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncTransactionReportView(AsyncLoginRequiredMixin, View):
+    template_name = 'transactions_report.html'
+    paginate_by = TransactionReportView.paginate_by
+
+    async def get(self, request):
+        account = request.user.account
+        queryset = Transaction.objects.filter(account=account)
+        period = None
+        start, end = period_from_request(request.GET)
+        if start is not None:
+            queryset = queryset.filter(timestamp__gte=start, timestamp__lt=end)
+            period = await aperiod_summary(account, start, end)
+        page = await KeysetPaginator(queryset, self.paginate_by).apage(request.GET.get('cursor'))
+        filters = request.GET.copy()
+        filters.pop('cursor', None)
+        return TemplateResponse(request, self.template_name, {
+            'view': self,
+            'object_list': page.object_list,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'account': account,
+            'period': period,
+            'filters': filters.urlencode(),
+        })
+
+
+class AsyncLoanListView(AsyncLoginRequiredMixin, View):
+    template_name = 'loan_request.html'
+
+    async def get(self, request):
+        loans = await aloan_list(request.user.account)
+        return TemplateResponse(request, self.template_name, {'view': self, 'loans': loans})
+
+
+class AsyncFormView(ContextMixin, View):
+    """``FormView`` whose handlers are coroutines; validation runs via ``sync_to_async``.
+
+    Subclasses define ``async def form_valid(self, form)``.
+    """
+    template_name = None
+    form_class = None
+    success_url = None
+
+    def get_initial(self):
+        return {}
+
+    def get_form_kwargs(self):
+        return {}
+
+    def get_form(self, data=None):
+        return self.form_class(data, initial=self.get_initial(), **self.get_form_kwargs())
+
+    def render_form(self, form):
+        return TemplateResponse(self.request, self.template_name, self.get_context_data(form=form))
+
+    async def get(self, request, *args, **kwargs):
+        return self.render_form(self.get_form())
+
+    async def post(self, request, *args, **kwargs):
+        form = self.get_form(request.POST)
+        if not await sync_to_async(form.is_valid)():
+            return self.render_form(form)
+        return await self.form_valid(form)
+
+
+class AsyncTransactionFormView(AsyncLoginRequiredMixin, AsyncIdempotentPostMixin, AsyncFormView):
+    template_name = 'transactions_form.html'
+    transaction_type = None
+    title = ''
+    success_url = reverse_lazy('async_transaction_report')
+
+    def get_initial(self):
+        return {'transaction_type': self.transaction_type}
+
+    def get_form_kwargs(self):
+        return {'account': self.request.user.account}
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('title', self.title)
+        return super().get_context_data(**kwargs)
+
+
+class AsyncDepositView(AsyncTransactionFormView):
+    form_class = DepositForm
+    transaction_type = DEPOSIT
+    title = 'Deposit'
+
+    async def form_valid(self, form):
+        amount = form.cleaned_data['amount']
+        await sync_to_async(ledger.deposit)(self.request.user.account, amount)
+        messages.success(
+            self.request,
+            f'{"{:,.2f}".format(float(amount))}$ was deposited to your account successfully'
+        )
+        await aqueue_email(self.request.user.email, 'Deposit Confirmation', 'deposit_email.html', {
+            'user': self.request.user,
+            'amount': amount,
+        })
+        return redirect(self.success_url)
+
+
+class AsyncWithdrawView(AsyncTransactionFormView):
+    form_class = WithdrawForm
+    transaction_type = WITHDRAWAL
+    title = 'Withdraw'
+
+    async def form_valid(self, form):
+        amount = form.cleaned_data['amount']
+        try:
+            await sync_to_async(ledger.withdraw)(self.request.user.account, amount)
+        except ledger.InsufficientFunds:
+            form.add_error('amount', 'Insufficient balance')
+            return self.render_form(form)
+        messages.success(
+            self.request,
+            f'{"{:,.2f}".format(float(amount))}$ was withdrawn from your account successfully'
+        )
+        await aqueue_email(self.request.user.email, 'Withdraw Confirmation', 'withdrawal_email.html', {
+            'user': self.request.user,
+            'amount': amount,
+        })
+        return redirect(self.success_url)
+
+
+class AsyncTransferView(AsyncTransactionFormView):
+    form_class = TransferForm
+    transaction_type = TRANSFER
+    title = 'Transfer Money'
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs.update({'from_account': self.request.user.account})
+        return kwargs
+
+    async def form_valid(self, form):
+        transfer = form.transfer
+        amount = transfer.amount
+        from_account, to_account = transfer.from_account, transfer.to_account
+        try:
+            if from_account.balance < amount:
+                raise ledger.InsufficientFunds
+            await sync_to_async(ledger.transfer)(from_account, to_account, amount)
+        except ledger.InsufficientFunds:
+            messages.warning(self.request, 'You do not have enough balance to transfer')
+            return self.render_form(form)
+        messages.success(
+            self.request,
+            f'{"{:,.2f}".format(float(amount))}$ was transferred to account {to_account.account_number} successfully'
+        )
+        await asyncio.gather(
+            aqueue_email(self.request.user.email, 'Transfer Confirmation', 'transfer_email.html', {
+                'user': self.request.user,
+                'amount': amount,
+                'account_number': to_account.account_number,
+            }),
+            aqueue_email(to_account.user.email, 'Transfer Confirmation', 'receive_email.html', {
+                'user': to_account.user,
+                'amount': amount,
+                'account_number': from_account.account_number,
+            }),
+        )
+        return redirect(self.success_url)
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+import time
+
+from core.mail import queue_emails
+
+from . import ledger
+
+
+def _parse_amount(value, line):
+    try:
+        return ledger.check_amount(str(value).strip())
+    except ledger.InvalidAmount as exc:
+        raise ValueError(f'Line {line}: {exc}')
+
+
+def parse_transfer_file(fileobj, filename):
+    """Read ``(account_number, amount)`` pairs from a CSV or JSON upload.
+
+    CSV files have two columns and may start with a header row. JSON files
+    hold a list of ``{"account_number": ..., "amount": ...}`` objects or of
+    two-item lists.
+    """
+    data = fileobj.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+
+    if filename.lower().endswith('.json'):
+        try:
+            records = json.loads(data)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f'Invalid JSON: {exc}')
+        if not isinstance(records, list):
+            raise ValueError('JSON file must contain a list of transfers')
+        rows = []
+        for line, record in enumerate(records, start=1):
+            if isinstance(record, dict):
+                record = (record.get('account_number'), record.get('amount'))
+            if not isinstance(record, (list, tuple)) or len(record) != 2 or record[0] in (None, ''):
+                raise ValueError(f'Line {line}: expected an account number and an amount')
+            rows.append((str(record[0]).strip(), _parse_amount(record[1], line)))
+        return rows
+
+    rows = []
+    for line, record in enumerate(csv.reader(io.StringIO(data)), start=1):
+        if not record or not ''.join(record).strip():
+            continue
+        if len(record) != 2:
+            raise ValueError(f'Line {line}: expected an account number and an amount')
+        if line == 1 and not rows and record[1].strip().lower() == 'amount':
+            continue
+        rows.append((record[0].strip(), _parse_amount(record[1], line)))
+    return rows
+
+
+def check_recipients(from_account, lines):
+    """Raise ``ValueError`` for the first line that pays ``from_account`` itself."""
+    for line, (number, _) in enumerate(lines, start=1):
+        if number == from_account.account_number:
+            raise ValueError(f'Line {line}: you cannot transfer to your own account')
+
+
+def run_bulk_transfer(from_account, lines, batch_size=1000):
+    """Post ``lines`` in atomic batches, yielding timing stats per batch."""
+    for start in range(0, len(lines), batch_size):
+        batch = lines[start:start + batch_size]
+        started = time.perf_counter()
+        recipients = ledger.bulk_transfer(from_account, batch)
+        posted = time.perf_counter() - started
+
+        total = sum(amount for _, amount in batch)
+        emails = [
+            (recipients[number].user.email, 'Transfer Confirmation', 'receive_email.html', {
+                'user': recipients[number].user,
+                'amount': amount,
+                'account_number': from_account.account_number,
+            })
+            for number, amount in batch
+        ]
+        emails.append((from_account.user.email, 'Transfer Confirmation', 'transfer_email.html', {
+            'user': from_account.user,
+            'amount': total,
+            'account_number': f'{len(recipients)} accounts',
+        }))
+        queue_emails(emails)
+
+        elapsed = time.perf_counter() - started
+        yield {
+            'size': len(batch),
+            'amount': total,
+            'post_seconds': posted,
+            'seconds': elapsed,
+            'per_second': len(batch) / elapsed if elapsed else 0,
+        }
@@ -4,6 +4,8 @@ LOAN = 3
 LOAN_PAID = 4
 TRANSFER = 5
 RECEIVE = 6
+LOAN_REJECTED = 7
+INTEREST = 8
 
 TRANSACTION_TYPE = (
     (DEPOSIT, 'Deposit'),
@@ -12,5 +14,15 @@ TRANSACTION_TYPE = (
     (LOAN_PAID, 'Loan Paid'),
     (TRANSFER, 'Transfer'),
     (RECEIVE, 'Receive'),
+    (LOAN_REJECTED, 'Loan Rejected'),
+    (INTEREST, 'Interest'),
     
-)
\ No newline at end of file
+)
+
+MONTH = 'month'
+WEEK = 'week'
+
+ROLLUP_PERIODS = (
+    (MONTH, 'Month'),
+    (WEEK, 'Week'),
+)
@@ -0,0 +1,132 @@
+"""End-of-day batch: interest on savings balances and the day's statements.
+
+A run covers one business date. Its account ids are split into
+``EndOfDayPartition`` ranges that worker processes take on independently.
+A worker credits its savings accounts a chunk at a time through
+``ledger.pay_interest`` and moves the partition's checkpoint in the same
+database transaction, so a crashed run resumes after the last chunk that
+committed and no account is paid twice for a day.
+
+With a statements directory, a worker then writes the day's statement of
+every account in its range that had postings that day, which it finds
+through ``DailyBalance``.
+"""
+import os
+import time
+from datetime import timedelta
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.constants import SAVINGS
+from accounts.models import UserBankAccount
+
+from . import ledger
+from .journal import id_ranges
+from .models import DailyBalance, EndOfDayPartition, EndOfDayRun
+from .reports import day_start
+from .statements import statement_lines, statement_rows
+
+CHUNK_ACCOUNTS = ledger.BULK_UPDATE_CHUNK
+CENT = Decimal('0.01')
+
+
+def daily_interest(balance, annual_rate):
+    return (balance * annual_rate / 365).quantize(CENT, rounding=ROUND_HALF_EVEN)
+
+
+def start_run(parts, annual_rate=None):
+    """Return the unfinished run, or start today's split into ``parts`` id ranges.
+
+    Returns ``None`` if today's run has already finished. ``annual_rate``
+    defaults to ``SAVINGS_INTEREST_RATE`` and only applies to a new run.
+    """
+    run = EndOfDayRun.objects.filter(finished_at=None).order_by('business_date').first()
+    if run is not None:
+        return run
+    today = timezone.localdate()
+    if EndOfDayRun.objects.filter(business_date=today).exists():
+        return None
+    rate = Decimal(annual_rate if annual_rate is not None else settings.SAVINGS_INTEREST_RATE)
+    with transaction.atomic():
+        run, created = EndOfDayRun.objects.get_or_create(business_date=today, defaults={'annual_rate': rate})
+        if created:
+            EndOfDayPartition.objects.bulk_create([
+                EndOfDayPartition(run=run, first_id=first, last_id=last) for first, last in id_ranges(parts)
+            ])
+    return run
+
+
+def _accrue_chunk(partition_id, annual_rate, chunk_size):
+    """Pay the next ``chunk_size`` savings accounts of a partition. Returns how many were read."""
+    with transaction.atomic():
+        # Writing the checkpoint row before reading anything takes its lock
+        # up front: two workers on the same partition take turns, and SQLite
+        # never has to upgrade a read transaction, which fails at once
+        # rather than waiting if another worker committed in between.
+        EndOfDayPartition.objects.filter(pk=partition_id).update(updated_at=timezone.now())
+        partition = EndOfDayPartition.objects.get(pk=partition_id)
+        accounts = list(
+            UserBankAccount.objects.select_for_update()
+            .filter(pk__gte=partition.first_id, pk__gt=partition.last_account_id, pk__lte=partition.last_id,
+                    account_type=SAVINGS, balance__gt=0)
+            .order_by('pk').only('pk', 'user_id', 'balance')[:chunk_size]
+        )
+        if not accounts:
+            return 0
+        interest = {account: daily_interest(account.balance, annual_rate) for account in accounts}
+        interest = {account: amount for account, amount in interest.items() if amount > 0}
+        if interest:
+            ledger.pay_interest(interest)
+        partition.last_account_id = accounts[-1].pk
+        partition.accounts += len(interest)
+        partition.interest += sum(interest.values(), Decimal('0'))
+        partition.save(update_fields=['last_account_id', 'accounts', 'interest'])
+    return len(accounts)
+
+
+def _write_statements(partition, business_date, out_dir, fmt):
+    start = day_start(business_date)
+    end = day_start(business_date + timedelta(days=1))
+    accounts = (
+        DailyBalance.objects.filter(date=business_date, account_id__gte=partition.first_id,
+                                    account_id__lte=partition.last_id)
+        .order_by('account_id').values_list('account_id', 'account__account_number')
+    )
+    written = 0
+    for account_id, account_number in accounts.iterator():
+        with open(os.path.join(out_dir, f'{account_number}.{fmt}'), 'w', newline='') as fileobj:
+            fileobj.writelines(statement_lines(fmt, statement_rows(account_id, start, end)))
+        written += 1
+    return written
+
+
+def run_partition(task):
+    """Finish one partition; takes ``(partition_id, statements_dir, fmt, chunk_size)`` for process pools.
+
+    Returns the number of accounts paid by this call and the seconds it took.
+    """
+    partition_id, statements_dir, fmt, chunk_size = task
+    started = time.perf_counter()
+    partition = EndOfDayPartition.objects.select_related('run').get(pk=partition_id)
+    if partition.finished_at is not None:
+        return 0, 0.0
+    run, paid_before = partition.run, partition.accounts
+    while _accrue_chunk(partition.pk, run.annual_rate, chunk_size):
+        pass
+    partition.refresh_from_db()
+    if statements_dir:
+        partition.statements = _write_statements(partition, run.business_date, statements_dir, fmt)
+    partition.finished_at = timezone.now()
+    partition.save(update_fields=['statements', 'finished_at'])
+    return partition.accounts - paid_before, time.perf_counter() - started
+
+
+def finish_run(run):
+    """Mark ``run`` finished once all its partitions are. Returns whether it is."""
+    if run.partitions.filter(finished_at=None).exists():
+        return False
+    EndOfDayRun.objects.filter(pk=run.pk).update(finished_at=timezone.now())
+    return True
@@ -2,7 +2,11 @@
 from django import forms
 
 from accounts.models import UserBankAccount
+from accounts.numbers import is_valid_account_number
 
+from . import risk
+from .bulk import check_recipients, parse_transfer_file
+from .constants import LOAN, TRANSFER, WITHDRAWAL
 from .models import Transaction
 
 
@@ -22,6 +26,11 @@ class TransactionForm(forms.ModelForm):
         self.instance.balance_after_transaction = self.account.balance
         return super().save(commit=commit)
 
+    def check_velocity(self, transaction_type, amount):
+        rule = risk.evaluate(self.account.pk, transaction_type, amount)
+        if rule is not None:
+            raise forms.ValidationError(rule.message)
+
 class DepositForm(TransactionForm):
     def clean_amount(self):
         min_deposit = 100
@@ -44,6 +53,7 @@ class WithdrawForm(TransactionForm):
             raise forms.ValidationError(f'Insufficient balance. Your balance is {balance}')
         if account.is_bankrupt:
             raise forms.ValidationError('Your account is bankrupt')
+        self.check_velocity(WITHDRAWAL, amount)
         return amount      
 
 class LoanForm(TransactionForm):
@@ -54,28 +64,68 @@ class LoanForm(TransactionForm):
         amount = self.cleaned_data['amount']
         if amount > max_loan:
             raise forms.ValidationError('Amount should be less than 100000')
+        self.check_velocity(LOAN, amount)
         return amount
 
+class ResolvedTransfer:
+    """Both accounts of one transfer, looked up once.
+
+    The same instances are used for validation, for posting through the
+    ledger (which refreshes their balances) and for the notifications.
+    """
+
+    def __init__(self, from_account, to_account, amount):
+        self.from_account = from_account
+        self.to_account = to_account
+        self.amount = amount
+
+
 class TransferForm(TransactionForm):
     to_account_number = forms.CharField()
 
     def __init__(self, *args, **kwargs):
         self.from_account = kwargs.pop('from_account')
         super().__init__(*args, **kwargs)
+        self.transfer = None
 
     def clean_to_account_number(self):
         to_account_number = self.cleaned_data['to_account_number']
-        if not UserBankAccount.objects.filter(account_number=to_account_number).exists():
+        if not is_valid_account_number(to_account_number):
+            # Typos fail the check digit without a database round trip.
+            raise forms.ValidationError('Invalid account number')
+        try:
+            self.to_account = UserBankAccount.objects.select_related('user').get(account_number=to_account_number)
+        except UserBankAccount.DoesNotExist:
             raise forms.ValidationError('Invalid account number')
         return to_account_number
 
-    def save(self, commit=True):
-        self.instance.account = self.from_account
-        self.instance.balance_after_transaction = self.from_account.balance
+    def clean(self):
+        cleaned_data = super().clean()
+        if 'amount' in cleaned_data and 'to_account_number' in cleaned_data:
+            self.check_velocity(TRANSFER, cleaned_data['amount'])
+            self.transfer = ResolvedTransfer(self.from_account, self.to_account, cleaned_data['amount'])
+        return cleaned_data
 
-        to_account_number = self.cleaned_data['to_account_number']
-        to_account = UserBankAccount.objects.get(account_number=to_account_number)
-        self.instance.to_account = to_account
-        self.instance.to_account_balance_after_transaction = to_account.balance
+class BulkTransferForm(forms.Form):
+    transfer_file = forms.FileField()
+
+    def __init__(self, *args, **kwargs):
+        self.account = kwargs.pop('account')
+        super().__init__(*args, **kwargs)
 
-        return super().save(commit=commit)
\ No newline at end of file
+    def clean_transfer_file(self):
+        upload = self.cleaned_data['transfer_file']
+        try:
+            self.lines = parse_transfer_file(upload, upload.name)
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+        if not self.lines:
+            raise forms.ValidationError('The file does not contain any transfers')
+        try:
+            check_recipients(self.account, self.lines)
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+        total = sum(amount for _, amount in self.lines)
+        if total > self.account.balance:
+            raise forms.ValidationError(f'Insufficient balance. Your balance is {self.account.balance}')
+        return upload
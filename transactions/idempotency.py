@@ -0,0 +1,194 @@
+"""Idempotency keys for the posting views.
+
+A client sends a key with a POST, in the ``Idempotency-Key`` header or the
+form's hidden ``idempotency_key`` field. The first request with a key
+claims it by inserting an ``IdempotencyKey`` row, whose unique constraint
+lets exactly one of several concurrent duplicates through. When the
+posting completes its response is stored on the row and in the cache, and
+later requests with the same key get that response back without running
+validation, the posting or the emails again. A request that does not
+complete releases its key, so the corrected form can reuse it.
+
+The claim is committed before the posting runs, so a process that dies
+after posting leaves the key claimed rather than free: retries are then
+refused until the key expires instead of posting twice.
+"""
+import re
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .models import IdempotencyKey
+
+FORM_FIELD = 'idempotency_key'
+KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+class KeyInUse(Exception):
+    """The key belongs to a request still in flight, or to another kind of request."""
+
+
+def _cache_key(user_id, key):
+    return f'idempotency:{user_id}:{key}'
+
+
+def key_from_request(request):
+    return request.headers.get('Idempotency-Key') or request.POST.get(FORM_FIELD) or None
+
+
+def claim(user_id, key, scope):
+    """Claim ``key`` for a new posting or fetch the result of the one that used it.
+
+    Returns ``(claimed_row, None)`` when the caller should go ahead and
+    ``(None, result)`` when it should replay ``result``.
+    """
+    result = cache.get(_cache_key(user_id, key))
+    if result is not None:
+        if result['scope'] != scope:
+            raise KeyInUse(key)
+        return None, result
+
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                row = IdempotencyKey.objects.create(
+                    user_id=user_id, key=key, scope=scope,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return row, None
+        except IntegrityError:
+            pass
+        existing = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+        if existing is None:
+            # Released in the meantime.
+            continue
+        if existing.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=existing.pk, expires_at__lte=now).delete()
+            continue
+        if existing.scope != scope or existing.status_code is None:
+            raise KeyInUse(key)
+        result = existing.result()
+        cache.set(_cache_key(user_id, key), result, (existing.expires_at - now).total_seconds())
+        return None, result
+    raise KeyInUse(key)
+
+
+def record(row, response):
+    """Store the completed posting's ``response`` for replays."""
+    row.status_code = response.status_code
+    row.location = response.get('Location', '')
+    row.content_type = response.get('Content-Type', '')
+    row.body = response.content.decode(response.charset)
+    row.save(update_fields=['status_code', 'location', 'content_type', 'body'])
+    timeout = (row.expires_at - timezone.now()).total_seconds()
+    cache.set(_cache_key(row.user_id, row.key), row.result(), timeout)
+
+
+def release(row):
+    IdempotencyKey.objects.filter(pk=row.pk).delete()
+
+
+def replay_response(result):
+    response = HttpResponse(result['body'], status=result['status_code'],
+                            content_type=result['content_type'] or None)
+    if result['location']:
+        response['Location'] = result['location']
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class BaseIdempotentPostMixin:
+    """Hooks shared by the sync and async idempotent POST mixins.
+
+    Only completed postings are stored, which for the form views means a
+    redirect. Requests without a key behave as before.
+    """
+
+    def get_idempotency_scope(self):
+        return self.request.resolver_match.url_name
+
+    def is_completed(self, response):
+        return response.status_code in (301, 302, 303)
+
+    def replay(self, result):
+        messages.info(self.request, 'This request was already submitted, so it was not posted again')
+        return replay_response(result)
+
+    def key_in_use(self):
+        messages.warning(self.request, 'This request is already being processed')
+        return redirect(self.success_url)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # A re-rendered form keeps its key: the failed attempt released it.
+        context[FORM_FIELD] = self.request.POST.get(FORM_FIELD) or get_random_string(32)
+        return context
+
+
+class IdempotentPostMixin(BaseIdempotentPostMixin):
+    """Make a view's POST replay its earlier response for a repeated key."""
+
+    def post(self, request, *args, **kwargs):
+        key = key_from_request(request)
+        if key is None:
+            return super().post(request, *args, **kwargs)
+        if not KEY_PATTERN.fullmatch(key):
+            return HttpResponseBadRequest('Invalid idempotency key')
+        try:
+            row, result = claim(request.user.pk, key, self.get_idempotency_scope())
+        except KeyInUse:
+            return self.key_in_use()
+        if result is not None:
+            return self.replay(result)
+
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception:
+            release(row)
+            raise
+        if self.is_completed(response):
+            record(row, response)
+        else:
+            release(row)
+        return response
+
+
+class AsyncIdempotentPostMixin(BaseIdempotentPostMixin):
+    """``IdempotentPostMixin`` for views whose ``post`` is a coroutine."""
+
+    def get_idempotency_scope(self):
+        # Same scope as the sync view, so a retry may go to either.
+        return super().get_idempotency_scope().removeprefix('async_')
+
+    async def post(self, request, *args, **kwargs):
+        key = key_from_request(request)
+        if key is None:
+            return await super().post(request, *args, **kwargs)
+        if not KEY_PATTERN.fullmatch(key):
+            return HttpResponseBadRequest('Invalid idempotency key')
+        try:
+            row, result = await sync_to_async(claim)(request.user.pk, key, self.get_idempotency_scope())
+        except KeyInUse:
+            return self.key_in_use()
+        if result is not None:
+            return self.replay(result)
+
+        try:
+            response = await super().post(request, *args, **kwargs)
+        except Exception:
+            await sync_to_async(release)(row)
+            raise
+        if self.is_completed(response):
+            await sync_to_async(record)(row, response)
+        else:
+            await sync_to_async(release)(row)
+        return response
@@ -0,0 +1,187 @@
+"""Append-only, hash-chained journal of balance changes.
+
+Every ledger posting appends one ``JournalEntry`` per balance change, with
+the signed amount and the balance after it. An account's entries are
+numbered from 1 and each one's hash covers the previous entry's hash and
+its own fields. The account row keeps the number and hash of its latest
+entry, so editing, deleting, reordering or truncating entries all break
+the chain.
+
+Replaying an account's entries in order gives its balance. ``replay``
+streams the whole journal in ``(account, sequence)`` order, one account
+at a time, so memory does not grow with its size; ``verify`` merges that
+stream with the accounts table and reports the accounts that disagree.
+"""
+import hashlib
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Min
+
+from accounts.cache import invalidate
+from accounts.models import UserBankAccount
+
+from .models import JournalEntry
+
+GENESIS = ''
+# The only problem rebuild_balance repairs: the chain is intact and the
+# account points at its end, but the stored balance is not the replayed one.
+BALANCE_DRIFT = 'balance'
+
+Replay = namedtuple('Replay', ['account_id', 'balance', 'sequence', 'head', 'broken'])
+Drift = namedtuple('Drift', ['account_id', 'account_number', 'stored_balance', 'journal_balance', 'problem'])
+
+
+def _money(value):
+    return f'{Decimal(value):.2f}'
+
+
+def chain_hash(previous, account_id, sequence, transaction_id, amount, balance):
+    payload = '|'.join([
+        previous, str(account_id), str(sequence), str(transaction_id or ''), _money(amount), _money(balance),
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def chain(account_id, postings, opening, sequence=0, head=GENESIS):
+    """Build the entries for ``[(transaction_id, amount)]`` after ``(sequence, head)``.
+
+    ``opening`` is the balance before the first posting.
+    """
+    entries = []
+    balance = opening
+    for transaction_id, amount in postings:
+        sequence += 1
+        balance += amount
+        head = chain_hash(head, account_id, sequence, transaction_id, amount, balance)
+        entries.append(JournalEntry(account_id=account_id, sequence=sequence, transaction_id=transaction_id,
+                                    amount=amount, balance=balance, hash=head))
+    return entries
+
+
+class _Replayer:
+    def __init__(self, account_id):
+        self.account_id = account_id
+        self.balance = Decimal('0')
+        self.sequence = 0
+        self.head = GENESIS
+        self.broken = None
+
+    def add(self, sequence, transaction_id, amount, balance, hash):
+        self.balance += amount
+        if self.broken is None:
+            if sequence != self.sequence + 1:
+                self.broken = f'entry {self.sequence + 1} missing'
+            elif balance != self.balance:
+                self.broken = f'entry {sequence} balance {balance}, replayed {self.balance}'
+            elif hash != chain_hash(self.head, self.account_id, sequence, transaction_id, amount, balance):
+                self.broken = f'entry {sequence} hash mismatch'
+        self.sequence = sequence
+        self.head = hash
+
+    def result(self):
+        return Replay(self.account_id, self.balance, self.sequence, self.head, self.broken)
+
+
+def replay(first_id=None, last_id=None, chunk_size=5000):
+    """Yield a ``Replay`` for every account with entries, in account order."""
+    entries = JournalEntry.objects.order_by('account_id', 'sequence')
+    if first_id is not None:
+        entries = entries.filter(account_id__gte=first_id)
+    if last_id is not None:
+        entries = entries.filter(account_id__lte=last_id)
+    rows = entries.values_list('account_id', 'sequence', 'transaction_id', 'amount', 'balance', 'hash')
+
+    current = None
+    for account_id, *entry in rows.iterator(chunk_size=chunk_size):
+        if current is None or current.account_id != account_id:
+            if current is not None:
+                yield current.result()
+            current = _Replayer(account_id)
+        current.add(*entry)
+    if current is not None:
+        yield current.result()
+
+
+def _problem(account, replayed):
+    _, _, balance, sequence, head = account
+    if replayed.broken:
+        return replayed.broken
+    if (sequence, head) != (replayed.sequence, replayed.head):
+        return f'account points at entry {sequence}, journal ends at {replayed.sequence}'
+    if balance != replayed.balance:
+        return BALANCE_DRIFT
+    return None
+
+
+def _account_rows(queryset):
+    return queryset.values_list('pk', 'account_number', 'balance', 'journal_sequence', 'journal_hash')
+
+
+def _recheck(account_id):
+    # The two streams are read without locks, so a posting that committed
+    # between them looks like drift. Read both again under the row lock.
+    with transaction.atomic():
+        account = _account_rows(UserBankAccount.objects.select_for_update().filter(pk=account_id)).first()
+        if account is None:
+            return None
+        replayed = next(replay(account_id, account_id), None) or Replay(account_id, Decimal('0'), 0, GENESIS, None)
+        problem = _problem(account, replayed)
+    if problem is None:
+        return None
+    return Drift(account_id, account[1], account[2], replayed.balance, problem)
+
+
+def verify(first_id=None, last_id=None, chunk_size=5000):
+    """Return the ``Drift`` of every account in ``[first_id, last_id]`` that disagrees with the journal."""
+    accounts = UserBankAccount.objects.order_by('pk')
+    if first_id is not None:
+        accounts = accounts.filter(pk__gte=first_id)
+    if last_id is not None:
+        accounts = accounts.filter(pk__lte=last_id)
+
+    drifts = []
+    replays = replay(first_id, last_id, chunk_size)
+    replayed = next(replays, None)
+    for account in _account_rows(accounts).iterator(chunk_size=chunk_size):
+        account_id = account[0]
+        # Entries of accounts that no longer exist cannot be compared; skip them.
+        while replayed is not None and replayed.account_id < account_id:
+            replayed = next(replays, None)
+        if replayed is not None and replayed.account_id == account_id:
+            current = replayed
+        else:
+            current = Replay(account_id, Decimal('0'), 0, GENESIS, None)
+        if _problem(account, current) is not None:
+            drift = _recheck(account_id)
+            if drift is not None:
+                drifts.append(drift)
+    return drifts
+
+
+def rebuild_balance(drift):
+    """Set a drifted account's balance to its journal's, unless it moved since ``verify``."""
+    with transaction.atomic():
+        accounts = UserBankAccount.objects.filter(pk=drift.account_id, balance=drift.stored_balance)
+        user_id = accounts.select_for_update().values_list('user_id', flat=True).first()
+        if user_id is None:
+            return False
+        accounts.update(balance=drift.journal_balance)
+        transaction.on_commit(lambda: invalidate([user_id], kinds=('account',)))
+    return True
+
+
+def verify_range(bounds):
+    """``verify`` for a ``(first_id, last_id, chunk_size)`` tuple, for process pools."""
+    return verify(*bounds)
+
+
+def id_ranges(parts):
+    """Split the account ids into at most ``parts`` contiguous ``(first, last)`` ranges."""
+    bounds = UserBankAccount.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    first, last = bounds['first'], bounds['last']
+    step = max(1, -(-(last - first + 1) // parts))
+    return [(start, min(start + step - 1, last)) for start in range(first, last + 1, step)]
@@ -0,0 +1,583 @@
+"""Every change to ``UserBankAccount.balance`` goes through this module.
+
+Each posting writes its ``Transaction`` row and the balance change in one
+database transaction. Balances are changed with ``F()`` arithmetic in a
+single UPDATE, and debits only succeed while the balance covers them, so
+concurrent requests can neither lose an update nor overdraw an account.
+The UPDATE itself is the only row lock taken.
+
+Every posting also folds its credit or debit into the account's
+``DailyBalance`` row for today and appends it to the account's journal
+(see ``transactions.journal``), inside the same database transaction.
+Withdrawals, transfers and loan requests are counted towards the velocity
+rules (see ``transactions.risk``) once they commit.
+Loan postings keep the account's loan exposure fields (active loan count,
+outstanding principal, last change) current in the same UPDATE as the
+balance.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import (BigIntegerField, Case, CharField, DecimalField,
+                              F, IntegerField, Value, When)
+from django.utils import timezone
+
+from accounts.cache import invalidate
+from accounts.models import UserBankAccount
+
+from .constants import (DEPOSIT, INTEREST, LOAN, LOAN_PAID, LOAN_REJECTED,
+                        RECEIVE, TRANSFER, WITHDRAWAL)
+from . import risk
+from .journal import chain
+from .models import DailyBalance, JournalEntry, Transaction
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+class LoanNotPayable(Exception):
+    pass
+
+
+class LoanNotPending(Exception):
+    pass
+
+
+class InvalidAmount(ValueError):
+    pass
+
+
+class UnknownAccounts(Exception):
+    def __init__(self, account_numbers):
+        self.account_numbers = account_numbers
+        super().__init__(f'Unknown account numbers: {", ".join(account_numbers)}')
+
+
+class OwnAccount(ValueError):
+    pass
+
+
+# Bounds the size of the CASE expression in one bulk UPDATE statement.
+BULK_UPDATE_CHUNK = 500
+CENT = Decimal('0.01')
+# The largest value Transaction.amount (max_digits=12, decimal_places=2) holds.
+MAX_AMOUNT = Decimal('9999999999.99')
+
+
+def check_amount(amount):
+    """Return ``amount`` as a ``Decimal`` if it can be posted as one row.
+
+    Raises ``InvalidAmount`` unless it is finite, positive, in whole cents
+    and fits ``Transaction.amount``; a row would otherwise store a rounded
+    amount while the balance moved by the exact one.
+    """
+    try:
+        amount = Decimal(amount)
+    except (InvalidOperation, TypeError, ValueError):
+        raise InvalidAmount(f'invalid amount {amount!r}')
+    if not amount.is_finite():
+        raise InvalidAmount(f'invalid amount {amount}')
+    if amount <= 0:
+        raise InvalidAmount('amount must be positive')
+    if amount > MAX_AMOUNT:
+        raise InvalidAmount(f'amount must not be over {MAX_AMOUNT}')
+    if amount != amount.quantize(CENT):
+        raise InvalidAmount('amount must not have more than 2 decimal places')
+    return amount
+
+
+def _changed(*accounts):
+    """Drop the cached copies of ``accounts`` once the posting commits."""
+    user_ids = [account.user_id for account in accounts if account.user_id is not None]
+    transaction.on_commit(lambda: invalidate(user_ids, kinds=('account',)))
+
+
+def _velocity(account_id, transaction_type, amount, count=1):
+    if risk.enabled():
+        transaction.on_commit(lambda: risk.record(account_id, transaction_type, amount, count))
+
+
+def _balance(account_id):
+    return UserBankAccount.objects.values_list('balance', flat=True).get(pk=account_id)
+
+
+def _credit(account_id, amount, **fields):
+    UserBankAccount.objects.filter(pk=account_id).update(balance=F('balance') + amount, **fields)
+    return _balance(account_id)
+
+
+def _credit_many(amounts, loans=None, now=None):
+    """Add ``{account_id: amount}`` to balances and return the new balances.
+
+    With ``loans`` (``{account_id: count}``) the amounts are loan payouts
+    and the accounts' loan exposure moves in the same UPDATE.
+    """
+    ids = sorted(amounts)
+    for start in range(0, len(ids), BULK_UPDATE_CHUNK):
+        chunk = ids[start:start + BULK_UPDATE_CHUNK]
+        credited = _case('pk', {pk: amounts[pk] for pk in chunk}, DecimalField(max_digits=12, decimal_places=2))
+        fields = {'balance': F('balance') + credited}
+        if loans is not None:
+            fields.update(
+                active_loan_count=F('active_loan_count') + _case(
+                    'pk', {pk: loans[pk] for pk in chunk}, IntegerField()
+                ),
+                outstanding_loan_principal=F('outstanding_loan_principal') + credited,
+                loans_updated_at=now,
+            )
+        UserBankAccount.objects.filter(pk__in=chunk).update(**fields)
+    return dict(UserBankAccount.objects.filter(pk__in=ids).values_list('pk', 'balance'))
+
+
+def _lock(account_ids):
+    """Lock the account rows in primary key order, the order ``transfer`` takes them in.
+
+    SQLite has no row locks (the first write locks the whole database), and
+    reading first would only make that write fail to upgrade.
+    """
+    if connection.features.has_select_for_update:
+        list(UserBankAccount.objects.select_for_update().filter(pk__in=account_ids).order_by('pk').values_list('pk'))
+
+
+def _case(pk_field, values, output_field):
+    return Case(*[When(**{pk_field: pk}, then=Value(value)) for pk, value in values.items()],
+                output_field=output_field)
+
+
+def _record_daily(changes):
+    """Fold ``{account_id: (credit, debit, count, closing_balance)}`` into today's summaries.
+
+    Must run inside the posting's atomic block, after the balance UPDATE,
+    so the account rows are locked and no other posting can create the
+    same summary row concurrently.
+    """
+    today = timezone.localdate()
+    money = DecimalField(max_digits=12, decimal_places=2)
+    ids = sorted(changes)
+    for start in range(0, len(ids), BULK_UPDATE_CHUNK):
+        chunk = {pk: changes[pk] for pk in ids[start:start + BULK_UPDATE_CHUNK]}
+        updated = DailyBalance.objects.filter(account_id__in=chunk, date=today).update(
+            credits=F('credits') + _case('account_id', {pk: c[0] for pk, c in chunk.items()}, money),
+            debits=F('debits') + _case('account_id', {pk: c[1] for pk, c in chunk.items()}, money),
+            transaction_count=F('transaction_count') + _case(
+                'account_id', {pk: c[2] for pk, c in chunk.items()}, IntegerField()
+            ),
+        )
+        if updated == len(chunk):
+            continue
+        existing = set(DailyBalance.objects.filter(account_id__in=chunk, date=today)
+                       .values_list('account_id', flat=True))
+        DailyBalance.objects.bulk_create([
+            DailyBalance(
+                account_id=pk,
+                date=today,
+                opening_balance=closing - credit + debit,
+                credits=credit,
+                debits=debit,
+                transaction_count=count,
+            )
+            for pk, (credit, debit, count, closing) in chunk.items() if pk not in existing
+        ])
+
+
+def _journal(postings, closing):
+    """Append ``[(account_id, transaction_id, amount)]`` to the accounts' journals.
+
+    ``closing`` maps every account to its balance after all of them. Like
+    ``_record_daily`` this runs after the balance UPDATEs, whose row locks
+    keep the chain heads from moving until the posting commits.
+    """
+    grouped = defaultdict(list)
+    for account_id, transaction_id, amount in postings:
+        grouped[account_id].append((transaction_id, amount))
+    heads = UserBankAccount.objects.filter(pk__in=grouped).values_list('pk', 'journal_sequence', 'journal_hash')
+    entries = []
+    for account_id, sequence, head in heads:
+        moved = grouped[account_id]
+        opening = closing[account_id] - sum(amount for _, amount in moved)
+        entries += chain(account_id, moved, opening, sequence, head)
+    JournalEntry.objects.bulk_create(entries, batch_size=BULK_UPDATE_CHUNK)
+
+    latest = {entry.account_id: entry for entry in entries}
+    ids = sorted(latest)
+    for start in range(0, len(ids), BULK_UPDATE_CHUNK):
+        chunk = ids[start:start + BULK_UPDATE_CHUNK]
+        UserBankAccount.objects.filter(pk__in=chunk).update(
+            journal_sequence=_case('pk', {pk: latest[pk].sequence for pk in chunk}, BigIntegerField()),
+            journal_hash=_case('pk', {pk: latest[pk].hash for pk in chunk}, CharField()),
+        )
+
+
+def _debit(account_id, amount, **fields):
+    updated = UserBankAccount.objects.filter(pk=account_id, balance__gte=amount).update(
+        balance=F('balance') - amount, **fields
+    )
+    if not updated:
+        raise InsufficientFunds(f'Account {account_id} cannot cover {amount}')
+    return _balance(account_id)
+
+
+def _exposure(loans, principal, now):
+    """UPDATE arguments that shift an account's loan exposure."""
+    return {
+        'active_loan_count': F('active_loan_count') + loans,
+        'outstanding_loan_principal': F('outstanding_loan_principal') + principal,
+        'loans_updated_at': now,
+    }
+
+
+def _apply_exposure(account, loans, principal, now):
+    account.active_loan_count += loans
+    account.outstanding_loan_principal += principal
+    account.loans_updated_at = now
+
+
+def deposit(account, amount, transaction_type=DEPOSIT):
+    with transaction.atomic():
+        balance = _credit(account.pk, amount)
+        txn = Transaction.objects.create(
+            account=account,
+            amount=amount,
+            transaction_type=transaction_type,
+            balance_after_transaction=balance,
+        )
+        _record_daily({account.pk: (amount, 0, 1, balance)})
+        _journal([(account.pk, txn.pk, amount)], {account.pk: balance})
+        _changed(account)
+    account.balance = balance
+    return txn
+
+
+def withdraw(account, amount, transaction_type=WITHDRAWAL):
+    with transaction.atomic():
+        balance = _debit(account.pk, amount)
+        txn = Transaction.objects.create(
+            account=account,
+            amount=amount,
+            transaction_type=transaction_type,
+            balance_after_transaction=balance,
+        )
+        _record_daily({account.pk: (0, amount, 1, balance)})
+        _journal([(account.pk, txn.pk, -amount)], {account.pk: balance})
+        _changed(account)
+        _velocity(account.pk, transaction_type, amount)
+    account.balance = balance
+    return txn
+
+
+def transfer(from_account, to_account, amount):
+    """Move ``amount`` between two accounts and return both legs."""
+    with transaction.atomic():
+        # Touch the rows in primary key order so that two opposite
+        # transfers cannot deadlock on each other.
+        if from_account.pk <= to_account.pk:
+            from_balance = _debit(from_account.pk, amount)
+            to_balance = _credit(to_account.pk, amount)
+        else:
+            to_balance = _credit(to_account.pk, amount)
+            from_balance = _debit(from_account.pk, amount)
+        sent = Transaction.objects.create(
+            account=from_account,
+            to_account=to_account,
+            amount=amount,
+            transaction_type=TRANSFER,
+            balance_after_transaction=from_balance,
+        )
+        received = Transaction.objects.create(
+            account=to_account,
+            to_account=from_account,
+            amount=amount,
+            transaction_type=RECEIVE,
+            balance_after_transaction=to_balance,
+        )
+        if from_account.pk == to_account.pk:
+            _record_daily({from_account.pk: (amount, amount, 2, to_balance)})
+        else:
+            _record_daily({
+                from_account.pk: (0, amount, 1, from_balance),
+                to_account.pk: (amount, 0, 1, to_balance),
+            })
+        # Debited first when paying yourself, so the credit holds the closing balance.
+        closing = {from_account.pk: from_balance, to_account.pk: to_balance}
+        _journal([(from_account.pk, sent.pk, -amount), (to_account.pk, received.pk, amount)], closing)
+        _changed(from_account, to_account)
+        _velocity(from_account.pk, TRANSFER, amount)
+    from_account.balance = from_balance
+    to_account.balance = to_balance
+    return sent, received
+
+
+def request_loan(account, amount):
+    """Record a loan request. The balance only changes once it is approved."""
+    now = timezone.now()
+    with transaction.atomic():
+        txn = Transaction.objects.create(
+            account=account,
+            amount=amount,
+            transaction_type=LOAN,
+            balance_after_transaction=account.balance,
+        )
+        UserBankAccount.objects.filter(pk=account.pk).update(loans_updated_at=now)
+        _changed(account)
+        _velocity(account.pk, LOAN, amount)
+    account.loans_updated_at = now
+    return txn
+
+
+def approve_loan(loan):
+    """Approve a pending loan, pay it out and save the loan's other fields."""
+    now = timezone.now()
+    with transaction.atomic():
+        # The guard makes a second approval of the same loan a no-op.
+        updated = Transaction.objects.filter(
+            pk=loan.pk, transaction_type=LOAN, loan_approved=False
+        ).update(loan_approved=True)
+        if not updated:
+            raise LoanNotPending(f'Loan {loan.pk} is not a pending loan')
+        balance = _credit(loan.account_id, loan.amount, **_exposure(1, loan.amount, now))
+        loan.loan_approved = True
+        loan.balance_after_transaction = balance
+        loan.save()
+        _record_daily({loan.account_id: (loan.amount, 0, 1, balance)})
+        _journal([(loan.account_id, loan.pk, loan.amount)], {loan.account_id: balance})
+        _changed(loan.account)
+    loan.account.balance = balance
+    _apply_exposure(loan.account, 1, loan.amount, now)
+    return loan
+
+
+def _pending_loans(loan_ids):
+    # Locking the loan rows makes a concurrent approve_loan of one of them
+    # wait, then find it no longer pending.
+    return list(
+        Transaction.objects.select_for_update(of=('self',))
+        .select_related('account__user')
+        .filter(pk__in=loan_ids, transaction_type=LOAN, loan_approved=False)
+        .order_by('account_id', 'pk')
+    )
+
+
+def _shared_accounts(loans):
+    """Point loans of the same account at one account instance and return them."""
+    accounts = {}
+    for loan in loans:
+        loan.account = accounts.setdefault(loan.account_id, loan.account)
+    return accounts
+
+
+def approve_loans(loan_ids):
+    """Approve and pay out the pending loans among ``loan_ids`` at once.
+
+    The accounts are credited, and their exposure raised, with chunked CASE
+    updates and the loan rows are saved with one ``bulk_update``, all in
+    one database transaction. Ids that are not pending loans are skipped.
+    Returns the approved loans with ``account`` and its ``user`` loaded.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        loans = _pending_loans(loan_ids)
+        if not loans:
+            return []
+        accounts = _shared_accounts(loans)
+        credits = defaultdict(int)
+        counts = defaultdict(int)
+        for loan in loans:
+            credits[loan.account_id] += loan.amount
+            counts[loan.account_id] += 1
+        balances = _credit_many(credits, loans=counts, now=now)
+
+        running = {pk: balances[pk] - credited for pk, credited in credits.items()}
+        for loan in loans:
+            running[loan.account_id] += loan.amount
+            loan.loan_approved = True
+            loan.balance_after_transaction = running[loan.account_id]
+        Transaction.objects.bulk_update(loans, ['loan_approved', 'balance_after_transaction'],
+                                        batch_size=BULK_UPDATE_CHUNK)
+        _record_daily({pk: (credited, 0, counts[pk], balances[pk]) for pk, credited in credits.items()})
+        _journal([(loan.account_id, loan.pk, loan.amount) for loan in loans], balances)
+        _changed(*accounts.values())
+
+    for pk, account in accounts.items():
+        account.balance = balances[pk]
+        _apply_exposure(account, counts[pk], credits[pk], now)
+    return loans
+
+
+def reject_loans(loan_ids):
+    """Mark the pending loans among ``loan_ids`` as rejected. No money moves."""
+    now = timezone.now()
+    with transaction.atomic():
+        loans = _pending_loans(loan_ids)
+        if not loans:
+            return []
+        accounts = _shared_accounts(loans)
+        Transaction.objects.filter(pk__in=[loan.pk for loan in loans]).update(transaction_type=LOAN_REJECTED)
+        # The loan list cache is keyed on loans_updated_at.
+        UserBankAccount.objects.filter(pk__in=accounts).update(loans_updated_at=now)
+        _changed(*accounts.values())
+
+    for loan in loans:
+        loan.transaction_type = LOAN_REJECTED
+    for account in accounts.values():
+        account.loans_updated_at = now
+    return loans
+
+
+def credit(txn):
+    """Apply a new admin-entered transaction to its account and save it.
+
+    A pending loan is saved like ``request_loan`` saves one; its money only
+    moves once ``approve_loan`` pays it out.
+    """
+    if txn.transaction_type == LOAN and not txn.loan_approved:
+        now = timezone.now()
+        with transaction.atomic():
+            txn.balance_after_transaction = _balance(txn.account_id)
+            txn.save()
+            UserBankAccount.objects.filter(pk=txn.account_id).update(loans_updated_at=now)
+            _changed(txn.account)
+        txn.account.loans_updated_at = now
+        return txn
+    fields = {}
+    if txn.transaction_type in (LOAN, LOAN_PAID):
+        fields['loans_updated_at'] = timezone.now()
+    with transaction.atomic():
+        balance = _credit(txn.account_id, txn.amount, **fields)
+        txn.balance_after_transaction = balance
+        txn.save()
+        _record_daily({txn.account_id: (txn.amount, 0, 1, balance)})
+        _journal([(txn.account_id, txn.pk, txn.amount)], {txn.account_id: balance})
+        _changed(txn.account)
+    txn.account.balance = balance
+    if fields:
+        txn.account.loans_updated_at = fields['loans_updated_at']
+    return txn
+
+
+def repay_loan(loan):
+    now = timezone.now()
+    with transaction.atomic():
+        # Flipping the type first makes a second, concurrent repayment of
+        # the same loan find nothing to pay.
+        updated = Transaction.objects.filter(
+            pk=loan.pk, transaction_type=LOAN, loan_approved=True
+        ).update(transaction_type=LOAN_PAID)
+        if not updated:
+            raise LoanNotPayable(f'Loan {loan.pk} is not an approved, unpaid loan')
+        balance = _debit(loan.account_id, loan.amount, **_exposure(-1, -loan.amount, now))
+        Transaction.objects.filter(pk=loan.pk).update(balance_after_transaction=balance)
+        _record_daily({loan.account_id: (0, loan.amount, 1, balance)})
+        _journal([(loan.account_id, loan.pk, -loan.amount)], {loan.account_id: balance})
+        _changed(loan.account)
+    loan.transaction_type = LOAN_PAID
+    loan.balance_after_transaction = balance
+    loan.account.balance = balance
+    _apply_exposure(loan.account, -1, -loan.amount, now)
+    return loan
+
+
+def bulk_transfer(from_account, lines):
+    """Pay many recipients from one account in a fixed number of statements.
+
+    ``lines`` is a list of ``(account_number, amount)``. Recipients are
+    resolved with one query, the payer is debited once for the total, the
+    recipients are credited with chunked CASE updates and both legs of
+    every payment are inserted with ``bulk_create``. Returns the recipient
+    accounts (with ``user`` loaded) keyed by account number. A line whose
+    amount ``check_amount`` rejects raises ``InvalidAmount``, and one that
+    pays the payer raises ``OwnAccount``, before anything is posted.
+    """
+    for line, (number, amount) in enumerate(lines, start=1):
+        try:
+            check_amount(amount)
+        except InvalidAmount as exc:
+            raise InvalidAmount(f'Line {line}: {exc}')
+        if number == from_account.account_number:
+            raise OwnAccount(f'Line {line}: cannot transfer to the paying account')
+    numbers = {number for number, _ in lines}
+    recipients = UserBankAccount.objects.select_related('user').in_bulk(
+        numbers, field_name='account_number'
+    )
+    missing = sorted(numbers - recipients.keys())
+    if missing:
+        raise UnknownAccounts(missing)
+
+    total = sum(amount for _, amount in lines)
+    credits = defaultdict(int)
+    counts = defaultdict(int)
+    for number, amount in lines:
+        credits[recipients[number].pk] += amount
+        counts[recipients[number].pk] += 1
+
+    with transaction.atomic():
+        _lock([from_account.pk, *credits])
+        from_balance = _debit(from_account.pk, total)
+        balances = _credit_many(credits)
+
+        # Walk the legs in order to give every row its own running balance.
+        running = {pk: balances[pk] - credited for pk, credited in credits.items()}
+        payer_running = from_balance + total
+        rows = []
+        for number, amount in lines:
+            to_account = recipients[number]
+            payer_running -= amount
+            running[to_account.pk] += amount
+            rows.append(Transaction(
+                account=from_account,
+                to_account=to_account,
+                amount=amount,
+                transaction_type=TRANSFER,
+                balance_after_transaction=payer_running,
+            ))
+            rows.append(Transaction(
+                account=to_account,
+                to_account=from_account,
+                amount=amount,
+                transaction_type=RECEIVE,
+                balance_after_transaction=running[to_account.pk],
+            ))
+        Transaction.objects.bulk_create(rows, batch_size=BULK_UPDATE_CHUNK)
+
+        changes = {pk: [credited, 0, counts[pk], balances[pk]] for pk, credited in credits.items()}
+        changes[from_account.pk] = [0, total, len(lines), from_balance]
+        _record_daily(changes)
+        _journal(
+            [(row.account_id, row.pk, -row.amount if row.transaction_type == TRANSFER else row.amount) for row in rows],
+            {pk: change[3] for pk, change in changes.items()},
+        )
+        _changed(from_account, *recipients.values())
+        _velocity(from_account.pk, TRANSFER, total, count=len(lines))
+
+    from_account.balance = from_balance
+    for to_account in recipients.values():
+        to_account.balance = balances[to_account.pk]
+    return recipients
+
+
+def pay_interest(interest):
+    """Credit ``{account: amount}`` of interest and return the new rows.
+
+    Works like the recipient side of ``bulk_transfer``: chunked CASE
+    updates for the balances and one ``bulk_create`` for the rows.
+    """
+    amounts = {account.pk: amount for account, amount in interest.items()}
+    with transaction.atomic():
+        balances = _credit_many(amounts)
+        rows = Transaction.objects.bulk_create([
+            Transaction(
+                account=account,
+                amount=amount,
+                transaction_type=INTEREST,
+                balance_after_transaction=balances[account.pk],
+            )
+            for account, amount in interest.items()
+        ], batch_size=BULK_UPDATE_CHUNK)
+        _record_daily({pk: (amount, 0, 1, balances[pk]) for pk, amount in amounts.items()})
+        _journal([(row.account_id, row.pk, row.amount) for row in rows], balances)
+        _changed(*interest)
+
+    for account in interest:
+        account.balance = balances[account.pk]
+    return rows
@@ -0,0 +1,45 @@
+"""Per-account loan queries served from the account's loan exposure fields.
+
+``UserBankAccount.loans_updated_at`` changes whenever one of the account's
+loans is created, approved or repaid (see ``ledger``). It is part of the
+cache key of the loan list, so a changed list is simply read under a new
+key, and an account that never had a loan needs no query at all.
+"""
+from django.core.cache import cache
+
+from .constants import LOAN
+from .models import Transaction
+
+LOAN_LIST_CACHE_TIMEOUT = 300
+
+
+def _loan_list_key(account):
+    return f'loans:{account.pk}:{account.loans_updated_at.timestamp()}'
+
+
+def _loans(account):
+    return Transaction.objects.filter(account=account, transaction_type=LOAN).order_by('timestamp', 'id')
+
+
+def loan_list(account):
+    """The account's unpaid loans, pending or approved, oldest first."""
+    if account.loans_updated_at is None:
+        return []
+    key = _loan_list_key(account)
+    loans = cache.get(key)
+    if loans is None:
+        loans = list(_loans(account))
+        cache.set(key, loans, LOAN_LIST_CACHE_TIMEOUT)
+    return loans
+
+
+async def aloan_list(account):
+    """Async version of :func:`loan_list`."""
+    if account.loans_updated_at is None:
+        return []
+    key = _loan_list_key(account)
+    loans = await cache.aget(key)
+    if loans is None:
+        loans = [loan async for loan in _loans(account)]
+        await cache.aset(key, loans, LOAN_LIST_CACHE_TIMEOUT)
+    return loans
@@ -0,0 +1,70 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions.constants import DEPOSIT, WITHDRAWAL
+from transactions.models import Transaction
+
+FILE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Render transactions_report.html with in-memory rows through a plain '
+        'loader and through the cached loader, and compare render times.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user = User(pk=1, username='bench', first_name='Bench', last_name='User')
+        account = UserBankAccount(pk=1, user=user, account_number='90001', balance=Decimal('1000.00'))
+        User.account.related.set_cached_value(user, account)
+        request = RequestFactory().get('/transaction/report/')
+        request.user = user
+
+        for rows in options['rows']:
+            now = timezone.now()
+            transactions = [
+                Transaction(pk=i, account=account, amount=Decimal('100.00'),
+                            balance_after_transaction=Decimal(i * 100),
+                            transaction_type=DEPOSIT if i % 3 else WITHDRAWAL,
+                            timestamp=now - timedelta(minutes=i))
+                for i in range(rows)
+            ]
+            context = {'object_list': transactions, 'account': account}
+            for label, loaders in [('plain', FILE_LOADERS),
+                                   ('cached', [('django.template.loaders.cached.Loader', FILE_LOADERS)])]:
+                engine = self.engine(loaders)
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    engine.get_template('transactions_report.html').render(context, request)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'{rows} rows, {label} loader: median {statistics.median(timings):.1f}ms, '
+                    f'first {timings[0]:.1f}ms, min {min(timings):.1f}ms'
+                )
+
+    def engine(self, loaders):
+        options = dict(settings.TEMPLATES[0]['OPTIONS'], loaders=loaders)
+        return DjangoTemplates({
+            'NAME': 'bench',
+            'DIRS': settings.TEMPLATES[0]['DIRS'],
+            'APP_DIRS': False,
+            'OPTIONS': options,
+        })
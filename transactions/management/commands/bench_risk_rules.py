@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from transactions import risk
+from transactions.constants import TRANSFER, WITHDRAWAL
+
+RULES = [
+    {'name': 'transfer_burst', 'types': ['transfer'], 'metric': 'count', 'window': 600, 'limit': 1000},
+    {'name': 'hourly_out', 'types': ['withdrawal', 'transfer'], 'metric': 'amount', 'window': 3600,
+     'limit': 10 ** 9},
+    {'name': 'daily_withdrawals', 'types': ['withdrawal'], 'metric': 'amount', 'window': 86400, 'limit': 10 ** 9},
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time recording postings and evaluating velocity rules against the '
+        'configured cache, with counters spread over the rules\' windows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=100)
+        parser.add_argument('--postings', type=int, default=50, help='Postings per account spread over a day.')
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--rules-file', help='Benchmark these rules instead of the built-in set.')
+
+    def handle(self, *args, **options):
+        if options['rules_file']:
+            with open(options['rules_file']) as fileobj:
+                rules = risk.parse_rules(json.load(fileobj))
+        else:
+            rules = risk.parse_rules(RULES)
+        accounts, iterations = options['accounts'], options['iterations']
+        # Ids well past real accounts, so the counters do not mix with theirs.
+        first_id = 10 ** 12
+        now = time.time()
+
+        timings = []
+        for account in range(accounts):
+            for posting in range(options['postings']):
+                started = time.perf_counter()
+                risk.record(first_id + account, (TRANSFER, WITHDRAWAL)[posting % 2], Decimal('100.00'),
+                            now=now - posting * 86400 / options['postings'])
+                timings.append(time.perf_counter() - started)
+        self.report('record', timings)
+
+        for label, check in [
+            ('breached_rule', lambda account, kind: risk.breached_rule(account, kind, Decimal('100.00'), rules)),
+            ('evaluate', lambda account, kind: risk.evaluate(account, kind, Decimal('100.00'), rules)),
+        ]:
+            timings = []
+            for i in range(iterations):
+                account, kind = first_id + i % accounts, (TRANSFER, WITHDRAWAL)[i % 2]
+                started = time.perf_counter()
+                check(account, kind)
+                timings.append(time.perf_counter() - started)
+            self.report(label, timings)
+
+        cache.delete_many([
+            risk._key(metric, first_id + account, kind, size, int(now // size) - back)
+            for account in range(accounts) for kind in (TRANSFER, WITHDRAWAL) for metric in risk.METRICS
+            for size, longest in risk.GRANULARITIES for back in range(longest // size + 2)
+        ])
+
+    def report(self, label, timings):
+        timings = sorted(seconds * 1e6 for seconds in timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f'{label}: {len(timings)} calls, median {statistics.median(timings):.1f}us, '
+            f'p99 {p99:.1f}us, max {timings[-1]:.1f}us'
+        )
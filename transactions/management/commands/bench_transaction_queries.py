@@ -0,0 +1,166 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions.constants import LOAN, TRANSACTION_TYPE
+from transactions.models import Transaction
+from transactions.reports import day_start
+
+BENCH_PREFIX = 'qbench_'
+BENCH_DATABASE = 'bench'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed transactions and compare the query plans and latency of the '
+        'report and loan queries before (timestamp__date filters, foreign key '
+        'index only) and after (half-open ranges, composite indexes). Runs '
+        'against the database of BENCH_DATABASE_URL; the indexes are dropped '
+        'while it runs, so it refuses the default database without --yes-i-know.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200_000)
+        parser.add_argument('--accounts', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--batch-size', type=int, default=50_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-seed', action='store_true',
+                            help='Reuse rows seeded by a previous run.')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the benchmark accounts and their rows afterwards.')
+        parser.add_argument('--yes-i-know', action='store_true',
+                            help='Run against the default database when BENCH_DATABASE_URL is not set.')
+
+    def handle(self, *args, **options):
+        self.using = BENCH_DATABASE if BENCH_DATABASE in connections.databases else 'default'
+        connection = connections[self.using]
+        target = connection.settings_dict
+        self.stdout.write(
+            f"Target database: {self.using} ({connection.vendor} {target['NAME']}"
+            f"{' on ' + target['HOST'] if target.get('HOST') else ''})"
+        )
+        if self.using == 'default' and not options['yes_i_know']:
+            raise CommandError(
+                'Refusing to seed rows into and drop indexes on the default database. Set '
+                'BENCH_DATABASE_URL to a dedicated database, or pass --yes-i-know.'
+            )
+
+        accounts = self.bench_accounts(options['accounts'])
+        if not options['skip_seed']:
+            self.seed(accounts, options['rows'], options['days'], options['batch_size'])
+
+        account = accounts[0]
+        today = timezone.localdate()
+        start_date, end_date = today - timedelta(days=30), today
+        start, end = day_start(start_date), day_start(end_date + timedelta(days=1))
+
+        transactions = Transaction.objects.using(self.using)
+        before = {
+            'report': transactions.filter(
+                account=account, timestamp__date__gte=start_date, timestamp__date__lte=end_date
+            ).order_by('timestamp').distinct(),
+            'loan count': transactions.filter(account=account, transaction_type=LOAN, loan_approved=True),
+        }
+        after = {
+            'report': transactions.filter(
+                account=account, timestamp__gte=start, timestamp__lt=end
+            ).order_by('timestamp', 'id'),
+            'loan count': transactions.filter(account=account, transaction_type=LOAN, loan_approved=True),
+        }
+
+        with self.legacy_indexes():
+            self.run_phase('before', before, options['repeat'])
+        self.run_phase('after', after, options['repeat'])
+
+        if options['cleanup']:
+            User.objects.using(self.using).filter(username__startswith=BENCH_PREFIX).delete()
+
+    def bench_accounts(self, count):
+        users, bank_accounts = User.objects.using(self.using), UserBankAccount.objects.using(self.using)
+        existing = list(bank_accounts.filter(user__username__startswith=BENCH_PREFIX).order_by('pk'))
+        if len(existing) >= count:
+            return existing[:count]
+        users.bulk_create(
+            [User(username=f'{BENCH_PREFIX}{i}') for i in range(len(existing), count)],
+            ignore_conflicts=True,
+        )
+        bank_accounts.bulk_create([
+            UserBankAccount(user=user, account_type='Savings', account_number=user.username, gender='Male')
+            for user in users.filter(username__startswith=BENCH_PREFIX, account__isnull=True)
+        ])
+        return list(bank_accounts.filter(user__username__startswith=BENCH_PREFIX).order_by('pk'))[:count]
+
+    def seed(self, accounts, rows, days, batch_size):
+        # Raw inserts so that timestamps can be spread over the period;
+        # bulk_create would overwrite them through auto_now_add.
+        connection = connections[self.using]
+        meta = Transaction._meta
+        columns = ['account_id', 'transaction_type', 'amount', 'balance_after_transaction',
+                   'timestamp', 'loan_approved']
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        types = [value for value, _ in TRANSACTION_TYPE]
+        now = timezone.now()
+        period = days * 86400
+        started = time.perf_counter()
+        inserted = 0
+        with connection.cursor() as cursor:
+            while inserted < rows:
+                batch = []
+                for _ in range(min(batch_size, rows - inserted)):
+                    amount = Decimal(random.randint(100, 100_000))
+                    batch.append((
+                        random.choice(accounts).pk,
+                        random.choice(types),
+                        connection.ops.adapt_decimalfield_value(amount, 12, 2),
+                        connection.ops.adapt_decimalfield_value(amount, 12, 2),
+                        connection.ops.adapt_datetimefield_value(now - timedelta(seconds=random.randrange(period))),
+                        random.random() < 0.5,
+                    ))
+                cursor.executemany(sql, batch)
+                inserted += len(batch)
+                self.stdout.write(f'seeded {inserted}/{rows} ({inserted / (time.perf_counter() - started):.0f} rows/s)')
+
+    @contextmanager
+    def legacy_indexes(self):
+        """Swap the composite indexes for the old single foreign key index."""
+        legacy = models.Index(fields=['account'], name='txn_bench_account_idx')
+        connection = connections[self.using]
+        with connection.schema_editor() as editor:
+            for index in Transaction._meta.indexes:
+                editor.remove_index(Transaction, index)
+            editor.add_index(Transaction, legacy)
+        try:
+            yield
+        finally:
+            with connection.schema_editor() as editor:
+                editor.remove_index(Transaction, legacy)
+                for index in Transaction._meta.indexes:
+                    editor.add_index(Transaction, index)
+
+    def run_phase(self, label, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {label} =='))
+        for name, queryset in queries.items():
+            run = queryset.count if name == 'loan count' else (lambda qs=queryset: list(qs.all()))
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f'{name}: median {statistics.median(timings):.2f}ms, p95 {p95:.2f}ms')
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import UserBankAccount
+from transactions import ledger
+from transactions.bulk import (check_recipients, parse_transfer_file,
+                               run_bulk_transfer)
+
+
+class Command(BaseCommand):
+    help = (
+        'Pay every (account_number, amount) row of a CSV or JSON file from one '
+        'account, posting each batch atomically.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('from_account_number')
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            from_account = UserBankAccount.objects.select_related('user').get(
+                account_number=options['from_account_number']
+            )
+        except UserBankAccount.DoesNotExist:
+            raise CommandError(f"Account {options['from_account_number']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                lines = parse_transfer_file(fileobj, options['path'])
+            check_recipients(from_account, lines)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        posted = 0
+        try:
+            for number, stats in enumerate(run_bulk_transfer(from_account, lines, options['batch_size']), start=1):
+                posted += stats['size']
+                self.stdout.write(
+                    f"batch {number}: {stats['size']} transfers, {stats['amount']} total, "
+                    f"{stats['seconds']:.3f}s ({stats['per_second']:.0f} transfers/s)"
+                )
+        except (ledger.UnknownAccounts, ledger.InsufficientFunds, ledger.InvalidAmount, ledger.OwnAccount) as exc:
+            raise CommandError(f'Stopped after {posted} of {len(lines)} transfers: {exc}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{posted} transfers posted, balance now {from_account.balance}'
+        ))
@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from transactions.end_of_day import (CHUNK_ACCOUNTS, finish_run, run_partition,
+                                     start_run)
+from transactions.statements import STATEMENT_FORMATS
+
+
+class Command(BaseCommand):
+    help = (
+        "Credit a day's interest to every savings account, and optionally write "
+        "the day's statements, with the account id range split over worker "
+        "processes. An interrupted run is resumed where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_ACCOUNTS, help='Accounts per transaction.')
+        parser.add_argument('--rate', type=Decimal, help='Yearly interest rate for a new run, e.g. 0.03.')
+        parser.add_argument('--statements-dir', help="Write the day's statements under this directory.")
+        parser.add_argument('--format', choices=sorted(STATEMENT_FORMATS), default='csv')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        # A few ranges per worker, so one dense range does not hold up the rest.
+        run = start_run(workers * 4, options['rate'])
+        if run is None:
+            self.stdout.write("Today's end-of-day run has already finished")
+            return
+
+        statements_dir = ''
+        if options['statements_dir']:
+            statements_dir = os.path.join(options['statements_dir'], run.business_date.isoformat())
+            os.makedirs(statements_dir, exist_ok=True)
+        partitions = run.partitions.filter(finished_at=None).order_by('first_id').values_list('pk', flat=True)
+        tasks = [(pk, statements_dir, options['format'], options['chunk_size']) for pk in partitions]
+
+        started = time.perf_counter()
+        if workers == 1:
+            results = list(map(run_partition, tasks))
+        else:
+            # Forked workers must not share the parent's connections.
+            connections.close_all()
+            with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+                results = list(pool.map(run_partition, tasks))
+        elapsed = time.perf_counter() - started
+        finish_run(run)
+
+        paid = sum(accounts for accounts, _ in results)
+        if options['verbosity'] > 1:
+            for (pk, *_), (accounts, seconds) in zip(tasks, results):
+                self.stdout.write(f'Partition {pk}: {accounts} accounts in {seconds:.2f}s')
+        rate = paid / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{run.business_date}: paid interest to {paid} accounts over {len(tasks)} partitions '
+            f'in {elapsed:.2f}s ({rate:.0f} accounts/s)'
+        ))
@@ -0,0 +1,56 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from accounts.models import UserBankAccount
+from transactions.reports import day_start
+from transactions.statements import (STATEMENT_FORMATS, statement_lines,
+                                     statement_rows)
+
+
+class Command(BaseCommand):
+    help = 'Export a statement file per account, streaming several accounts in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('out_dir')
+        parser.add_argument('--format', choices=sorted(STATEMENT_FORMATS), default='csv')
+        parser.add_argument('--start-date', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--end-date', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = end = None
+        try:
+            if options['start_date']:
+                start = day_start(datetime.strptime(options['start_date'], '%Y-%m-%d').date())
+            if options['end_date']:
+                end = day_start(datetime.strptime(options['end_date'], '%Y-%m-%d').date() + timedelta(days=1))
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        os.makedirs(options['out_dir'], exist_ok=True)
+        fmt, chunk_size = options['format'], options['chunk_size']
+
+        def export(account):
+            account_id, account_number = account
+            path = os.path.join(options['out_dir'], f'{account_number}.{fmt}')
+            try:
+                with open(path, 'w', newline='') as fileobj:
+                    lines = statement_lines(fmt, statement_rows(account_id, start, end, chunk_size))
+                    fileobj.writelines(lines)
+            finally:
+                connection.close()
+
+        accounts = list(UserBankAccount.objects.order_by('pk').values_list('pk', 'account_number'))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            list(pool.map(export, accounts))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {len(accounts)} statements to {options["out_dir"]} in {elapsed:.2f}s'
+        ))
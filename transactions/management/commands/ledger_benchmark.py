@@ -0,0 +1,106 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import UserBankAccount
+from accounts.numbers import allocate_account_number
+from transactions import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire parallel deposits or transfers at one account and check that '
+        'the final balance matches the number of successful postings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['deposit', 'transfer'], default='deposit')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=400)
+        parser.add_argument('--amount', type=Decimal, default=Decimal('10.00'))
+        parser.add_argument('--naive', action='store_true',
+                            help='Use the old read-modify-write update to show lost updates. It bypasses '
+                                 'the ledger, so the journal of the benchmark accounts no longer verifies.')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the benchmark accounts afterwards.')
+
+    def handle(self, *args, **options):
+        mode, amount = options['mode'], options['amount']
+        operations, workers = options['operations'], options['workers']
+        opening = amount * operations if mode == 'transfer' else Decimal('0')
+        source = self.make_account('ledger_bench_source', opening)
+        target = self.make_account('ledger_bench_target', Decimal('0'))
+
+        def post(naive):
+            if mode == 'deposit':
+                if naive:
+                    account = UserBankAccount.objects.get(pk=target.pk)
+                    account.balance += amount
+                    account.save(update_fields=['balance'])
+                else:
+                    ledger.deposit(UserBankAccount(pk=target.pk), amount)
+            else:
+                if naive:
+                    sender = UserBankAccount.objects.get(pk=source.pk)
+                    receiver = UserBankAccount.objects.get(pk=target.pk)
+                    sender.balance -= amount
+                    receiver.balance += amount
+                    sender.save(update_fields=['balance'])
+                    receiver.save(update_fields=['balance'])
+                else:
+                    ledger.transfer(UserBankAccount(pk=source.pk), UserBankAccount(pk=target.pk), amount)
+
+        def worker(count):
+            done, errors = 0, 0
+            try:
+                for _ in range(count):
+                    try:
+                        post(options['naive'])
+                        done += 1
+                    except Exception:
+                        errors += 1
+            finally:
+                connection.close()
+            return done, errors
+
+        shares = [operations // workers + (i < operations % workers) for i in range(workers)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(worker, shares))
+        elapsed = time.perf_counter() - started
+
+        done = sum(r[0] for r in results)
+        errors = sum(r[1] for r in results)
+        target.refresh_from_db()
+        expected = amount * done
+        self.stdout.write(
+            f'{mode}: {done} posted, {errors} failed in {elapsed:.2f}s '
+            f'({done / elapsed:.1f} ops/s) with {workers} workers'
+        )
+        self.stdout.write(f'final balance {target.balance}, expected {expected}')
+        if target.balance == expected:
+            self.stdout.write(self.style.SUCCESS('balance consistent'))
+        else:
+            lost = (expected - target.balance) / amount
+            self.stdout.write(self.style.ERROR(f'balance drift: {lost} updates lost'))
+
+        if not options['keep']:
+            User.objects.filter(username__in=['ledger_bench_source', 'ledger_bench_target']).delete()
+
+    def make_account(self, username, balance):
+        User.objects.filter(username=username).delete()
+        user = User.objects.create(username=username)
+        account = UserBankAccount.objects.create(
+            user=user,
+            account_type='Current',
+            account_number=allocate_account_number(),
+            gender='Male',
+        )
+        # Funded through the ledger so the journal and daily summaries agree.
+        if balance:
+            ledger.deposit(account, balance)
+        return account
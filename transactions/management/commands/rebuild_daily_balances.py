@@ -0,0 +1,74 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+from transactions.models import DailyBalance, Transaction
+from transactions.reports import balance_effect
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the DailyBalance summaries from the transaction history. '
+        'Opening balances are anchored so that the last day closes at the '
+        "account's current balance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', action='append', dest='accounts',
+                            help='Account number to rebuild (repeatable). Defaults to all accounts.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        accounts = UserBankAccount.objects.order_by('pk')
+        if options['accounts']:
+            accounts = accounts.filter(account_number__in=options['accounts'])
+        account_ids = list(accounts.values_list('pk', flat=True))
+
+        rebuilt = days = 0
+        for account_id in account_ids:
+            with transaction.atomic():
+                # Holding the account row keeps postings out until its
+                # summaries are rewritten against the balance read here.
+                balance = (
+                    UserBankAccount.objects.select_for_update()
+                    .filter(pk=account_id).values_list('balance', flat=True).first()
+                )
+                if balance is None:
+                    continue
+                summaries = self.summarise(account_id, options['chunk_size'])
+                net = sum(day.credits - day.debits for day in summaries)
+                opening = balance - net
+                for day in summaries:
+                    day.opening_balance = opening
+                    opening = day.closing_balance
+                DailyBalance.objects.filter(account_id=account_id).delete()
+                DailyBalance.objects.bulk_create(summaries, batch_size=options['chunk_size'])
+            rebuilt += 1
+            days += len(summaries)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {days} daily summaries for {rebuilt} accounts'))
+
+    def summarise(self, account_id, chunk_size):
+        summaries = []
+        rows = (
+            Transaction.objects.filter(account_id=account_id)
+            .order_by('timestamp', 'id')
+            .values_list('timestamp', 'transaction_type', 'amount', 'loan_approved')
+        )
+        for timestamp, transaction_type, amount, loan_approved in rows.iterator(chunk_size=chunk_size):
+            credit, debit = balance_effect(transaction_type, amount, loan_approved)
+            if not (credit or debit):
+                continue
+            date = timezone.localtime(timestamp).date()
+            if not summaries or summaries[-1].date != date:
+                summaries.append(DailyBalance(
+                    account_id=account_id, date=date, opening_balance=Decimal('0'),
+                    credits=Decimal('0'), debits=Decimal('0'),
+                ))
+            day = summaries[-1]
+            day.credits += credit
+            day.debits += debit
+            day.transaction_count += bool(credit) + bool(debit)
+        return summaries
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from accounts.cache import invalidate
+from accounts.models import UserBankAccount
+from transactions.constants import LOAN, LOAN_PAID
+from transactions.models import Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild every account's active loan count and outstanding principal "
+        'from its loan history and report the accounts that had drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        checked = drifted = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                # Locked so that no loan posting lands between the totals
+                # and the update.
+                accounts = list(
+                    UserBankAccount.objects.select_for_update().filter(pk__gt=last_pk).order_by('pk')
+                    .only('pk', 'user_id', 'account_number', 'active_loan_count',
+                          'outstanding_loan_principal', 'loans_updated_at')[:options['chunk_size']]
+                )
+                if not accounts:
+                    break
+                last_pk = accounts[-1].pk
+                totals = self.totals([account.pk for account in accounts])
+                fixed = []
+                for account in accounts:
+                    count, principal, has_loans = totals.get(account.pk, (0, 0, False))
+                    if (account.active_loan_count == count and account.outstanding_loan_principal == principal
+                            and (account.loans_updated_at is not None or not has_loans)):
+                        continue
+                    self.stdout.write(
+                        f'{account.account_number}: {account.active_loan_count} loans / '
+                        f'{account.outstanding_loan_principal} stored, {count} / {principal} in history'
+                    )
+                    account.active_loan_count = count
+                    account.outstanding_loan_principal = principal
+                    account.loans_updated_at = timezone.now()
+                    fixed.append(account)
+                if fixed and not options['dry_run']:
+                    UserBankAccount.objects.bulk_update(
+                        fixed, ['active_loan_count', 'outstanding_loan_principal', 'loans_updated_at']
+                    )
+                    user_ids = [account.user_id for account in fixed]
+                    transaction.on_commit(lambda: invalidate(user_ids, kinds=('account',)))
+            checked += len(accounts)
+            drifted += len(fixed)
+
+        verb = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} accounts, {drifted} {verb}'))
+
+    def totals(self, account_ids):
+        active = Q(transaction_type=LOAN, loan_approved=True)
+        rows = (
+            Transaction.objects.filter(account_id__in=account_ids, transaction_type__in=[LOAN, LOAN_PAID])
+            .values('account_id')
+            .annotate(count=Count('id', filter=active), principal=Sum('amount', filter=active))
+        )
+        return {row['account_id']: (row['count'], row['principal'] or 0, True) for row in rows}
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from transactions.rollups import BATCH_ACCOUNTS, rebuild, refresh
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold journal entries posted since the last run into the analytics '
+        'rollups, or recompute them from the whole journal with --rebuild.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=BATCH_ACCOUNTS, help='Accounts per transaction.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            folded = rebuild(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the rollups from {folded} journal entries'))
+            return
+        folded = refresh(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} journal entries into the rollups'))
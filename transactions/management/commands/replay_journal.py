@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from transactions.journal import BALANCE_DRIFT, rebuild_balance, verify
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the whole journal in one streaming pass and set every account '
+        'balance that disagrees with it to the replayed one. Accounts whose '
+        'chain is broken are reported and left alone.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        rebuilt = broken = 0
+        for drift in verify(chunk_size=options['chunk_size']):
+            self.stdout.write(
+                f'{drift.account_number}: stored {drift.stored_balance}, '
+                f'journal {drift.journal_balance} ({drift.problem})'
+            )
+            if drift.problem != BALANCE_DRIFT:
+                broken += 1
+            elif not options['dry_run'] and rebuild_balance(drift):
+                rebuilt += 1
+        verb = 'would be rebuilt' if options['dry_run'] else 'rebuilt'
+        self.stdout.write(self.style.SUCCESS(f'{rebuilt} balances {verb}, {broken} broken chains'))
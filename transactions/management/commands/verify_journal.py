@@ -0,0 +1,43 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from transactions.journal import id_ranges, verify_range
+
+
+class Command(BaseCommand):
+    help = (
+        'Check every account balance and journal chain against each other, '
+        'with the account id range split over worker processes, and report '
+        'the accounts that drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        # A few ranges per worker, so one dense range does not hold up the rest.
+        ranges = [(first, last, options['chunk_size']) for first, last in id_ranges(workers * 4)]
+        if workers == 1:
+            results = map(verify_range, ranges)
+        else:
+            # Forked workers must not share the parent's connections.
+            connections.close_all()
+            with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+                results = list(pool.map(verify_range, ranges))
+
+        drifted = 0
+        for drifts in results:
+            for drift in drifts:
+                drifted += 1
+                self.stdout.write(
+                    f'{drift.account_number}: stored {drift.stored_balance}, '
+                    f'journal {drift.journal_balance} ({drift.problem})'
+                )
+        if drifted:
+            raise CommandError(f'{drifted} accounts drifted from the journal')
+        self.stdout.write(self.style.SUCCESS(f'All accounts match the journal ({len(ranges)} ranges checked)'))
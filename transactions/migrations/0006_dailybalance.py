@@ -0,0 +1,88 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:58
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+WITHDRAWAL = 2
+LOAN = 3
+LOAN_PAID = 4
+TRANSFER = 5
+
+
+def balance_effect(transaction_type, amount, loan_approved):
+    # Same as transactions.reports.balance_effect.
+    zero = Decimal('0')
+    if transaction_type in (WITHDRAWAL, TRANSFER):
+        return zero, amount
+    if transaction_type == LOAN:
+        return (amount, zero) if loan_approved else (zero, zero)
+    if transaction_type == LOAN_PAID:
+        return amount, amount
+    return amount, zero
+
+
+def backfill(apps, schema_editor):
+    # Same summaries as `manage.py rebuild_daily_balances`.
+    UserBankAccount = apps.get_model('accounts', 'UserBankAccount')
+    Transaction = apps.get_model('transactions', 'Transaction')
+    DailyBalance = apps.get_model('transactions', 'DailyBalance')
+    db = schema_editor.connection.alias
+    balances = UserBankAccount.objects.using(db).order_by('pk').values_list('pk', 'balance')
+    for account_id, balance in balances.iterator():
+        summaries = []
+        rows = (
+            Transaction.objects.using(db).filter(account_id=account_id)
+            .order_by('timestamp', 'id')
+            .values_list('timestamp', 'transaction_type', 'amount', 'loan_approved')
+        )
+        for timestamp, transaction_type, amount, loan_approved in rows.iterator():
+            credit, debit = balance_effect(transaction_type, amount, loan_approved)
+            if not (credit or debit):
+                continue
+            date = timezone.localtime(timestamp).date()
+            if not summaries or summaries[-1].date != date:
+                summaries.append(DailyBalance(
+                    account_id=account_id, date=date, opening_balance=Decimal('0'),
+                    credits=Decimal('0'), debits=Decimal('0'), transaction_count=0,
+                ))
+            day = summaries[-1]
+            day.credits += credit
+            day.debits += debit
+            day.transaction_count += bool(credit) + bool(debit)
+        # Anchor the openings so that the last day closes at the balance.
+        opening = balance - sum(day.credits - day.debits for day in summaries)
+        for day in summaries:
+            day.opening_balance = opening
+            opening += day.credits - day.debits
+        DailyBalance.objects.using(db).bulk_create(summaries, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_userbankaccount_is_bankrupt'),
+        ('transactions', '0005_remove_transaction_from_account_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('opening_balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('credits', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('debits', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='accounts.userbankaccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailybalance',
+            constraint=models.UniqueConstraint(fields=('account', 'date'), name='unique_daily_balance'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Count, Max, Q, Sum
+
+LOAN = 3
+LOAN_PAID = 4
+
+
+def backfill(apps, schema_editor):
+    # Same totals as `manage.py reconcile_loan_exposure`.
+    Transaction = apps.get_model('transactions', 'Transaction')
+    UserBankAccount = apps.get_model('accounts', 'UserBankAccount')
+    db = schema_editor.connection.alias
+    active = Q(transaction_type=LOAN, loan_approved=True)
+    totals = (
+        Transaction.objects.using(db).filter(transaction_type__in=[LOAN, LOAN_PAID])
+        .values('account_id')
+        .annotate(count=Count('id', filter=active), principal=Sum('amount', filter=active), latest=Max('timestamp'))
+    )
+    for row in totals.iterator():
+        UserBankAccount.objects.using(db).filter(pk=row['account_id']).update(
+            active_loan_count=row['count'],
+            outstanding_loan_principal=row['principal'] or 0,
+            loans_updated_at=row['latest'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_loan_exposure'),
+        ('transactions', '0007_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_loan_exposure'),
+        ('transactions', '0008_backfill_loan_exposure'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_type',
+            field=models.IntegerField(blank=True, choices=[(1, 'Deposit'), (2, 'Withdrawal'), (3, 'Loan'), (4, 'Loan Paid'), (5, 'Transfer'), (6, 'Receive'), (7, 'Loan Rejected')], null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'loan_approved', 'id'], name='txn_type_approved_idx'),
+        ),
+    ]
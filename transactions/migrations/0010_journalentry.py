@@ -0,0 +1,32 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_journal_head'),
+        ('transactions', '0009_loan_rejected_admin_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveBigIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='journal_entries', to='accounts.userbankaccount')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='journal_entries', to='transactions.transaction')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='journalentry',
+            constraint=models.UniqueConstraint(fields=('account', 'sequence'), name='unique_journal_sequence'),
+        ),
+    ]
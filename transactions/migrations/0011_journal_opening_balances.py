@@ -0,0 +1,30 @@
+import hashlib
+
+from django.db import migrations
+
+
+def open_journals(apps, schema_editor):
+    # Balances from before the journal become each account's first entry,
+    # hashed like transactions.journal.chain_hash.
+    UserBankAccount = apps.get_model('accounts', 'UserBankAccount')
+    JournalEntry = apps.get_model('transactions', 'JournalEntry')
+    db = schema_editor.connection.alias
+    accounts = UserBankAccount.objects.using(db).exclude(balance=0).values_list('pk', 'balance')
+    for account_id, balance in accounts.iterator():
+        payload = f'|{account_id}|1||{balance:.2f}|{balance:.2f}'
+        head = hashlib.sha256(payload.encode()).hexdigest()
+        JournalEntry.objects.using(db).create(
+            account_id=account_id, sequence=1, amount=balance, balance=balance, hash=head
+        )
+        UserBankAccount.objects.using(db).filter(pk=account_id).update(journal_sequence=1, journal_hash=head)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_journalentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(open_journals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_apitoken'),
+        ('transactions', '0012_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CounterpartyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('credits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('debits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='counterparty_rollups', to='accounts.userbankaccount')),
+                ('counterparty', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.userbankaccount')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TypeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('month', 'Month'), ('week', 'Week')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('transaction_type', models.IntegerField(choices=[(1, 'Deposit'), (2, 'Withdrawal'), (3, 'Loan'), (4, 'Loan Paid'), (5, 'Transfer'), (6, 'Receive'), (7, 'Loan Rejected')])),
+                ('credits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('debits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='type_rollups', to='accounts.userbankaccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='counterpartyrollup',
+            constraint=models.UniqueConstraint(fields=('account', 'counterparty'), name='unique_counterparty_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='typerollup',
+            constraint=models.UniqueConstraint(fields=('account', 'period', 'period_start', 'transaction_type'), name='unique_type_rollup'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0013_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndOfDayRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('business_date', models.DateField(unique=True)),
+                ('annual_rate', models.DecimalField(decimal_places=6, max_digits=7)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_type',
+            field=models.IntegerField(blank=True, choices=[(1, 'Deposit'), (2, 'Withdrawal'), (3, 'Loan'), (4, 'Loan Paid'), (5, 'Transfer'), (6, 'Receive'), (7, 'Loan Rejected'), (8, 'Interest')], null=True),
+        ),
+        migrations.AlterField(
+            model_name='typerollup',
+            name='transaction_type',
+            field=models.IntegerField(choices=[(1, 'Deposit'), (2, 'Withdrawal'), (3, 'Loan'), (4, 'Loan Paid'), (5, 'Transfer'), (6, 'Receive'), (7, 'Loan Rejected'), (8, 'Interest')]),
+        ),
+        migrations.CreateModel(
+            name='EndOfDayPartition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('last_account_id', models.BigIntegerField(default=0)),
+                ('accounts', models.PositiveIntegerField(default=0)),
+                ('interest', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('statements', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('run', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='partitions', to='transactions.endofdayrun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='endofdaypartition',
+            constraint=models.UniqueConstraint(fields=('run', 'first_id'), name='unique_end_of_day_partition'),
+        ),
+    ]
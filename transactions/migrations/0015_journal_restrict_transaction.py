@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0014_end_of_day'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journalentry',
+            name='transaction',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='journal_entries', to='transactions.transaction'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def clear_rollups(apps, schema_editor):
+    # The new marks start at zero, so the next refresh folds every journal
+    # entry again; totals built under the old checkpoint would count twice.
+    db = schema_editor.connection.alias
+    for name in ('TypeRollup', 'CounterpartyRollup'):
+        apps.get_model('transactions', name).objects.using(db).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_apitoken'),
+        ('transactions', '0015_journal_restrict_transaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupMark',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup_mark', serialize=False, to='accounts.userbankaccount')),
+                ('sequence', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='RollupCheckpoint',
+        ),
+        migrations.RunPython(clear_rollups, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,14 @@
+from django.contrib.auth.models import User
 from django.db import models
 
 from accounts.models import UserBankAccount
 
-from .constants import TRANSACTION_TYPE
+from .constants import ROLLUP_PERIODS, TRANSACTION_TYPE
 
 
 # Create your models here.
 class Transaction(models.Model):
-    account = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='transactions')
+    account = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='transactions',db_index=False)
     transaction_type = models.IntegerField(choices=TRANSACTION_TYPE,null=True,blank=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     balance_after_transaction = models.DecimalField(max_digits=12, decimal_places=2)
@@ -15,5 +16,146 @@ class Transaction(models.Model):
     loan_approved = models.BooleanField(default=False)
     to_account = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='received',null=True,blank=True)
     class Meta:
-        ordering = ['timestamp']
-    
\ No newline at end of file
+        # Both indexes lead with account, which makes the plain foreign key
+        # index redundant. History reads walk (account, timestamp, id) and
+        # the loan limit / loan list filters hit the second one. The third
+        # serves the admin's type and approval filters in its -id order.
+        indexes = [
+            models.Index(fields=['account', 'timestamp', 'id'], name='txn_account_timestamp_idx'),
+            models.Index(fields=['account', 'transaction_type', 'loan_approved'], name='txn_account_loan_idx'),
+            models.Index(fields=['transaction_type', 'loan_approved', 'id'], name='txn_type_approved_idx'),
+        ]
+
+
+class JournalEntry(models.Model):
+    """One balance change of one account, see ``transactions.journal``."""
+    account = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='journal_entries',db_index=False)
+    sequence = models.PositiveBigIntegerField()
+    # RESTRICT: entries are hashed over their transaction id, so the row must
+    # stay unless its whole account goes.
+    transaction = models.ForeignKey(Transaction, on_delete=models.RESTRICT,related_name='journal_entries',null=True,blank=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        # Also the index replays walk.
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'sequence'], name='unique_journal_sequence'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Journal entries are append-only')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Journal entries are append-only')
+
+
+class DailyBalance(models.Model):
+    account = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='daily_balances')
+    date = models.DateField()
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2)
+    credits = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    debits = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'date'], name='unique_daily_balance'),
+        ]
+
+    @property
+    def closing_balance(self):
+        return self.opening_balance + self.credits - self.debits
+
+
+class IdempotencyKey(models.Model):
+    """A client-chosen key and the response of the posting made with it.
+
+    ``status_code`` is empty while that posting is still in flight.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE,related_name='idempotency_keys',db_index=False)
+    key = models.CharField(max_length=64)
+    scope = models.CharField(max_length=50)
+    status_code = models.PositiveSmallIntegerField(null=True,blank=True)
+    location = models.CharField(max_length=255,blank=True)
+    content_type = models.CharField(max_length=100,blank=True)
+    body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def result(self):
+        return {
+            'scope': self.scope,
+            'status_code': self.status_code,
+            'location': self.location,
+            'content_type': self.content_type,
+            'body': self.body,
+        }
+
+
+class TypeRollup(models.Model):
+    """An account's credits and debits of one type in one month or week, see ``transactions.rollups``."""
+    account = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='type_rollups',db_index=False)
+    period = models.CharField(max_length=5,choices=ROLLUP_PERIODS)
+    period_start = models.DateField()
+    transaction_type = models.IntegerField(choices=TRANSACTION_TYPE)
+    credits = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    debits = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'period', 'period_start', 'transaction_type'],
+                                    name='unique_type_rollup'),
+        ]
+
+
+class CounterpartyRollup(models.Model):
+    """What an account received from (credits) and sent to (debits) another account."""
+    account = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='counterparty_rollups',db_index=False)
+    counterparty = models.ForeignKey(UserBankAccount, on_delete=models.CASCADE,related_name='+')
+    credits = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    debits = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'counterparty'], name='unique_counterparty_rollup'),
+        ]
+
+
+class RollupMark(models.Model):
+    """The last journal entry of an account folded into its rollups."""
+    account = models.OneToOneField(UserBankAccount,on_delete=models.CASCADE,primary_key=True,related_name='rollup_mark')
+    sequence = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True,blank=True)
+
+
+class EndOfDayRun(models.Model):
+    """One end-of-day batch. Its partitions hold the progress."""
+    business_date = models.DateField(unique=True)
+    annual_rate = models.DecimalField(max_digits=7,decimal_places=6)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True,blank=True)
+
+
+class EndOfDayPartition(models.Model):
+    """A range of account ids of a run and how far its worker got."""
+    run = models.ForeignKey(EndOfDayRun,on_delete=models.CASCADE,related_name='partitions',db_index=False)
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    last_account_id = models.BigIntegerField(default=0)
+    accounts = models.PositiveIntegerField(default=0)
+    interest = models.DecimalField(max_digits=14,decimal_places=2,default=0)
+    statements = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True,blank=True)
+    finished_at = models.DateTimeField(null=True,blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'first_id'], name='unique_end_of_day_partition'),
+        ]
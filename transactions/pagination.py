@@ -0,0 +1,122 @@
+"""Keyset (cursor) pagination over ``(timestamp, id)``.
+
+Pages are fetched with ``WHERE (timestamp, id) > cursor ... LIMIT n + 1``
+on the ``(account, timestamp, id)`` index, so a deep page costs the same as
+the first one and no ``COUNT(*)`` is ever run.
+
+The admin needs page numbers, so it gets :class:`CappedCountPaginator`
+instead, which counts at most a fixed number of rows.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_cursor(direction, row):
+    # Rows are model instances or ``.values()`` dicts with timestamp and id.
+    timestamp, pk = (row['timestamp'], row['id']) if isinstance(row, dict) else (row.timestamp, row.pk)
+    payload = json.dumps({'d': direction, 't': timestamp.isoformat(), 'i': pk})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, timestamp, id)`` or ``None`` for a bad cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = payload['d']
+        if direction not in ('n', 'p'):
+            return None
+        return direction, datetime.fromisoformat(payload['t']), int(payload['i'])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self):
+        if self.has_next_page and self.object_list:
+            return encode_cursor('n', self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous_page and self.object_list:
+            return encode_cursor('p', self.object_list[0])
+        return None
+
+
+class KeysetPaginator:
+    """Paginate a queryset in ascending ``(timestamp, id)`` order."""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _query(self, cursor):
+        """Return the queryset for the page at ``cursor`` and the direction of travel."""
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self.queryset.order_by('timestamp', 'id')[:self.per_page + 1], None
+
+        direction, timestamp, pk = position
+        if direction == 'n':
+            after = Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+            return self.queryset.filter(after).order_by('timestamp', 'id')[:self.per_page + 1], direction
+
+        before = Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+        return self.queryset.filter(before).order_by('-timestamp', '-id')[:self.per_page + 1], direction
+
+    def _page(self, rows, direction):
+        more = len(rows) > self.per_page
+        if direction is None:
+            return KeysetPage(rows[:self.per_page], more, False)
+        if direction == 'n':
+            return KeysetPage(rows[:self.per_page], more, True)
+        return KeysetPage(rows[:self.per_page][::-1], True, more)
+
+    def page(self, cursor=None):
+        queryset, direction = self._query(cursor)
+        return self._page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        queryset, direction = self._query(cursor)
+        return self._page([row async for row in queryset], direction)
+
+
+class CappedCountPaginator(Paginator):
+    """A ``Paginator`` that stops counting after ``count_limit`` rows.
+
+    The count runs as ``SELECT COUNT(*) FROM (... LIMIT n)``, so it never
+    scans the whole table; pages past the limit are not linked and are
+    reached by filtering instead.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.count_limit].count()
@@ -0,0 +1,138 @@
+"""Period figures for the transaction report, read from ``DailyBalance``.
+
+``DailyBalance`` holds one row per account and day with the opening
+balance and the credits, debits and number of postings of that day. The
+ledger keeps it current, so summarising any range costs one row per day
+plus, for ranges that start or end mid-day, the raw transactions of those
+two partial days.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .constants import (DEPOSIT, INTEREST, LOAN, LOAN_PAID, LOAN_REJECTED,
+                        RECEIVE, TRANSFER, WITHDRAWAL)
+from .models import DailyBalance, Transaction
+
+
+def balance_effect(transaction_type, amount, loan_approved):
+    """Return the ``(credit, debit)`` a transaction row stands for.
+
+    A paid loan row stands for both the credit when it was approved and the
+    debit when it was repaid; a loan that is still pending, or was
+    rejected, moved nothing.
+    """
+    zero = Decimal('0')
+    if transaction_type in (DEPOSIT, RECEIVE, INTEREST):
+        return amount, zero
+    if transaction_type in (WITHDRAWAL, TRANSFER):
+        return zero, amount
+    if transaction_type == LOAN:
+        return (amount, zero) if loan_approved else (zero, zero)
+    if transaction_type == LOAN_PAID:
+        return amount, amount
+    if transaction_type == LOAN_REJECTED:
+        return zero, zero
+    return amount, zero
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def period_from_request(params):
+    """Turn ``start_date``/``end_date`` query parameters into a half-open range.
+
+    Returns ``(None, None)`` unless both dates are given and raises
+    ``ValueError`` for a malformed date.
+    """
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date')
+    if not (start_date_str and end_date_str):
+        return None, None
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    return day_start(start_date), day_start(end_date + timedelta(days=1))
+
+
+def _raw_rows(account, start, end):
+    return Transaction.objects.filter(
+        account=account, timestamp__gte=start, timestamp__lt=end
+    ).values_list('transaction_type', 'amount', 'loan_approved')
+
+
+def _fold(rows):
+    credits = debits = Decimal('0')
+    count = 0
+    for transaction_type, amount, loan_approved in rows:
+        credit, debit = balance_effect(transaction_type, amount, loan_approved)
+        if credit or debit:
+            credits += credit
+            debits += debit
+            count += bool(credit) + bool(debit)
+    return credits, debits, count
+
+
+def _raw_totals(account, start, end):
+    return _fold(_raw_rows(account, start, end))
+
+
+_DAILY_SUMS = {'credits': Sum('credits'), 'debits': Sum('debits'), 'count': Sum('transaction_count')}
+
+
+def _daily_rows(account, first_day, last_day):
+    return DailyBalance.objects.filter(account=account, date__gte=first_day, date__lt=last_day)
+
+
+def _daily_totals(totals):
+    return totals['credits'] or 0, totals['debits'] or 0, totals['count'] or 0
+
+
+def _split_period(start, end):
+    """Split ``[start, end)`` into whole days and the partial days at its edges.
+
+    Returns ``(days, partials)`` where ``days`` is a ``(first_day, last_day)``
+    half-open range of dates or ``None``.
+    """
+    first_day = timezone.localtime(start).date()
+    if day_start(first_day) < start:
+        first_day += timedelta(days=1)
+    last_day = timezone.localtime(end).date()
+    if first_day < last_day:
+        partials = [(start, day_start(first_day)), (day_start(last_day), end)]
+        return (first_day, last_day), [(s, e) for s, e in partials if s < e]
+    return None, [(start, end)]
+
+
+def _summary(parts):
+    credits = sum((part[0] for part in parts), Decimal('0'))
+    debits = sum((part[1] for part in parts), Decimal('0'))
+    count = sum(part[2] for part in parts)
+    return {'credits': credits, 'debits': debits, 'net': credits - debits, 'count': count}
+
+
+def period_summary(account, start, end):
+    """Credits, debits and posting count for ``account`` in ``[start, end)``.
+
+    ``start`` and ``end`` are aware datetimes.
+    """
+    days, partials = _split_period(start, end)
+    parts = []
+    if days:
+        parts.append(_daily_totals(_daily_rows(account, *days).aggregate(**_DAILY_SUMS)))
+    for partial_start, partial_end in partials:
+        parts.append(_raw_totals(account, partial_start, partial_end))
+    return _summary(parts)
+
+
+async def aperiod_summary(account, start, end):
+    """Async version of :func:`period_summary`."""
+    days, partials = _split_period(start, end)
+    parts = []
+    if days:
+        parts.append(_daily_totals(await _daily_rows(account, *days).aaggregate(**_DAILY_SUMS)))
+    for partial_start, partial_end in partials:
+        parts.append(_fold([row async for row in _raw_rows(account, partial_start, partial_end)]))
+    return _summary(parts)
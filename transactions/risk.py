@@ -0,0 +1,204 @@
+"""Velocity rules checked while withdrawal, transfer and loan forms validate.
+
+A rule limits how many postings of some types an account makes, or how
+much money they move, within a sliding window::
+
+    [
+        {"name": "transfer_burst", "types": ["transfer"], "metric": "count",
+         "window": 600, "limit": 5, "message": "Too many transfers in 10 minutes"},
+        {"name": "daily_withdrawals", "types": ["withdrawal"], "metric": "amount",
+         "window": 86400, "limit": "200000"}
+    ]
+
+Rules are read from the JSON file named by ``RISK_RULES_FILE`` and read
+again whenever its mtime changes. A file that fails to parse is logged
+and the previous rules stay in force. Without a file no rules apply and
+nothing is counted.
+
+Counters live in the default cache rather than the database, so checking
+costs one ``get_many`` and no aggregate query. The ledger counts every
+posting once it commits, per account and type, into one-minute buckets
+(for windows of up to an hour) and one-hour buckets (for longer ones). A
+window is the sum of the buckets it touches, so it can overcount by up to
+one bucket, never undercount. Two requests checked at the same moment can
+both pass; the rules are a brake, not a lock.
+
+A check that does not answer within ``RISK_BUDGET_MS`` (a slow or
+unreachable cache) or that fails is logged and lets the posting through.
+"""
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as CheckTimeout
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .constants import LOAN, TRANSFER, WITHDRAWAL
+
+logger = logging.getLogger('amar_bank.risk')
+
+COUNT = 'count'
+AMOUNT = 'amount'
+METRICS = (COUNT, AMOUNT)
+TYPES = {'withdrawal': WITHDRAWAL, 'transfer': TRANSFER, 'loan': LOAN}
+MAX_WINDOW = 7 * 24 * 60 * 60
+# (bucket seconds, longest window counted in them)
+GRANULARITIES = ((60, 60 * 60), (60 * 60, MAX_WINDOW))
+
+Rule = namedtuple('Rule', ['name', 'types', 'metric', 'window', 'limit', 'message'])
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='risk')
+
+
+def enabled():
+    return bool(settings.RISK_RULES_FILE)
+
+
+def parse_rules(data):
+    """Turn the decoded JSON list into ``Rule`` tuples; raises ``ValueError``."""
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of rules')
+    rules = []
+    for number, item in enumerate(data, start=1):
+        try:
+            types = frozenset(TYPES[name] for name in item['types'])
+            metric = item.get('metric', COUNT)
+            window = int(item['window'])
+            limit = Decimal(str(item['limit']))
+        except (KeyError, TypeError, ValueError, InvalidOperation) as exc:
+            raise ValueError(f'Rule {number}: invalid or missing {exc}')
+        if metric not in METRICS:
+            raise ValueError(f'Rule {number}: unknown metric {metric!r}')
+        if not 0 < window <= MAX_WINDOW:
+            raise ValueError(f'Rule {number}: window must be between 1 and {MAX_WINDOW} seconds')
+        name = str(item.get('name') or f'rule {number}')
+        message = str(item.get('message') or 'This transaction is over your account limits, try again later')
+        rules.append(Rule(name, types, metric, window, limit, message))
+    return rules
+
+
+class _RuleFile:
+    """The parsed rules of ``RISK_RULES_FILE``, re-read when its mtime changes."""
+
+    def __init__(self):
+        self.path = None
+        self.mtime = None
+        self.rules = []
+
+    def get(self):
+        path = settings.RISK_RULES_FILE
+        if not path:
+            return []
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if (path, mtime) == (self.path, self.mtime):
+            return self.rules
+        rules = self.rules if path == self.path else []
+        try:
+            with open(path) as fileobj:
+                rules = parse_rules(json.load(fileobj))
+        except (OSError, ValueError) as exc:
+            logger.error('Cannot load risk rules from %s, keeping %d rules: %s', path, len(rules), exc)
+        self.path, self.mtime, self.rules = path, mtime, rules
+        return rules
+
+
+_rule_file = _RuleFile()
+
+
+def current_rules():
+    return _rule_file.get()
+
+
+def _bucket_size(window):
+    for size, longest in GRANULARITIES:
+        if window <= longest:
+            return size
+    return GRANULARITIES[-1][0]
+
+
+def _key(metric, account_id, transaction_type, size, bucket):
+    return f'risk:{metric}:{account_id}:{transaction_type}:{size}:{bucket}'
+
+
+def _window_keys(account_id, rule, now):
+    size = _bucket_size(rule.window)
+    last = int(now // size)
+    first = int((now - rule.window) // size)
+    return [
+        _key(rule.metric, account_id, transaction_type, size, bucket)
+        for transaction_type in rule.types for bucket in range(first, last + 1)
+    ]
+
+
+def _cents(amount):
+    return int(Decimal(amount) * 100)
+
+
+def breached_rule(account_id, transaction_type, amount, rules, now=None):
+    """Return the first of ``rules`` the posting would break, or ``None``."""
+    rules = [rule for rule in rules if transaction_type in rule.types]
+    if not rules:
+        return None
+    now = time.time() if now is None else now
+    keys = {rule: _window_keys(account_id, rule, now) for rule in rules}
+    counters = cache.get_many([key for rule_keys in keys.values() for key in rule_keys])
+    for rule in rules:
+        total = sum(counters.get(key, 0) for key in keys[rule])
+        if rule.metric == COUNT:
+            breached = total + 1 > rule.limit
+        else:
+            breached = total + _cents(amount) > rule.limit * 100
+        if breached:
+            return rule
+    return None
+
+
+def evaluate(account_id, transaction_type, amount, rules=None):
+    """``breached_rule`` for the current rules, within ``RISK_BUDGET_MS``.
+
+    Returns ``None`` (allow) when the check runs out of time or fails.
+    """
+    rules = current_rules() if rules is None else rules
+    if not any(transaction_type in rule.types for rule in rules):
+        return None
+    budget = settings.RISK_BUDGET_MS / 1000
+    try:
+        if not budget:
+            return breached_rule(account_id, transaction_type, amount, rules)
+        future = _executor.submit(breached_rule, account_id, transaction_type, amount, rules)
+        return future.result(timeout=budget)
+    except CheckTimeout:
+        logger.warning('Risk check for account %s took over %sms, allowed', account_id, settings.RISK_BUDGET_MS)
+    except Exception:
+        logger.exception('Risk check for account %s failed, allowed', account_id)
+    return None
+
+
+def _incr(key, delta, timeout):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Missing key; another process may create it first.
+        if not cache.add(key, delta, timeout):
+            cache.incr(key, delta)
+
+
+def record(account_id, transaction_type, amount, count=1, now=None):
+    """Count ``count`` postings moving ``amount`` in total towards the windows."""
+    now = time.time() if now is None else now
+    try:
+        for size, longest in GRANULARITIES:
+            bucket = int(now // size)
+            timeout = longest + 2 * size
+            _incr(_key(COUNT, account_id, transaction_type, size, bucket), count, timeout)
+            _incr(_key(AMOUNT, account_id, transaction_type, size, bucket), _cents(amount), timeout)
+    except Exception:
+        logger.exception('Could not count a posting of account %s towards the risk rules', account_id)
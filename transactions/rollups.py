@@ -0,0 +1,226 @@
+"""Pre-aggregated figures for the analytics page.
+
+``TypeRollup`` holds each account's credits and debits per month and week
+and transaction type, ``CounterpartyRollup`` what it sent to and received
+from each other account. Both are built from the journal rather than the
+transaction rows, because journal entries never change.
+
+``RollupMark`` records, per account, the last journal sequence folded in.
+An account's entries commit in sequence order (each posting holds the
+account row while it appends), and the account's ``journal_sequence``
+commits together with them, so every entry up to it is visible and none
+after the mark can have been missed, however long its posting took to
+commit. ``refresh`` folds in each account's entries between the two;
+``rebuild`` recomputes the tables from scratch. Either way the
+aggregation is a GROUP BY in the database.
+
+The running balance series comes from ``DailyBalance``, which the ledger
+keeps current anyway.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import (BigIntegerField, Case, Count, DateField,
+                              DecimalField, F, IntegerField, Q, Sum, Value,
+                              When)
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from accounts.models import UserBankAccount
+
+from .constants import LOAN, LOAN_PAID, MONTH, WEEK
+from .models import (CounterpartyRollup, DailyBalance, JournalEntry,
+                     RollupMark, TypeRollup)
+from .statements import TYPE_NAMES
+
+BATCH_ACCOUNTS = 500
+
+_TRUNCATE = {MONTH: TruncMonth, WEEK: TruncWeek}
+_MONEY = DecimalField(max_digits=14, decimal_places=2)
+_SUMS = {
+    'credits': Sum('amount', filter=Q(amount__gt=0), default=Decimal('0'), output_field=_MONEY),
+    'debits': Sum(F('amount') * -1, filter=Q(amount__lt=0), default=Decimal('0'), output_field=_MONEY),
+    'count': Count('id'),
+}
+
+
+def _kind():
+    # Repaying a loan turns its row into LOAN_PAID, but the payout entry
+    # that points at it is still a loan.
+    return Case(
+        When(transaction__transaction_type=LOAN_PAID, amount__gt=0, then=Value(LOAN)),
+        default=F('transaction__transaction_type'),
+        output_field=IntegerField(),
+    )
+
+
+def type_totals(entries, period):
+    """Aggregate ``entries`` per account, ``period`` start and type."""
+    return (
+        entries.exclude(transaction=None)
+        .annotate(period_start=_TRUNCATE[period]('created_at', output_field=DateField()),
+                  transaction_type=_kind())
+        .values('account_id', 'period_start', 'transaction_type')
+        .annotate(**_SUMS)
+        .order_by()
+    )
+
+
+def counterparty_totals(entries):
+    """Aggregate ``entries`` of transfers per account and counterparty."""
+    return (
+        entries.filter(transaction__to_account__isnull=False)
+        .values('account_id', counterparty_id=F('transaction__to_account'))
+        .annotate(**_SUMS)
+        .order_by()
+    )
+
+
+def _merge(model, key_fields, rows):
+    """Add aggregated ``rows`` onto the matching rollups of ``model``, creating missing ones."""
+    if not rows:
+        return
+    lookup = {f'{field}__in': {row[field] for row in rows} for field in key_fields}
+    existing = {
+        tuple(getattr(rollup, field) for field in key_fields): rollup
+        for rollup in model.objects.filter(**lookup)
+    }
+    changed, new = [], []
+    for row in rows:
+        rollup = existing.get(tuple(row[field] for field in key_fields))
+        if rollup is None:
+            new.append(model(**{field: row[field] for field in key_fields},
+                             credits=row['credits'], debits=row['debits'], count=row['count']))
+            continue
+        rollup.credits += row['credits']
+        rollup.debits += row['debits']
+        rollup.count += row['count']
+        changed.append(rollup)
+    model.objects.bulk_update(changed, ['credits', 'debits', 'count'], batch_size=1000)
+    model.objects.bulk_create(new, batch_size=1000)
+
+
+def _type_rows(entries, period):
+    return [{**row, 'period': period} for row in type_totals(entries, period)]
+
+
+def _stale_accounts(after_id, limit):
+    """``{account_id: journal_sequence}`` of the next accounts with entries not folded in yet."""
+    return dict(
+        UserBankAccount.objects.filter(pk__gt=after_id)
+        .annotate(folded=Coalesce('rollup_mark__sequence', Value(0), output_field=BigIntegerField()))
+        .filter(journal_sequence__gt=F('folded'))
+        .order_by('pk').values_list('pk', 'journal_sequence')[:limit]
+    )
+
+
+def _per_account(values):
+    return Case(*[When(account_id=pk, then=Value(value)) for pk, value in values.items()],
+                output_field=BigIntegerField())
+
+
+def _fold(heads):
+    """Fold the entries of ``heads`` accounts up to their sequence in, and move their marks.
+
+    Returns the number of entries folded in.
+    """
+    # Inserting first takes SQLite's write lock before anything is read.
+    RollupMark.objects.bulk_create([RollupMark(account_id=pk) for pk in heads], ignore_conflicts=True)
+    # A concurrent refresh may have folded some of them in meanwhile.
+    folded = dict(
+        RollupMark.objects.select_for_update().filter(account_id__in=heads)
+        .order_by('account_id').values_list('account_id', 'sequence')
+    )
+    heads = {pk: head for pk, head in heads.items() if head > folded[pk]}
+    if not heads:
+        return 0
+    entries = JournalEntry.objects.filter(
+        account_id__in=heads,
+        sequence__gt=_per_account({pk: folded[pk] for pk in heads}),
+        sequence__lte=_per_account(heads),
+    )
+    _merge(TypeRollup, ['account_id', 'period', 'period_start', 'transaction_type'],
+           _type_rows(entries, MONTH) + _type_rows(entries, WEEK))
+    _merge(CounterpartyRollup, ['account_id', 'counterparty_id'], list(counterparty_totals(entries)))
+    now = timezone.now()
+    RollupMark.objects.filter(account_id__in=heads).update(sequence=_per_account(heads), updated_at=now)
+    return sum(head - folded[pk] for pk, head in heads.items())
+
+
+def refresh(batch_size=BATCH_ACCOUNTS):
+    """Fold every account's new journal entries into the rollups.
+
+    Accounts are folded ``batch_size`` at a time, each batch and its marks
+    in one transaction, so an interrupted run resumes where it stopped.
+    Returns the number of entries folded in.
+    """
+    folded = 0
+    after_id = 0
+    while heads := _stale_accounts(after_id, batch_size):
+        with transaction.atomic():
+            folded += _fold(heads)
+        after_id = max(heads)
+    return folded
+
+
+def rebuild(batch_size=BATCH_ACCOUNTS):
+    """Recompute every rollup from the journal in one transaction."""
+    with transaction.atomic():
+        TypeRollup.objects.all().delete()
+        CounterpartyRollup.objects.all().delete()
+        RollupMark.objects.all().delete()
+        return refresh(batch_size)
+
+
+def _periods(account, period, since):
+    rollups = (
+        TypeRollup.objects.filter(account=account, period=period, period_start__gte=since)
+        .order_by('-period_start', 'transaction_type')
+    )
+    periods = []
+    for start, rows in groupby(rollups, key=lambda rollup: rollup.period_start):
+        rows = list(rows)
+        credits = sum((row.credits for row in rows), Decimal('0'))
+        debits = sum((row.debits for row in rows), Decimal('0'))
+        periods.append({
+            'start': start,
+            'credits': credits,
+            'debits': debits,
+            'net': credits - debits,
+            'types': [(TYPE_NAMES.get(row.transaction_type, ''), row.credits, row.debits, row.count) for row in rows],
+        })
+    return periods
+
+
+def account_analytics(account, months=12, weeks=8, days=90, counterparties=5):
+    """Everything the analytics page shows for ``account``."""
+    today = timezone.localdate()
+    first_month = today.replace(day=1)
+    for _ in range(months - 1):
+        first_month = (first_month - timedelta(days=1)).replace(day=1)
+    first_week = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+
+    top = (
+        CounterpartyRollup.objects.filter(account=account).select_related('counterparty')
+        .annotate(volume=F('credits') + F('debits')).order_by('-volume')[:counterparties]
+    )
+    balances = [
+        (day.date, day.closing_balance)
+        for day in DailyBalance.objects.filter(account=account, date__gt=today - timedelta(days=days)).order_by('date')
+    ]
+    highest = max((balance for _, balance in balances), default=0)
+    mark = RollupMark.objects.filter(account=account).first()
+    return {
+        'sections': [
+            ('Monthly', _periods(account, MONTH, first_month)),
+            ('Weekly', _periods(account, WEEK, first_week)),
+        ],
+        'counterparties': list(top),
+        'balances': [
+            (date, balance, int(balance * 100 / highest) if highest > 0 and balance > 0 else 0)
+            for date, balance in balances
+        ],
+        'updated_at': mark.updated_at if mark else None,
+    }
@@ -0,0 +1,56 @@
+"""Streaming statement export.
+
+Rows are read with ``values_list(...).iterator()`` and encoded one at a
+time, so memory use does not grow with the length of an account's
+history.
+"""
+import csv
+import json
+
+from .constants import TRANSACTION_TYPE
+from .models import Transaction
+
+STATEMENT_COLUMNS = ['id', 'timestamp', 'type', 'amount', 'balance_after', 'counterparty']
+STATEMENT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+TYPE_NAMES = dict(TRANSACTION_TYPE)
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def statement_rows(account_id, start=None, end=None, chunk_size=2000):
+    queryset = Transaction.objects.filter(account_id=account_id)
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    rows = queryset.order_by('timestamp', 'id').values_list(
+        'id', 'timestamp', 'transaction_type', 'amount', 'balance_after_transaction',
+        'to_account__account_number',
+    )
+    for pk, timestamp, transaction_type, amount, balance, counterparty in rows.iterator(chunk_size=chunk_size):
+        yield [pk, timestamp.isoformat(), TYPE_NAMES.get(transaction_type, ''), str(amount), str(balance),
+               counterparty or '']
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(STATEMENT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(STATEMENT_COLUMNS, row))) + '\n'
+
+
+def statement_lines(fmt, rows):
+    return csv_lines(rows) if fmt == 'csv' else ndjson_lines(rows)
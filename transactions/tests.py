@@ -1,3 +1,1006 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import RestrictedError, Sum
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.cache import prime
+from accounts.models import UserAddress, UserBankAccount
+from accounts.numbers import format_account_number
+from accounts.tokens import create_token
+from core.models import OutboundEmail
+from core.testing import QueryBudgetMixin
+
+from . import ledger, risk
+from .bulk import parse_transfer_file
+from .constants import (DEPOSIT, INTEREST, LOAN, LOAN_PAID, LOAN_REJECTED,
+                        MONTH, RECEIVE, TRANSFER, WEEK, WITHDRAWAL)
+from .end_of_day import run_partition, start_run
+from .pagination import KeysetPaginator
+from .forms import BulkTransferForm, TransferForm, WithdrawForm
+from .journal import verify
+from .models import (CounterpartyRollup, DailyBalance, IdempotencyKey, JournalEntry,
+                     Transaction, TypeRollup)
+from .reports import aperiod_summary, day_start, period_summary
+from .rollups import rebuild, refresh
+from .views import TransactionReportView
+
+
+def create_account(username, account_number, balance=0):
+    user = User.objects.create_user(username, f'{username}@example.com', 'password')
+    UserAddress.objects.create(user=user, address='Road 1', city='Dhaka', state='Dhaka',
+                               country='Bangladesh', zip_code='1000')
+    return UserBankAccount.objects.create(user=user, account_type='Savings', account_number=account_number,
+                                          gender='Male', balance=balance)
+
+
+class TransactionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001', balance=10000)
+        cls.other = create_account('bob', '90002')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.account.user)
+        prime(User.objects.get(pk=self.account.user_id))
+
+    def test_form_pages(self):
+        for name in ['deposit_money', 'withdraw_money', 'transfer_money', 'loan_request', 'bulk_transfer']:
+            with self.subTest(name=name):
+                self.assertQueryBudget(2, 'get', reverse(name))
+
+    def test_report(self):
+        for _ in range(5):
+            ledger.deposit(self.account, 100)
+        self.assertQueryBudget(3, 'get', reverse('transaction_report'))
+
+    def test_statement_export(self):
+        response = self.assertQueryBudget(2, 'get', reverse('statement_export'))
+        b''.join(response.streaming_content)
+
+    def test_loan_list(self):
+        ledger.request_loan(self.account, 100)
+        self.assertQueryBudget(3, 'get', reverse('loan_list'))
+
+    # Every posting reads its accounts' journal heads, inserts the entries
+    # and moves the heads: three queries however many accounts it touches.
+    def test_deposit(self):
+        self.assertQueryBudget(14, 'post', reverse('deposit_money'), {'amount': '500'})
+
+    def test_withdraw(self):
+        self.assertQueryBudget(14, 'post', reverse('withdraw_money'), {'amount': '500'})
+
+    def test_transfer(self):
+        self.assertQueryBudget(19, 'post', reverse('transfer_money'),
+                               {'amount': '500', 'to_account_number': self.other.account_number})
+
+    def test_bulk_transfer(self):
+        upload = SimpleUploadedFile('payroll.csv', b'90002,10\n90002,5\n')
+        # Plus the row lock, where the backend has one.
+        budget = 17 + connection.features.has_select_for_update
+        self.assertQueryBudget(budget, 'post', reverse('bulk_transfer'), {'transfer_file': upload})
+
+    def test_loan_request(self):
+        # The loan row and the account's loans_updated_at are written in
+        # one transaction; the loan limit comes from the cached account.
+        self.assertQueryBudget(7, 'post', reverse('loan_request'), {'amount': '500'})
+
+    def test_loan_repayment(self):
+        loan = ledger.request_loan(self.account, 100)
+        ledger.approve_loan(loan)
+        self.assertQueryBudget(14, 'get', reverse('pay', args=[loan.pk]))
+
+    def test_analytics(self):
+        ledger.transfer(self.account, self.other, 100)
+        self.assertQueryBudget(7, 'get', reverse('analytics'))
+
+    def test_async_pages(self):
+        ledger.request_loan(self.account, 100)
+        for name in ['async_transaction_report', 'async_loan_list']:
+            with self.subTest(name=name):
+                self.assertQueryBudget(4, 'get', reverse(name))
+
+    def test_async_postings(self):
+        self.assertQueryBudget(15, 'post', reverse('async_deposit_money'), {'amount': '500'})
+        self.assertQueryBudget(15, 'post', reverse('async_withdraw_money'), {'amount': '500'})
+        self.assertQueryBudget(20, 'post', reverse('async_transfer_money'),
+                               {'amount': '500', 'to_account_number': self.other.account_number})
+
+    def test_api(self):
+        self.client.logout()
+        auth = {'HTTP_AUTHORIZATION': f'Token {create_token(self.account.user)}',
+                'content_type': 'application/json'}
+        self.assertQueryBudget(2, 'get', reverse('api_balance'), **auth)
+        self.assertQueryBudget(2, 'get', reverse('api_history'), **auth)
+        self.assertQueryBudget(14, 'post', reverse('api_deposit'), json.dumps({'amount': '100'}), **auth)
+        self.assertQueryBudget(11, 'post', reverse('api_withdraw'), json.dumps({'amount': '100'}), **auth)
+        self.assertQueryBudget(18, 'post', reverse('api_transfer'),
+                               json.dumps({'amount': '100', 'to_account_number': self.other.account_number}),
+                               **auth)
+        self.assertQueryBudget(6, 'post', reverse('api_loans'), json.dumps({'amount': '100'}), **auth)
+
+
+class TransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001', balance=10000)
+        cls.other = create_account('bob', '90002')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.account.user)
+        prime(User.objects.get(pk=self.account.user_id))
+
+    def test_transfer_query_count(self):
+        # Today's daily summaries already exist, as they do after the first
+        # posting of the day, and the payer's account is cached. The
+        # recipient is looked up once, in the form: session, user and
+        # recipient reads, then the savepoint, two balance updates and
+        # re-reads, two transaction rows, the daily summary update, the
+        # journal heads read, entries insert and heads update, the release
+        # and two queued emails.
+        ledger.deposit(self.account, 100)
+        ledger.deposit(self.other, 100)
+        with self.assertNumQueries(17):
+            response = self.client.post(reverse('transfer_money'),
+                                        {'amount': '500', 'to_account_number': self.other.account_number})
+        self.assertRedirects(response, reverse('transaction_report'))
+
+    def test_transfer_moves_money(self):
+        self.client.post(reverse('transfer_money'), {'amount': '500', 'to_account_number': self.other.account_number})
+        self.account.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.account.balance, 9500)
+        self.assertEqual(self.other.balance, 500)
+        sent = Transaction.objects.get(account=self.account)
+        self.assertEqual(sent.balance_after_transaction, 9500)
+        self.assertEqual(sent.to_account, self.other)
+
+    def test_unknown_recipient(self):
+        response = self.client.post(reverse('transfer_money'), {'amount': '500', 'to_account_number': '404'})
+        self.assertFormError(response.context['form'], 'to_account_number', 'Invalid account number')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_bad_check_digit_is_rejected_without_lookup(self):
+        number = format_account_number(123456789)
+        typo = number[:-1] + str((int(number[-1]) + 1) % 10)
+        form = TransferForm({'amount': '500', 'to_account_number': typo},
+                            account=self.account, from_account=self.account)
+        with self.assertNumQueries(0):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['to_account_number'], ['Invalid account number'])
+
+
+class LedgerConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.account = create_account('alice', '90001')
+        self.other = create_account('bob', '90002')
+        ledger.deposit(self.account, Decimal('100'))
+        ledger.deposit(self.other, Decimal('100'))
+
+    def run_concurrently(self, *calls):
+        """Start ``calls`` together, each in its own thread and connection; return what each returned or raised."""
+        barrier = threading.Barrier(len(calls))
+        results = [None] * len(calls)
+
+        def run(index, call):
+            try:
+                barrier.wait()
+                results[index] = call()
+            except Exception as exc:
+                results[index] = exc
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=item) for item in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def fresh(self, account):
+        return UserBankAccount.objects.get(pk=account.pk)
+
+    def test_concurrent_withdrawals_cannot_overdraw(self):
+        # Every thread reads 100 before any of them withdraws.
+        accounts = [self.fresh(self.account) for _ in range(6)]
+        results = self.run_concurrently(*[lambda account=account: ledger.withdraw(account, Decimal('30'))
+                                          for account in accounts])
+        refused = [result for result in results if isinstance(result, ledger.InsufficientFunds)]
+        self.assertEqual(len(refused), 3, results)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 10)
+        self.assertEqual(Transaction.objects.filter(account=self.account, transaction_type=WITHDRAWAL).count(), 3)
+        self.assertEqual(verify(), [])
+
+    def test_insufficient_funds_rolls_back_the_transfer(self):
+        # The payer has the higher id, so the recipient is credited before
+        # the debit fails and the credit must be undone.
+        payer, payee = self.other, self.account
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.transfer(payer, payee, Decimal('500'))
+        self.assertEqual(self.fresh(payee).balance, 100)
+        self.assertEqual(self.fresh(payer).balance, 100)
+        self.assertFalse(Transaction.objects.filter(transaction_type__in=[TRANSFER, RECEIVE]).exists())
+        self.assertEqual(JournalEntry.objects.count(), 2)
+        self.assertEqual(verify(), [])
+
+    def test_opposite_transfers_all_complete(self):
+        calls = []
+        for _ in range(4):
+            calls.append(lambda: ledger.transfer(self.fresh(self.account), self.fresh(self.other), Decimal('10')))
+            calls.append(lambda: ledger.transfer(self.fresh(self.other), self.fresh(self.account), Decimal('5')))
+        results = self.run_concurrently(*calls)
+        self.assertFalse([result for result in results if isinstance(result, Exception)], results)
+        self.assertEqual(self.fresh(self.account).balance, 80)
+        self.assertEqual(self.fresh(self.other).balance, 120)
+        self.assertEqual(verify(), [])
+
+    def test_bulk_and_single_transfers_all_complete(self):
+        payee = create_account('carol', '90003')
+        calls = [
+            lambda: ledger.bulk_transfer(self.fresh(self.other), [('90001', Decimal('5')), ('90003', Decimal('5'))]),
+            lambda: ledger.transfer(self.fresh(self.account), self.fresh(self.other), Decimal('10')),
+        ] * 3
+        results = self.run_concurrently(*calls)
+        self.assertFalse([result for result in results if isinstance(result, Exception)], results)
+        self.assertEqual(
+            [self.fresh(account).balance for account in (self.account, self.other, payee)], [85, 100, 15]
+        )
+        self.assertEqual(verify(), [])
+
+    def test_loan_is_repaid_once(self):
+        loan = ledger.approve_loan(ledger.request_loan(self.account, Decimal('50')))
+        results = self.run_concurrently(
+            lambda: ledger.repay_loan(Transaction.objects.select_related('account').get(pk=loan.pk)),
+            lambda: ledger.repay_loan(Transaction.objects.select_related('account').get(pk=loan.pk)),
+        )
+        self.assertEqual(sum(isinstance(result, ledger.LoanNotPayable) for result in results), 1, results)
+        account = self.fresh(self.account)
+        self.assertEqual(account.balance, 100)
+        self.assertEqual((account.active_loan_count, account.outstanding_loan_principal), (0, 0))
+        with self.assertRaises(ledger.LoanNotPayable):
+            ledger.repay_loan(Transaction.objects.select_related('account').get(pk=loan.pk))
+
+
+class BulkTransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.payer = create_account('alice', '90001')
+        cls.payee = create_account('bob', '90002')
+        ledger.deposit(cls.payer, 100)
+
+    def parse(self, text, filename='payroll.csv'):
+        return parse_transfer_file(StringIO(text), filename)
+
+    def test_parse_accepts_whole_cents(self):
+        self.assertEqual(self.parse('account_number,amount\n90002,10.50\n90002,3\n'),
+                         [('90002', Decimal('10.50')), ('90002', Decimal('3'))])
+
+    def test_parse_rejects_amounts_a_row_cannot_hold(self):
+        for amount in ['0.005', 'NaN', 'Infinity', '-Infinity', '0', '-5', 'abc', '10000000000.00']:
+            with self.subTest(amount=amount), self.assertRaisesMessage(ValueError, 'Line 2:'):
+                self.parse(f'90002,10\n90002,{amount}\n')
+        with self.assertRaisesMessage(ValueError, 'Line 1:'):
+            self.parse('[["90002", "NaN"]]', 'payroll.json')
+
+    def test_bulk_transfer_rejects_sub_cent_amounts_before_posting(self):
+        with self.assertRaisesMessage(ledger.InvalidAmount, 'Line 2:'):
+            ledger.bulk_transfer(self.payer, [('90002', Decimal('0.01')), ('90002', Decimal('0.005'))])
+        with self.assertRaises(ledger.InvalidAmount):
+            ledger.bulk_transfer(self.payer, [('90002', Decimal('NaN'))])
+        self.payer.refresh_from_db()
+        self.assertEqual(self.payer.balance, 100)
+        self.assertFalse(Transaction.objects.filter(transaction_type=TRANSFER).exists())
+
+    def test_paying_yourself_is_rejected_before_posting(self):
+        lines = [('90002', Decimal('10')), ('90001', Decimal('10'))]
+        with self.assertRaisesMessage(ledger.OwnAccount, 'Line 2:'):
+            ledger.bulk_transfer(self.payer, lines)
+        form = BulkTransferForm(files={'transfer_file': SimpleUploadedFile('payroll.csv', b'90002,10\n90001,10\n')},
+                                account=self.payer)
+        self.assertEqual(form.errors['transfer_file'], ['Line 2: you cannot transfer to your own account'])
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fileobj:
+            fileobj.write('90002,10\n90001,10\n')
+        self.addCleanup(os.remove, fileobj.name)
+        with self.assertRaisesMessage(CommandError, 'Line 2:'):
+            call_command('bulk_transfer', '90001', fileobj.name, batch_size=1, stdout=StringIO())
+        self.assertFalse(Transaction.objects.filter(transaction_type=TRANSFER).exists())
+
+    def test_bulk_transfer_keeps_rows_and_journal_in_step(self):
+        ledger.bulk_transfer(self.payer, [('90002', Decimal('0.01')), ('90002', Decimal('0.01'))])
+        self.payer.refresh_from_db()
+        self.assertEqual(self.payer.balance, Decimal('99.98'))
+        self.assertEqual(verify(), [])
+
+
+class BenchTransactionQueriesTests(TestCase):
+    def test_refuses_the_default_database(self):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'BENCH_DATABASE_URL'):
+            call_command('bench_transaction_queries', stdout=out)
+        self.assertIn('Target database: default', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='qbench_').exists())
+
+
+class LoanExposureTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001', balance=1000)
+
+    def assertExposure(self, count, principal):
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.active_loan_count, count)
+        self.assertEqual(self.account.outstanding_loan_principal, principal)
+        self.assertIsNotNone(self.account.loans_updated_at)
+
+    def test_loan_lifecycle(self):
+        loan = ledger.request_loan(self.account, 300)
+        self.assertExposure(0, 0)
+        ledger.approve_loan(loan)
+        self.assertExposure(1, 300)
+        self.assertEqual(self.account.balance, 1300)
+        with self.assertRaises(ledger.LoanNotPending):
+            ledger.approve_loan(loan)
+        ledger.repay_loan(loan)
+        self.assertExposure(0, 0)
+        self.assertEqual(self.account.balance, 1000)
+
+    def test_reconcile_fixes_drift(self):
+        ledger.approve_loan(ledger.request_loan(self.account, 300))
+        UserBankAccount.objects.filter(pk=self.account.pk).update(active_loan_count=5, outstanding_loan_principal=0)
+        call_command('reconcile_loan_exposure', stdout=StringIO())
+        self.assertExposure(1, 300)
+
+
+class AdminLoanActionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = create_account('alice', '90001', balance=1000)
+        cls.bob = create_account('bob', '90002')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:transactions_transaction_changelist')
+
+    def run_action(self, action, loans):
+        return self.client.post(self.url, {
+            'action': action,
+            '_selected_action': [loan.pk for loan in loans],
+        })
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for n in range(5):
+            ledger.request_loan(self.alice, 100 + n)
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+        for n in range(5):
+            ledger.request_loan(self.bob, 100 + n)
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+
+    def test_approve_selected_loans(self):
+        loans = [ledger.request_loan(self.alice, 100), ledger.request_loan(self.alice, 200),
+                 ledger.request_loan(self.bob, 300)]
+        ledger.approve_loan(loans[0])
+        self.run_action('approve_loans', loans)
+
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual((self.alice.balance, self.alice.active_loan_count), (1300, 2))
+        self.assertEqual((self.bob.balance, self.bob.outstanding_loan_principal), (300, 300))
+        self.assertEqual(Transaction.objects.get(pk=loans[1].pk).balance_after_transaction, 1300)
+        self.assertEqual(self.alice.daily_balances.get().credits, 300)
+        self.assertEqual(OutboundEmail.objects.filter(subject='Transaction Alert').count(), 2)
+
+    def test_reject_selected_loans(self):
+        loan = ledger.request_loan(self.alice, 100)
+        self.run_action('reject_loans', [loan])
+
+        loan.refresh_from_db()
+        self.assertEqual(loan.transaction_type, LOAN_REJECTED)
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.balance, self.alice.active_loan_count), (1000, 0))
+        self.assertEqual(OutboundEmail.objects.filter(subject='Loan Request Rejected').count(), 1)
+
+    def test_saving_a_row_again_moves_no_money(self):
+        deposit = ledger.deposit(self.alice, 500)
+        url = reverse('admin:transactions_transaction_change', args=[deposit.pk])
+        self.assertEqual(self.client.post(url, {'amount': '900'}).status_code, 302)
+        deposit.refresh_from_db()
+        self.alice.refresh_from_db()
+        self.assertEqual((deposit.amount, self.alice.balance, self.alice.journal_sequence), (500, 1500, 1))
+
+    def test_adding_a_pending_loan_credits_nothing(self):
+        self.client.post(reverse('admin:transactions_transaction_add'), {
+            'account': self.alice.pk, 'amount': '300', 'transaction_type': LOAN,
+            'balance_after_transaction': '0',
+        })
+        loan = Transaction.objects.get(transaction_type=LOAN)
+        self.alice.refresh_from_db()
+        self.assertEqual((loan.loan_approved, loan.balance_after_transaction), (False, 1000))
+        self.assertEqual((self.alice.balance, self.alice.active_loan_count), (1000, 0))
+
+        url = reverse('admin:transactions_transaction_change', args=[loan.pk])
+        self.client.post(url, {'loan_approved': 'on'})
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.balance, self.alice.active_loan_count), (1300, 1))
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001')
+        for _ in range(7):
+            ledger.deposit(cls.account, 10)
+        # Four postings share a timestamp, so pages must break ties on id.
+        ids = list(Transaction.objects.order_by('pk').values_list('pk', flat=True))
+        Transaction.objects.filter(pk__in=ids[1:5]).update(timestamp=timezone.now())
+        cls.ids = list(Transaction.objects.order_by('timestamp', 'pk').values_list('pk', flat=True))
+
+    def pages(self):
+        return KeysetPaginator(Transaction.objects.filter(account=self.account), 3)
+
+    def assertPage(self, page, ids, has_previous, has_next):
+        self.assertEqual([row.pk for row in page], ids)
+        self.assertEqual((page.has_previous(), page.has_next()), (has_previous, has_next))
+
+    def test_next_then_previous_walks_back_over_the_same_pages(self):
+        paginator = self.pages()
+        first = paginator.page()
+        self.assertPage(first, self.ids[:3], False, True)
+        self.assertIsNone(first.previous_cursor)
+        second = paginator.page(first.next_cursor)
+        self.assertPage(second, self.ids[3:6], True, True)
+        last = paginator.page(second.next_cursor)
+        self.assertPage(last, self.ids[6:], True, False)
+        self.assertIsNone(last.next_cursor)
+
+        back = paginator.page(last.previous_cursor)
+        self.assertPage(back, self.ids[3:6], True, True)
+        start = paginator.page(back.previous_cursor)
+        self.assertPage(start, self.ids[:3], False, True)
+        self.assertEqual(paginator.page(start.next_cursor).object_list, back.object_list)
+
+    def test_bad_cursor_starts_over(self):
+        self.assertPage(self.pages().page('not-a-cursor'), self.ids[:3], False, True)
+
+    @mock.patch.object(TransactionReportView, 'paginate_by', 3)
+    def test_report_follows_the_previous_link(self):
+        self.client.force_login(self.account.user)
+        second = self.client.get(reverse('transaction_report'), {'cursor': self.pages().page().next_cursor})
+        previous = second.context['page_obj'].previous_cursor
+        self.assertContains(second, f'?cursor={previous}')
+        first = self.client.get(reverse('transaction_report'), {'cursor': previous})
+        self.assertEqual([row.pk for row in first.context['object_list']], self.ids[:3])
+
+
+class StatementExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001')
+        cls.other = create_account('bob', '90002')
+        cls.old = ledger.deposit(cls.account, 100)
+        Transaction.objects.filter(pk=cls.old.pk).update(timestamp=timezone.now() - timedelta(days=10))
+        cls.sent, _ = ledger.transfer(cls.account, cls.other, 30)
+        cls.withdrawal = ledger.withdraw(cls.account, 20)
+
+    def setUp(self):
+        self.client.force_login(self.account.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('statement_export'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_lists_the_account_history(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('statement-90001.csv', response['Content-Disposition'])
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0], ['id', 'timestamp', 'type', 'amount', 'balance_after', 'counterparty'])
+        self.assertEqual([row[:1] + row[2:] for row in rows[1:]], [
+            [str(self.old.pk), 'Deposit', '100.00', '100.00', ''],
+            [str(self.sent.pk), 'Transfer', '30.00', '70.00', '90002'],
+            [str(self.withdrawal.pk), 'Withdrawal', '20.00', '50.00', ''],
+        ])
+
+    def test_ndjson_with_date_filter(self):
+        today = timezone.localdate()
+        response, content = self.export(format='ndjson', start_date=str(today - timedelta(days=1)),
+                                        end_date=str(today))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.sent.pk, self.withdrawal.pk])
+        self.assertEqual(rows[0]['counterparty'], '90002')
+
+    def test_bad_format_and_dates_are_refused(self):
+        self.assertEqual(self.client.get(reverse('statement_export'), {'format': 'xml'}).status_code, 400)
+        response = self.client.get(reverse('statement_export'), {'start_date': '2024-13-01', 'end_date': '2024-12-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportStatementsCommandTests(TransactionTestCase):
+    def test_writes_one_filtered_file_per_account(self):
+        account = create_account('alice', '90001')
+        other = create_account('bob', '90002')
+        old = ledger.deposit(account, 100)
+        Transaction.objects.filter(pk=old.pk).update(timestamp=timezone.now() - timedelta(days=10))
+        ledger.transfer(account, other, 30)
+        start = str(timezone.localdate() - timedelta(days=1))
+        with tempfile.TemporaryDirectory() as out_dir:
+            call_command('export_statements', out_dir, start_date=start, workers=2, stdout=StringIO())
+            with open(os.path.join(out_dir, '90001.csv')) as fileobj:
+                rows = list(csv.reader(fileobj))
+            with open(os.path.join(out_dir, '90002.csv')) as fileobj:
+                received = list(csv.reader(fileobj))
+        self.assertEqual([row[2:] for row in rows[1:]], [['Transfer', '30.00', '70.00', '90002']])
+        self.assertEqual([row[2:] for row in received[1:]], [['Receive', '30.00', '30.00', '90001']])
+
+
+class DailyBalanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001')
+        cls.other = create_account('bob', '90002')
+        cls.today = timezone.localdate()
+        # (days ago, posting)
+        postings = [
+            (3, lambda: ledger.deposit(cls.account, 1000)),
+            (2, lambda: ledger.withdraw(cls.account, 200)),
+            (2, lambda: ledger.approve_loan(ledger.request_loan(cls.account, 300))),
+            (1, lambda: ledger.transfer(cls.account, cls.other, 100)[0]),
+            (0, lambda: ledger.deposit(cls.account, 50)),
+        ]
+        for days_ago, post in postings:
+            txn = post()
+            Transaction.objects.filter(pk=txn.pk).update(timestamp=cls.at(days_ago, hour=12))
+        call_command('rebuild_daily_balances', stdout=StringIO())
+
+    @classmethod
+    def at(cls, days_ago, hour=0):
+        return day_start(cls.today - timedelta(days=days_ago)) + timedelta(hours=hour)
+
+    def test_rebuild_chains_opening_balances(self):
+        days = DailyBalance.objects.filter(account=self.account).order_by('date')
+        self.assertEqual(
+            [(day.date, day.opening_balance, day.credits, day.debits, day.transaction_count) for day in days],
+            [
+                (self.today - timedelta(days=3), 0, 1000, 0, 1),
+                (self.today - timedelta(days=2), 1000, 300, 200, 2),
+                (self.today - timedelta(days=1), 1100, 0, 100, 1),
+                (self.today, 1000, 50, 0, 1),
+            ],
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(days.last().closing_balance, self.account.balance)
+
+    def test_whole_days_come_from_the_summaries(self):
+        with self.assertNumQueries(1):
+            summary = period_summary(self.account, self.at(2), self.at(0))
+        self.assertEqual(summary, {'credits': 300, 'debits': 300, 'net': 0, 'count': 3})
+
+    def test_partial_days_are_read_from_transactions(self):
+        start, end = self.at(3, hour=6), self.at(0, hour=18)
+        summary = period_summary(self.account, start, end)
+        self.assertEqual(summary, {'credits': 1350, 'debits': 300, 'net': 1050, 'count': 5})
+        self.assertEqual(period_summary(self.account, self.at(3, hour=13), end)['credits'], 350)
+        self.assertEqual(async_to_sync(aperiod_summary)(self.account, start, end), summary)
+
+
+class JournalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = create_account('alice', '90001')
+        cls.bob = create_account('bob', '90002')
+
+    def post_some(self):
+        ledger.deposit(self.alice, 500)
+        ledger.transfer(self.alice, self.bob, 200)
+        ledger.transfer(self.alice, self.alice, 50)
+        ledger.withdraw(self.bob, 75)
+        ledger.approve_loans([ledger.request_loan(self.bob, 100).pk])
+
+    def test_postings_chain_and_replay_to_balances(self):
+        self.post_some()
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.journal_sequence, 4)
+        self.assertEqual(list(self.alice.journal_entries.order_by('sequence').values_list('balance', flat=True)),
+                         [500, 300, 250, 300])
+        self.assertEqual(verify(), [])
+
+    def test_tampering_breaks_the_chain(self):
+        self.post_some()
+        JournalEntry.objects.filter(account=self.bob, sequence=1).update(amount=300, balance=300)
+        drift, = verify()
+        self.assertEqual((drift.account_id, drift.problem), (self.bob.pk, 'entry 1 hash mismatch'))
+
+    def test_replay_rebuilds_drifted_balances(self):
+        self.post_some()
+        UserBankAccount.objects.filter(pk=self.alice.pk).update(balance=1)
+        with self.assertRaises(CommandError):
+            call_command('verify_journal', workers=1, stdout=StringIO())
+        call_command('replay_journal', stdout=StringIO())
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, 300)
+        call_command('verify_journal', workers=1, stdout=StringIO())
+
+    def test_journaled_transactions_cannot_be_deleted(self):
+        self.post_some()
+        with self.assertRaises(RestrictedError):
+            Transaction.objects.filter(account=self.bob, transaction_type=WITHDRAWAL).delete()
+        # Alice's transfer would take Bob's receiving row with it.
+        with self.assertRaises(RestrictedError):
+            self.alice.user.delete()
+        self.assertEqual(verify(), [])
+        User.objects.filter(pk__in=[self.alice.user_id, self.bob.user_id]).delete()
+        self.assertFalse(JournalEntry.objects.exists())
+
+
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001', balance=1000)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.account.user)
+
+    def test_form_carries_a_key(self):
+        response = self.client.get(reverse('deposit_money'))
+        self.assertContains(response, 'name="idempotency_key"')
+
+    def test_retry_replays_without_posting_again(self):
+        data = {'amount': '100', 'idempotency_key': 'retry-1'}
+        first = self.client.post(reverse('deposit_money'), data)
+        # The result comes from the cache: only the session and user are read.
+        with self.assertNumQueries(2):
+            second = self.client.post(reverse('deposit_money'), data)
+        self.assertEqual((second.status_code, second['Location']), (first.status_code, first['Location']))
+        cache.clear()
+        self.client.post(reverse('deposit_money'), data)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 1100)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_key_is_released_when_the_form_is_invalid(self):
+        data = {'amount': '5000', 'idempotency_key': 'retry-2'}
+        self.assertEqual(self.client.post(reverse('withdraw_money'), data).status_code, 200)
+        data['amount'] = '500'
+        self.client.post(reverse('withdraw_money'), data)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 500)
+
+    def test_key_of_another_kind_of_request_is_refused(self):
+        self.client.post(reverse('deposit_money'), {'amount': '100'}, HTTP_IDEMPOTENCY_KEY='retry-3')
+        self.client.post(reverse('withdraw_money'), {'amount': '100'}, HTTP_IDEMPOTENCY_KEY='retry-3')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 1100)
+
+    def test_async_views_replay_retries(self):
+        response = self.client.get(reverse('async_deposit_money'))
+        self.assertContains(response, 'name="idempotency_key"')
+        data = {'amount': '100', 'idempotency_key': 'retry-5'}
+        first = self.client.post(reverse('async_deposit_money'), data)
+        second = self.client.post(reverse('async_deposit_money'), data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second['Location'], first['Location'])
+        # The sync view shares the scope, so a retry sent there replays too.
+        self.assertEqual(self.client.post(reverse('deposit_money'), data)['Idempotent-Replayed'], 'true')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 1100)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_async_key_is_released_when_the_form_is_invalid(self):
+        data = {'amount': '5000', 'idempotency_key': 'retry-6'}
+        self.assertEqual(self.client.post(reverse('async_withdraw_money'), data).status_code, 200)
+        data['amount'] = '500'
+        self.client.post(reverse('async_withdraw_money'), data)
+        self.client.post(reverse('async_withdraw_money'), data)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 500)
+
+    def test_purge_deletes_expired_keys(self):
+        self.client.post(reverse('deposit_money'), {'amount': '100', 'idempotency_key': 'retry-4'})
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001')
+        cls.other = create_account('bob', '90002')
+        ledger.deposit(cls.account, 1000)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.account.user)
+
+    def balance(self, account):
+        return UserBankAccount.objects.get(pk=account.pk).balance
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('async_transaction_report'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('async_transaction_report')}",
+                             fetch_redirect_response=False)
+
+    def test_report_and_period_summary(self):
+        ledger.withdraw(self.account, 100)
+        response = self.client.get(reverse('async_transaction_report'))
+        self.assertEqual([row.transaction_type for row in response.context['object_list']], [DEPOSIT, WITHDRAWAL])
+        today = str(timezone.localdate())
+        response = self.client.get(reverse('async_transaction_report'), {'start_date': today, 'end_date': today})
+        self.assertEqual(response.context['period'], {'credits': 1000, 'debits': 100, 'net': 900, 'count': 2})
+
+    def test_loan_list(self):
+        loan = ledger.approve_loan(ledger.request_loan(self.account, 300))
+        response = self.client.get(reverse('async_loan_list'))
+        self.assertEqual([row.pk for row in response.context['loans']], [loan.pk])
+
+    def test_deposit_and_withdraw(self):
+        response = self.client.post(reverse('async_deposit_money'), {'amount': '500'})
+        self.assertRedirects(response, reverse('async_transaction_report'), fetch_redirect_response=False)
+        response = self.client.post(reverse('async_withdraw_money'), {'amount': '5000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+        self.client.post(reverse('async_withdraw_money'), {'amount': '200'})
+        self.assertEqual(self.balance(self.account), 1300)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+    def test_transfer(self):
+        response = self.client.post(reverse('async_transfer_money'),
+                                    {'amount': '250', 'to_account_number': self.other.account_number})
+        self.assertRedirects(response, reverse('async_transaction_report'), fetch_redirect_response=False)
+        self.assertEqual((self.balance(self.account), self.balance(self.other)), (750, 250))
+        self.assertEqual(sorted(OutboundEmail.objects.values_list('to', flat=True)),
+                         ['alice@example.com', 'bob@example.com'])
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001', balance=1000)
+        cls.other = create_account('bob', '90002')
+        cls.key = create_token(cls.account.user)
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {self.key}'}
+
+    def post_json(self, name, data, **extra):
+        return self.client.post(reverse(name), json.dumps(data), content_type='application/json',
+                                **self.auth, **extra)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get(reverse('api_balance')).status_code, 401)
+        response = self.client.get(reverse('api_balance'), HTTP_AUTHORIZATION='Token wrong')
+        self.assertEqual(response.status_code, 401)
+
+    def test_unchanged_balance_is_not_modified(self):
+        response = self.client.get(reverse('api_balance'), **self.auth)
+        self.assertEqual(response.json(), {'account_number': '90001', 'balance': '1000.00'})
+        # The token lookup; the account comes from the cache.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api_balance'), HTTP_IF_NONE_MATCH=response['ETag'], **self.auth)
+        self.assertEqual(response.status_code, 304)
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_json('api_deposit', {'amount': '100'})
+        response = self.client.get(reverse('api_balance'), HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.json()['balance'], '1100.00')
+
+    def test_postings_and_history(self):
+        response = self.post_json('api_transfer', {'amount': '300', 'to_account_number': '90002'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['balance'], '700.00')
+        self.assertEqual(self.post_json('api_withdraw', {'amount': '5000'}).status_code, 400)
+        self.assertEqual(self.post_json('api_loans', {'amount': '200'}).status_code, 202)
+
+        for _ in range(60):
+            ledger.deposit(self.account, 1)
+        page = self.client.get(reverse('api_history'), **self.auth).json()
+        self.assertEqual(page['results'][0]['type'], 'Transfer')
+        self.assertEqual(page['results'][0]['counterparty'], '90002')
+        rest = self.client.get(reverse('api_history'), {'cursor': page['next']}, **self.auth).json()
+        self.assertEqual(len(page['results']) + len(rest['results']), 62)
+        self.assertIsNone(rest['next'])
+
+    def test_idempotency_key_replays_posting(self):
+        first = self.post_json('api_deposit', {'amount': '100'}, HTTP_IDEMPOTENCY_KEY='api-1')
+        second = self.post_json('api_deposit', {'amount': '100'}, HTTP_IDEMPOTENCY_KEY='api-1')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 1100)
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = create_account('alice', '90001')
+        cls.bob = create_account('bob', '90002')
+
+    def post_some(self):
+        ledger.deposit(self.alice, 500)
+        ledger.transfer(self.alice, self.bob, 200)
+        ledger.withdraw(self.bob, 75)
+        loan = ledger.request_loan(self.bob, 100)
+        ledger.approve_loans([loan.pk])
+        loan.refresh_from_db()
+        ledger.repay_loan(loan)
+
+    def totals(self):
+        return (
+            sorted(TypeRollup.objects.values_list('account_id', 'period', 'transaction_type', 'credits', 'debits',
+                                                  'count')),
+            sorted(CounterpartyRollup.objects.values_list('account_id', 'counterparty_id', 'credits', 'debits',
+                                                          'count')),
+        )
+
+    def test_refresh_folds_each_entry_once(self):
+        self.post_some()
+        self.assertEqual(refresh(batch_size=1), 6)
+        ledger.deposit(self.alice, 25)
+        self.assertEqual(refresh(), 1)
+        self.assertEqual(refresh(), 0)
+
+        types, counterparties = self.totals()
+        self.assertIn((self.alice.pk, MONTH, DEPOSIT, 525, 0, 2), types)
+        self.assertIn((self.bob.pk, WEEK, LOAN, 100, 0, 1), types)
+        self.assertIn((self.bob.pk, WEEK, LOAN_PAID, 0, 100, 1), types)
+        self.assertEqual(counterparties, [
+            (self.alice.pk, self.bob.pk, 0, 200, 1),
+            (self.bob.pk, self.alice.pk, 200, 0, 1),
+        ])
+        incremental = self.totals()
+        self.assertEqual(rebuild(), 7)
+        self.assertEqual(self.totals(), incremental)
+
+    def test_late_commits_are_folded_in(self):
+        self.post_some()
+        call_command('refresh_rollups', stdout=StringIO())
+        ledger.withdraw(self.bob, 25)
+        # As if the posting sat in a long transaction: an id below every
+        # folded entry and an hour-old timestamp.
+        JournalEntry.objects.filter(account=self.bob, sequence=5).update(
+            id=-1, created_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(refresh(), 1)
+        self.assertEqual(TypeRollup.objects.get(account=self.bob, period=MONTH, transaction_type=WITHDRAWAL).count, 2)
+
+    def test_analytics_page(self):
+        self.post_some()
+        refresh()
+        self.client.force_login(self.bob.user)
+        prime(self.bob.user, kinds=('account',))
+        response = self.client.get(reverse('analytics'))
+        self.assertContains(response, '90001')
+        self.assertContains(response, 'Loan Paid')
+
+
+class EndOfDayTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.saver = create_account('alice', '90001')
+        cls.current = create_account('bob', '90002')
+        cls.current.account_type = 'Current'
+        cls.current.save()
+        cls.others = [create_account(f'saver{n}', f'9100{n}') for n in range(4)]
+        for account in [cls.saver, cls.current]:
+            ledger.deposit(account, 36500)
+        for account in cls.others:
+            ledger.deposit(account, 3650)
+
+    def test_pays_savings_interest_once_a_day(self):
+        call_command('end_of_day', workers=1, rate=Decimal('0.1'), stdout=StringIO())
+        self.saver.refresh_from_db()
+        self.current.refresh_from_db()
+        self.assertEqual((self.saver.balance, self.current.balance), (36510, 36500))
+        self.assertEqual(Transaction.objects.filter(transaction_type=INTEREST).count(), 5)
+        self.assertEqual(verify(), [])
+
+        call_command('end_of_day', workers=1, rate=Decimal('0.1'), stdout=StringIO())
+        self.assertEqual(Transaction.objects.filter(transaction_type=INTEREST).count(), 5)
+
+    def test_resumes_an_interrupted_run(self):
+        run = start_run(3, Decimal('0.1'))
+        first = run.partitions.order_by('first_id').first()
+        run_partition((first.pk, '', 'csv', 1))
+        call_command('end_of_day', workers=1, chunk_size=2, stdout=StringIO())
+        self.assertEqual(
+            sorted(Transaction.objects.filter(transaction_type=INTEREST).values_list('account_id', 'amount')),
+            sorted([(self.saver.pk, 10)] + [(other.pk, 1) for other in self.others]),
+        )
+        self.assertEqual(run.partitions.aggregate(total=Sum('accounts'))['total'], 5)
+
+    def test_writes_the_days_statements(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            call_command('end_of_day', workers=1, statements_dir=out_dir, stdout=StringIO())
+            day_dir = os.path.join(out_dir, timezone.localdate().isoformat())
+            self.assertEqual(len(os.listdir(day_dir)), 6)
+            with open(os.path.join(day_dir, '90002.csv')) as fileobj:
+                self.assertIn('Deposit', fileobj.read())
+
+
+class RiskRuleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account('alice', '90001', balance=10000)
+        cls.other = create_account('bob', '90002')
+
+    def setUp(self):
+        cache.clear()
+        rules_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(rules_dir.cleanup)
+        self.rules_file = os.path.join(rules_dir.name, 'rules.json')
+        self.write_rules([
+            {'name': 'transfer_burst', 'types': ['transfer'], 'window': 600, 'limit': 2,
+             'message': 'Too many transfers'},
+            {'name': 'daily_withdrawals', 'types': ['withdrawal'], 'metric': 'amount', 'window': 86400,
+             'limit': '1000'},
+        ])
+        settings = self.settings(RISK_RULES_FILE=self.rules_file)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write_rules(self, rules, mtime=None):
+        with open(self.rules_file, 'w') as fileobj:
+            json.dump(rules, fileobj)
+        if mtime is not None:
+            os.utime(self.rules_file, ns=(mtime, mtime))
+
+    def transfer_form(self, amount):
+        return TransferForm({'amount': amount, 'to_account_number': '90002'}, account=self.account,
+                            from_account=self.account, initial={'transaction_type': TRANSFER})
+
+    def test_transfers_over_the_window_limit_are_refused(self):
+        for _ in range(2):
+            self.assertTrue(self.transfer_form(100).is_valid())
+            with self.captureOnCommitCallbacks(execute=True):
+                ledger.transfer(self.account, self.other, 100)
+        form = self.transfer_form(100)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), ['Too many transfers'])
+
+    def test_withdrawn_amount_counts_towards_the_daily_limit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.withdraw(self.account, 600)
+        data = {'amount': 300, 'transaction_type': WITHDRAWAL}
+        self.assertTrue(WithdrawForm(data, account=self.account).is_valid())
+        self.assertFalse(WithdrawForm({**data, 'amount': 500}, account=self.account).is_valid())
+
+    def test_rules_reload_when_the_file_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.withdraw(self.account, 900)
+        self.assertIsNotNone(risk.evaluate(self.account.pk, WITHDRAWAL, 200))
+        self.write_rules([{'types': ['withdrawal'], 'metric': 'amount', 'window': 86400, 'limit': 5000}],
+                         mtime=os.stat(self.rules_file).st_mtime_ns + 10 ** 9)
+        self.assertIsNone(risk.evaluate(self.account.pk, WITHDRAWAL, 200))
+        # A broken file keeps the rules that were loaded last.
+        with open(self.rules_file, 'w') as fileobj:
+            fileobj.write('[{"types": ')
+        os.utime(self.rules_file, ns=(1, 1))
+        with self.assertLogs('amar_bank.risk', 'ERROR'):
+            self.assertEqual(len(risk.current_rules()), 1)
@@ -1,16 +1,37 @@
 
 from django.urls import include, path
 
-from .views import (DepositView, LoanListView, LoanPaidView, LoanRequestsView,
-                    TransactionReportView, TransferView, WithdrawView)
+from .api import (BalanceApiView, DepositApiView, HistoryApiView,
+                  LoansApiView, TransferApiView, WithdrawApiView)
+from .async_views import (AsyncDepositView, AsyncLoanListView,
+                          AsyncTransactionReportView, AsyncTransferView,
+                          AsyncWithdrawView)
+from .views import (AnalyticsView, BulkTransferView, DepositView,
+                    LoanListView, LoanPaidView, LoanRequestsView,
+                    StatementExportView, TransactionReportView, TransferView,
+                    WithdrawView)
 
 urlpatterns = [
     path('deposit/',DepositView.as_view(),name='deposit_money'),
     path("report/", TransactionReportView.as_view(), name="transaction_report"),
+    path("report/export/", StatementExportView.as_view(), name="statement_export"),
+    path("analytics/", AnalyticsView.as_view(), name="analytics"),
     path("withdraw/", WithdrawView.as_view(), name="withdraw_money"),
     path("loan_request/", LoanRequestsView.as_view(), name="loan_request"),
     path("loans/", LoanListView.as_view(), name="loan_list"),
     path("loans/<int:loan_id>/", LoanPaidView.as_view(), name="pay"),
     path("transfer/", TransferView.as_view(), name="transfer_money"),
+    path("transfer/bulk/", BulkTransferView.as_view(), name="bulk_transfer"),
+    path("async/deposit/", AsyncDepositView.as_view(), name="async_deposit_money"),
+    path("async/withdraw/", AsyncWithdrawView.as_view(), name="async_withdraw_money"),
+    path("async/transfer/", AsyncTransferView.as_view(), name="async_transfer_money"),
+    path("async/report/", AsyncTransactionReportView.as_view(), name="async_transaction_report"),
+    path("async/loans/", AsyncLoanListView.as_view(), name="async_loan_list"),
+    path("api/balance/", BalanceApiView.as_view(), name="api_balance"),
+    path("api/history/", HistoryApiView.as_view(), name="api_history"),
+    path("api/deposit/", DepositApiView.as_view(), name="api_deposit"),
+    path("api/withdraw/", WithdrawApiView.as_view(), name="api_withdraw"),
+    path("api/transfer/", TransferApiView.as_view(), name="api_transfer"),
+    path("api/loans/", LoansApiView.as_view(), name="api_loans"),
 ]
 
@@ -1,40 +1,37 @@
-from datetime import datetime
-
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.mail import EmailMessage
-from django.db.models import Sum
 from django.db.models.query import QuerySet
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.views import View
-from django.views.generic import CreateView, ListView
+from django.views.generic import CreateView, FormView, ListView, TemplateView
 
-from accounts.models import UserBankAccount
+from core.mail import queue_email
 
-from .constants import DEPOSIT, LOAN, LOAN_PAID, RECEIVE, TRANSFER, WITHDRAWAL
-from .forms import DepositForm, LoanForm, TransferForm, WithdrawForm
+from . import ledger
+from .bulk import run_bulk_transfer
+from .constants import DEPOSIT, LOAN, TRANSFER, WITHDRAWAL
+from .forms import (BulkTransferForm, DepositForm, LoanForm, TransferForm,
+                    WithdrawForm)
+from .idempotency import IdempotentPostMixin
 from .models import Transaction
+from .loans import loan_list
+from .pagination import KeysetPaginator
+from .reports import period_from_request, period_summary
+from .rollups import account_analytics
+from .statements import STATEMENT_FORMATS, statement_lines, statement_rows
 
 
 def send_transaction_email(user,amount,subject,template_name):
-    mail_subject = subject
-    message = render_to_string(template_name, {
+    queue_email(user.email, subject, template_name, {
         'user': user,
         'amount': amount,
     })
-    send_email = EmailMessage(
-        mail_subject,
-        message,
-        to=[user.email]
-    )
-    send_email.content_subtype = 'html'
-    send_email.send()
 
 
 
-class TransactionCreateMixin(LoginRequiredMixin,CreateView):
+class TransactionCreateMixin(LoginRequiredMixin,IdempotentPostMixin,CreateView):
     template_name = 'transactions_form.html'
     model = Transaction
     title = ''
@@ -62,17 +59,13 @@ class DepositView(TransactionCreateMixin):
     
     def form_valid(self, form):
         amount = form.cleaned_data['amount']
-        account = self.request.user.account
-        account.balance += amount
-        account.save(
-            update_fields=['balance']
-        )
+        self.object = ledger.deposit(self.request.user.account, amount)
         messages.success(
             self.request,
             f'{"{:,.2f}".format(float(amount))}$ was deposited to your account successfully'
         )
         send_transaction_email(self.request.user,amount,"Deposit Confirmation",'deposit_email.html')
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
 class WithdrawView(TransactionCreateMixin):
     form_class = WithdrawForm
@@ -84,17 +77,17 @@ class WithdrawView(TransactionCreateMixin):
     
     def form_valid(self, form):
         amount = form.cleaned_data['amount']
-        account = self.request.user.account
-        account.balance -= amount
-        account.save(
-            update_fields=['balance']
-        )
+        try:
+            self.object = ledger.withdraw(self.request.user.account, amount)
+        except ledger.InsufficientFunds:
+            form.add_error('amount', 'Insufficient balance')
+            return self.form_invalid(form)
         messages.success(
             self.request,
             f'{"{:,.2f}".format(float(amount))}$ was withdrawn from your account successfully'
         )
         send_transaction_email(self.request.user,amount,"Withdraw Confirmation",'withdrawal_email.html')
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
 class LoanRequestsView(TransactionCreateMixin):
     form_class = LoanForm
@@ -105,73 +98,104 @@ class LoanRequestsView(TransactionCreateMixin):
         return initial
     def form_valid(self, form):
         amount = form.cleaned_data['amount']
-        current_loan_count = Transaction.objects.filter(account = self.request.user.account,
-            transaction_type=LOAN,
-            loan_approved=True
-        ).count()
-        if current_loan_count > 3:
+        if self.request.user.account.active_loan_count > 3:
             messages.warning(
                 self.request,
                 'You have crossed the limit of 3 loans at a time'
             )
             return self.form_invalid(form)
+        self.object = ledger.request_loan(self.request.user.account, amount)
         messages.success(
             self.request,
             f'{"{:,.2f}".format(float(amount))}$ was deposited to your account successfully'
         )
         send_transaction_email(self.request.user,amount,"Loan Request Confirmation",'loan_email.html')
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
 class TransactionReportView(LoginRequiredMixin,ListView):
     template_name = 'transactions_report.html'
     model = Transaction
     balance = 0.0
+    period = None
+    paginate_by = 50
     
     def get_queryset(self):
         querySet = super().get_queryset().filter(account=self.request.user.account)
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')            
-        if start_date_str and end_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            querySet = querySet.filter(
-                timestamp__date__gte=start_date,timestamp__date__lte=end_date
-            )
-            self.balance = Transaction.objects.filter(timestamp__date__gte=start_date,timestamp__date__lte=end_date).aggregate(Sum('amount'))['amount__sum']
+        start, end = period_from_request(self.request.GET)
+        if start is not None:
+            # A half-open range on the raw column can use the
+            # (account, timestamp) index; timestamp__date cannot.
+            querySet = querySet.filter(timestamp__gte=start, timestamp__lt=end)
+            self.period = period_summary(self.request.user.account, start, end)
+            self.balance = self.period['net']
         else:
             self.balance = self.request.user.account.balance
         
-        return querySet.distinct()
+        return querySet.order_by('timestamp', 'id')
+    
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        filters = self.request.GET.copy()
+        filters.pop('cursor', None)
         context.update({
             'account': self.request.user.account,
+            'period': self.period,
+            'filters': filters.urlencode(),
         })
         return context        
     
+class AnalyticsView(LoginRequiredMixin,TemplateView):
+    template_name = 'analytics.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(account_analytics(self.request.user.account))
+        return context
+
+
+class StatementExportView(LoginRequiredMixin,View):
+    def get(self,request):
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in STATEMENT_FORMATS:
+            return HttpResponseBadRequest('Unsupported format')
+        try:
+            start, end = period_from_request(request.GET)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid date')
+        account = request.user.account
+        response = StreamingHttpResponse(
+            statement_lines(fmt, statement_rows(account.pk, start, end)),
+            content_type=STATEMENT_FORMATS[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="statement-{account.account_number}.{fmt}"'
+        return response
+
 class LoanPaidView(LoginRequiredMixin,View):
     def get(self,request,loan_id):
-        loan = get_object_or_404(Transaction,id=loan_id)
+        loan = get_object_or_404(Transaction,id=loan_id,account=request.user.account)
         if loan.loan_approved:
-            user_account = loan.account
-            if loan.amount <user_account.balance:
-                user_account.balance -= loan.amount
-                loan.balance_after_transaction = user_account.balance
-                user_account.save()
-                loan.loan_approved = True
-                loan.transaction_type = LOAN_PAID
-                loan.save()
-                messages.success(
+            try:
+                ledger.repay_loan(loan)
+            except ledger.InsufficientFunds:
+                messages.warning(
                     request,
-                    f'{"{:,.2f}".format((loan.amount))}$ was paid successfully'
+                    'You do not have enough balance to pay the loan'
                 )
-                return redirect('loan_list')
-            else:
+            except ledger.LoanNotPayable:
                 messages.warning(
                     request,
-                    'You do not have enough balance to pay the loan'
-                )    
+                    'This loan has already been paid'
+                )
+            else:
+                messages.success(
+                    request,
+                    f'{"{:,.2f}".format((loan.amount))}$ was paid successfully'
+                )
         return redirect('loan_list')
     
 class LoanListView(LoginRequiredMixin,ListView):
@@ -180,25 +204,15 @@ class LoanListView(LoginRequiredMixin,ListView):
     context_object_name = 'loans'
     
     def get_queryset(self):
-        user_account = self.request.user.account
-        queryset = Transaction.objects.filter(account = user_account,transaction_type = LOAN)
-        return queryset
+        return loan_list(self.request.user.account)
                 
 
 def transfer_send_email(user,amount,subject,template_name,account_number):
-    mail_subject = subject
-    message = render_to_string(template_name, {
+    queue_email(user.email, subject, template_name, {
         'user': user,
         'amount': amount,
         'account_number':account_number,
     })
-    send_email = EmailMessage(
-        mail_subject,
-        message,
-        to=[user.email]
-    )
-    send_email.content_subtype = 'html'
-    send_email.send()
     
             
 class TransferView(TransactionCreateMixin):
@@ -215,9 +229,10 @@ class TransferView(TransactionCreateMixin):
         return initial
     
     def form_valid(self, form):
-        amount = form.cleaned_data['amount']
-        to_account_number = form.cleaned_data['to_account_number']
-        from_account = self.request.user.account
+        transfer = form.transfer
+        amount = transfer.amount
+        from_account, to_account = transfer.from_account, transfer.to_account
+        to_account_number = to_account.account_number
         
         if from_account.balance < amount:
             messages.warning(
@@ -226,22 +241,14 @@ class TransferView(TransactionCreateMixin):
             )
             return self.form_invalid(form)
         
-        to_account = get_object_or_404(UserBankAccount,account_number=to_account_number)
-        
-        from_account.balance -= amount
-        to_account.balance += amount
-        
-        receiver_transaction = Transaction(
-            account=to_account,
-            to_account=from_account,
-            amount=amount,
-            transaction_type=RECEIVE,
-            balance_after_transaction=to_account.balance,
-        )
-        receiver_transaction.save()
-        
-        from_account.save(update_fields=['balance'])
-        to_account.save(update_fields=['balance'])
+        try:
+            self.object, _ = ledger.transfer(from_account, to_account, amount)
+        except ledger.InsufficientFunds:
+            messages.warning(
+                self.request,
+                'You do not have enough balance to transfer'
+            )
+            return self.form_invalid(form)
         
         messages.success(
             self.request,
@@ -249,7 +256,33 @@ class TransferView(TransactionCreateMixin):
         )
         transfer_send_email(self.request.user,amount,"Transfer Confirmation",'transfer_email.html',to_account_number)
         transfer_send_email(to_account.user,amount,"Transfer Confirmation",'receive_email.html',from_account.account_number)
+        return redirect(self.get_success_url())
+
+
+class BulkTransferView(LoginRequiredMixin,FormView):
+    template_name = 'bulk_transfer.html'
+    form_class = BulkTransferForm
+    success_url = reverse_lazy('transaction_report')
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs.update({'account': self.request.user.account})
+        return kwargs
+
+    def form_valid(self, form):
+        account = self.request.user.account
+        try:
+            # One batch, so an upload is either posted in full or not at all.
+            stats, = run_bulk_transfer(account, form.lines, batch_size=len(form.lines))
+        except ledger.UnknownAccounts as exc:
+            form.add_error('transfer_file', str(exc))
+            return self.form_invalid(form)
+        except ledger.InsufficientFunds:
+            form.add_error('transfer_file', 'You do not have enough balance to transfer')
+            return self.form_invalid(form)
+        messages.success(
+            self.request,
+            f'{"{:,.2f}".format(float(stats["amount"]))}$ was transferred to {stats["size"]} accounts '
+            f'in {stats["seconds"]:.2f}s'
+        )
         return super().form_valid(form)
-        
-         
-                  
\ No newline at end of file